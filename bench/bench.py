@@ -0,0 +1,324 @@
+"""Headless benchmarks for the viewer and lidar hot paths.
+
+pygame, PyOpenGL and imgui are replaced by no-op stubs, so the CPU side of
+PointCloudViewer (startup, load_data, update_simulation, update_heatmap_colors,
+seek, update_graphs, nearest_point) and the lidar pipeline run on any box. Results are printed
+and optionally written as JSON; with --baseline they are compared against
+a stored run and regressions make the exit code non-zero.
+
+    python3 bench/bench.py --sizes 10k,1M --out results.json
+    python3 bench/bench.py --save-baseline           # writes bench/baseline.json
+    python3 bench/bench.py --baseline bench/baseline.json
+    python3 bench/bench.py --recording scans.rbscan  # lidar stages on recorded scans
+"""
+import argparse
+import contextlib
+import gc
+import glob
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIS_DIR = os.path.join(ROOT, "visualization")
+LIDAR_DIR = os.path.join(ROOT, "lidar")
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+DEFAULT_SIZES = "10k,100k,1M"
+TEXT_LOAD_LIMIT = 1_000_000
+GEN_CHUNK = 1_000_000
+LIDAR_SCANS = 200
+SEEKS = 50
+
+
+class _Stub:
+    """Accepts any attribute access or call; stands in for GL/pygame/imgui objects."""
+    def __getattr__(self, name): return _Stub()
+    def __call__(self, *args, **kwargs): return _Stub()
+    def __or__(self, other): return self
+    __ror__ = __or__
+    def __iter__(self): return iter(())
+    def __bool__(self): return False
+
+
+def _gen_buffers(n):
+    return tuple(range(1, n + 1)) if n > 1 else 1
+
+
+def _no_shaders(*args, **kwargs):
+    raise RuntimeError("no GL context in benchmarks")
+
+
+def _stub_module(name, names=(), **attrs):
+    module = types.ModuleType(name)
+    module.__getattr__ = lambda attr: _Stub()
+    for n in names:
+        setattr(module, n, 0 if n.isupper() or n.startswith(("GL_", "K_")) else _Stub())
+    for k, v in attrs.items(): setattr(module, k, v)
+    module.__all__ = list(names) + list(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install_stubs():
+    """Registers stub pygame/OpenGL/imgui modules exporting every name the sources use."""
+    source = ""
+    for path in glob.glob(os.path.join(VIS_DIR, "*.py")) + glob.glob(os.path.join(LIDAR_DIR, "*.py")):
+        with open(path) as f: source += f.read()
+    gl_names = sorted(set(re.findall(r"\b(gl[A-Z]\w*|GL_\w+)\b", source)) - {"glGenBuffers"})
+    glu_names = sorted(set(re.findall(r"\b(glu[A-Z]\w*)\b", source)))
+    # constants the sources define themselves must not be shadowed by the pygame.locals star import
+    defined = set(re.findall(r"^([A-Z][A-Z0-9_]*)\s*=", source, re.M))
+    local_names = sorted(set(re.findall(r"\b(K_\w+|[A-Z][A-Z0-9_]*[A-Z0-9])\b", source)) - set(gl_names) - defined)
+
+    gl = _stub_module("OpenGL.GL", gl_names, glGenBuffers=_gen_buffers)
+    gl.shaders = _stub_module("OpenGL.GL.shaders", compileProgram=_no_shaders, compileShader=_no_shaders)
+    _stub_module("OpenGL", GL=gl, GLU=_stub_module("OpenGL.GLU", glu_names))
+    pygame = _stub_module("pygame", locals=_stub_module("pygame.locals", local_names))
+    pygame.init = pygame.quit = lambda *a, **k: None
+    imgui = _stub_module("imgui")
+    integration = _stub_module("imgui.integrations.pygame", PygameRenderer=_Stub)
+    imgui.integrations = _stub_module("imgui.integrations", pygame=integration)
+
+
+def parse_sizes(text):
+    sizes = []
+    for token in text.split(","):
+        token = token.strip().lower()
+        scale = {"k": 1_000, "m": 1_000_000}.get(token[-1:], 1)
+        sizes.append(int(float(token.rstrip("km")) * scale))
+    return sizes
+
+
+def make_cloud(filename, count, seed=0):
+    """Synthetic room scan written straight into a binary .rbtsof, chunk by chunk."""
+    import numpy as np
+    import rbtsof
+    rng = np.random.default_rng(seed)
+    cols = rbtsof.create_rbtsof(filename, count, has_motors=True)
+    for s in range(0, count, GEN_CHUNK):
+        e = min(s + GEN_CHUNK, count)
+        n = e - s
+        cols["points"][s:e] = rng.uniform((-6.0, 0.0, -4.0), (6.0, 5.0, 4.0), (n, 3))
+        cols["colors"][s:e] = rng.random((n, 3))
+        cols["timestamps"][s:e] = np.linspace(12.0 * s / count, 12.0 * e / count, n, endpoint=False)
+        cols["motor_data"][s:e] = 1500.0 + rng.normal(0.0, 60.0, (n, 4))
+    for col in cols.values(): col.flush()
+    del cols
+    rbtsof.finalize_rbtsof(filename, count, has_motors=True)
+
+
+def write_text_copy(src, dst):
+    import rbtsof
+    rbtsof.binary_to_text(src, dst)
+
+
+def summarize(stage, points, samples_s, peak_bytes, work_points):
+    samples_s = sorted(samples_s)
+    total = sum(samples_s)
+    pick = lambda q: samples_s[min(int(q * len(samples_s)), len(samples_s) - 1)]
+    return {
+        "stage": stage, "points": points, "runs": len(samples_s),
+        "mean_ms": 1000.0 * total / len(samples_s), "p50_ms": 1000.0 * pick(0.5), "p99_ms": 1000.0 * pick(0.99),
+        "peak_mb": peak_bytes / 2 ** 20,
+        "points_per_sec": work_points / total if total > 0 else 0.0,
+    }
+
+
+def measure(stage, points, fn, repeat=1, work_points=None):
+    """Times `fn` `repeat` times, then runs it once more under tracemalloc for peak memory."""
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize(stage, points, samples, peak, (work_points or points) * repeat)
+
+
+def bench_viewer(count, frames, workdir):
+    import numpy as np
+    import viewer as viewer_module
+    from file_summary import summary_path
+    bin_file = os.path.join(workdir, f"cloud_{count}.rbtsof")
+    make_cloud(bin_file, count)
+    v = viewer_module.PointCloudViewer(None)
+
+    def drop_summary(filename):
+        if os.path.exists(summary_path(filename)): os.remove(summary_path(filename))
+
+    def load_all(filename, cached=False):
+        if not cached: drop_summary(filename)
+        v.load_data(filename, read_ahead=None); v.loader.join(); v.poll_loader()
+
+    def load_first(filename, cached=False):
+        if not cached: drop_summary(filename)
+        v.load_data(filename)
+        while v.loader.loaded == 0 and not v.loader.done: time.sleep(0.0005)
+        v.loader.cancel()
+
+    def startup(filename, cached=False):
+        """Constructor to the first chunk on the UI thread, as run() gets there (minus imports)."""
+        if not cached: drop_summary(filename)
+        s = viewer_module.PointCloudViewer(filename)
+        s.show_first_frame()
+        while s.loaded_count == 0 and s.loader is not None:
+            time.sleep(0.0005); s.poll_loader()
+        if s.loader is not None: s.loader.cancel()
+
+    results = [measure("viewer/startup(binary)", count, lambda: startup(bin_file), repeat=3),
+               measure("viewer/first_chunk(binary)", count, lambda: load_first(bin_file), repeat=3),
+               measure("viewer/load_data(binary)", count, lambda: load_all(bin_file), repeat=3),
+               measure("viewer/startup(binary, cached)", count, lambda: startup(bin_file, True), repeat=3),
+               measure("viewer/load_data(binary, cached)", count, lambda: load_all(bin_file, True), repeat=3)]
+    if count <= TEXT_LOAD_LIMIT:
+        txt_file = os.path.join(workdir, f"cloud_{count}.txt")
+        write_text_copy(bin_file, txt_file)
+        results.append(measure("viewer/first_chunk(text)", count, lambda: load_first(txt_file)))
+        results.append(measure("viewer/load_data(text)", count, lambda: load_all(txt_file)))
+        results.append(measure("viewer/first_chunk(text, cached)", count, lambda: load_first(txt_file, True)))
+        results.append(measure("viewer/load_data(text, cached)", count, lambda: load_all(txt_file, True)))
+        drop_summary(txt_file)
+        os.remove(txt_file)
+        load_all(bin_file)
+
+    while v.spatial_index is None or v.spatial_index.count < v.loaded_count:
+        time.sleep(0.01)  # background indexing would skew the frame timings
+    duration = (viewer_module.END_X - viewer_module.START_X) / v.drone_speed
+    dt = duration / frames
+
+    def replay(stage_fn=None):
+        """Plays the whole file in `frames` steps; returns per-frame times of the stage."""
+        v.current_time = 0.0; v.is_playing = True; v.prev_visible_count = 0; v.colored_count = 0
+        v.height_hist.reset(); v.motor_history.reset()
+        samples = []
+        for _ in range(frames):
+            if stage_fn is None:
+                t = time.perf_counter(); v.update_simulation(dt); samples.append(time.perf_counter() - t)
+            else:
+                v.current_time = min(v.current_time + dt, duration)
+                v.visible_count = int(np.searchsorted(v.timestamps, v.current_time * v.drone_speed))
+                t = time.perf_counter(); stage_fn(); samples.append(time.perf_counter() - t)
+        return samples
+
+    for stage, fn in (("viewer/update_simulation", None), ("viewer/update_heatmap_colors", v.update_heatmap_colors),
+                      ("viewer/update_graphs", v.update_graphs),
+                      ("viewer/nearest_point", lambda: v.nearest_point(v.get_drone_position()))):
+        samples = replay(fn)
+        tracemalloc.start(); replay(fn); peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+        results.append(summarize(stage, count, samples, peak, count))
+    targets = np.random.default_rng(0).uniform(0.0, duration, SEEKS)
+    samples = []
+    for t in targets:
+        start = time.perf_counter(); v.seek(t); samples.append(time.perf_counter() - start)
+    results.append(summarize("viewer/seek", count, samples, 0, count * SEEKS))
+    del v
+    drop_summary(bin_file)
+    os.remove(bin_file)
+    return results
+
+
+def bench_lidar(recording=None):
+    """Lidar stages over LIDAR_SCANS synthetic scans, or every scan of a .rbscan recording."""
+    from fake_lidar import SyntheticRoom, read_recording, SCAN_RATE_HZ
+    from scan_processing import process_scan
+    from live_renderer import ScanHistoryRenderer
+    from voxel_grid import VoxelGrid
+    from icp import ScanMatcher
+    if recording:
+        raw = [scan for _, scan in read_recording(recording)]
+    else:
+        room = SyntheticRoom()
+        raw = [room.scan(i / SCAN_RATE_HZ) for i in range(LIDAR_SCANS)]
+    scans = [[tuple(m) for m in scan.tolist()] for scan in raw]
+    n_points = sum(len(s) for s in scans)
+    results = [measure("lidar/process_scan", n_points, lambda: [process_scan(s) for s in scans], repeat=3)]
+    arrays = [process_scan(s) for s in scans]
+    from scan_filter import ScanFilter
+    from scan_processing import scan_to_polar, filter_polar
+    polars = [filter_polar(scan_to_polar(s)) for s in scans]
+    results.append(measure("lidar/scan_filter", n_points, lambda: [f(p) for f in [ScanFilter()] for p in polars], repeat=3))
+    renderer = ScanHistoryRenderer(30, 4000)
+    results.append(measure("lidar/render_add_scan", n_points, lambda: [renderer.add_scan(a) for a in arrays], repeat=3))
+    results.append(measure("lidar/voxel_insert", n_points,
+                           lambda: [grid.insert(a) for grid in [VoxelGrid(50, dims=2)] for a in arrays], repeat=3))
+    icp = measure("lidar/icp_odometry", n_points, lambda: [m.update(a) for m in [ScanMatcher()] for a in arrays])
+    icp["scans_per_sec"] = len(arrays) * 1000.0 / icp["mean_ms"]
+    icp["realtime_factor"] = icp["scans_per_sec"] / SCAN_RATE_HZ
+    results.append(icp)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the stages whose mean time grew by more than `tolerance` over the baseline."""
+    base = {(r["stage"], r["points"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["stage"], r["points"]))
+        if b is None or b["mean_ms"] <= 0: continue
+        ratio = r["mean_ms"] / b["mean_ms"]
+        r["baseline_mean_ms"] = b["mean_ms"]
+        r["ratio"] = ratio
+        if ratio > 1.0 + tolerance: regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="point counts, e.g. 10k,1M,50M")
+    parser.add_argument("--frames", type=int, default=120, help="frames used to replay each cloud")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {DEFAULT_BASELINE}")
+    parser.add_argument("--recording", help="run the lidar stages on a .rbscan recording instead of synthetic scans")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before flagging (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    install_stubs()
+    sys.path[:0] = [VIS_DIR, LIDAR_DIR]
+    results = []
+    # the viewer's own notes (CPU heatmap fallback, text format hint) go to stderr; stdout is the report
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(sys.stderr):
+        for count in parse_sizes(args.sizes):
+            results += bench_viewer(count, args.frames, workdir)
+        results += bench_lidar(args.recording and os.path.abspath(args.recording))
+
+    report = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "node": platform.node(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024},
+        "results": results,
+    }
+    regressions = []
+    if baseline:
+        with open(baseline) as f: regressions = compare(results, json.load(f), args.tolerance)
+
+    for r in results:
+        line = f"{r['stage']:<32} {r['points']:>10} pts  mean {r['mean_ms']:9.3f} ms  p99 {r['p99_ms']:9.3f} ms  " \
+               f"peak {r['peak_mb']:8.1f} MB  {r['points_per_sec'] / 1e6:8.2f} Mpts/s"
+        if "realtime_factor" in r: line += f"  {r['scans_per_sec']:.1f} scans/s (x{r['realtime_factor']:.1f} real time)"
+        if "ratio" in r: line += f"  x{r['ratio']:.2f} vs baseline"
+        print(line)
+    for path in filter(None, (out, DEFAULT_BASELINE if args.save_baseline else None)):
+        with open(path, "w") as f: json.dump(report, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}:")
+        for r in regressions: print(f"  {r['stage']} @ {r['points']}: {r['baseline_mean_ms']:.3f} -> {r['mean_ms']:.3f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
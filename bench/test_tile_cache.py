@@ -0,0 +1,74 @@
+"""TileCache paging checks on a synthetic two-flight site, with GL stubbed as in bench.py.
+
+    python3 bench/test_tile_cache.py      (or pytest bench/test_tile_cache.py)
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.join(BENCH_DIR, "..", "visualization")]
+import bench
+bench.install_stubs()
+import numpy as np
+from tile_store import TileStore
+from tile_cache import TileCache
+
+# every plane 1e6 away: all tiles are inside the frustum
+ALL_VISIBLE = np.array([[1, 0, 0, 1e6], [-1, 0, 0, 1e6], [0, 1, 0, 1e6],
+                        [0, -1, 0, 1e6], [0, 0, 1, 1e6], [0, 0, -1, 1e6]], dtype=np.float64)
+
+
+def make_site(directory):
+    site = os.path.join(directory, "site")
+    store = TileStore.create(site, 4.0)
+    for i, count in enumerate((30_000, 20_000)):
+        flight = os.path.join(directory, f"flight{i}.rbtsof")
+        bench.make_cloud(flight, count, seed=i)
+        store.add_flight(flight)
+    return TileStore(site)
+
+
+def page_in(cache, frames=200):
+    """Runs update() until the reader is idle and everything wanted is resident."""
+    for _ in range(frames):
+        cache.update(ALL_VISIBLE, np.zeros(3))
+        if not cache.wanted and cache.loading is None and not cache.loaded: break
+        time.sleep(0.005)
+    cache.update(ALL_VISIBLE, np.zeros(3))
+
+
+def test_missing_part_does_not_stop_paging():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_site(tmp)
+        broken = sorted(store.tiles)[len(store.tiles) // 2]
+        os.remove(os.path.join(store.directory, store.tiles[broken]["parts"][0]))
+        cache = TileCache(store)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            page_in(cache)
+            page_in(cache)
+        assert cache.failed == {cache.names.index(broken)}
+        assert cache.loading is None
+        assert out.getvalue().count("could not be read") == 1 and broken in out.getvalue()
+        assert len(cache.resident) == len(store.tiles) - 1
+        assert cache.resident_points == store.total_points - store.tiles[broken]["count"]
+
+
+def test_nearest_tile_kept_over_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_site(tmp)
+        cache = TileCache(store, budget=1)
+        page_in(cache)
+        assert len(cache.visible) == 1
+        assert cache.drawn_points > cache.budget
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: ok")
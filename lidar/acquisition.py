@@ -0,0 +1,207 @@
+"""Lidar acquisition in its own process, publishing scans through shared memory.
+
+Serial decoding in the drivers is pure Python; running it next to
+pygame/OpenGL means both fight over one GIL. Here the reader (including the
+reconnect loop from test3.py) runs in a child process and writes into a
+SharedScanRing, which the mapper attaches to by name.
+
+    python3 acquisition.py [adafruit|rplidar|async] [port] [baudrate] [--filter]
+
+runs the publisher in the foreground; start a mapper with `--attach` to
+consume it, or with `--process` to let the mapper spawn it itself. The
+"async" driver reads the port with supervisor.LidarSupervisor, which resyncs
+on bad packets instead of resetting the driver.
+"""
+import sys
+import time
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from scan_processing import process_scan
+from scan_ring import ScanRing, RING_SLOTS, MAX_SCAN_POINTS
+from scan_filter import ScanFilter
+from supervisor import run_supervised
+
+SHM_NAME = "ghostmap_scans"
+SYNC_ERROR_DELAY = 1.0
+CRITICAL_ERROR_DELAY = 2.0
+
+# int64 control block: ring geometry followed by the shared counters
+GEOMETRY = ("slots", "max_points", "columns")
+COUNTERS = ("write_seq", "read_seq", "overruns", "truncated", "dropped", "torn", "reconnects")
+CTRL_SIZE = len(GEOMETRY) + len(COUNTERS)
+
+
+def _counter(name):
+    i = len(GEOMETRY) + COUNTERS.index(name)
+    return property(lambda self: int(self.ctrl[i]), lambda self, v: self.ctrl.__setitem__(i, v))
+
+
+class SharedScanRing(ScanRing):
+    """ScanRing whose slabs and counters live in a shared memory block."""
+    write_seq = _counter("write_seq")
+    read_seq = _counter("read_seq")
+    overruns = _counter("overruns")
+    truncated = _counter("truncated")
+    dropped = _counter("dropped")
+    torn = _counter("torn")
+    reconnects = _counter("reconnects")
+
+    def __init__(self, shm):
+        self.shm = shm
+        head = np.ndarray((len(GEOMETRY),), dtype=np.int64, buffer=shm.buf)
+        self.slots, self.max_points, columns = (int(v) for v in head)
+        offset = 0
+        self.ctrl = np.ndarray((CTRL_SIZE,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.ctrl.nbytes
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.seqs.nbytes
+        self.counts = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.counts.nbytes
+        self.data = np.ndarray((self.slots, self.max_points, columns), dtype=np.float32, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def nbytes(slots, max_points, columns):
+        return 8 * (CTRL_SIZE + 2 * slots) + 4 * slots * max_points * columns
+
+    @classmethod
+    def create(cls, name=SHM_NAME, slots=RING_SLOTS, max_points=MAX_SCAN_POINTS, columns=3):
+        size = cls.nbytes(slots, max_points, columns)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a crashed run
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close(); stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ctrl = np.ndarray((CTRL_SIZE,), dtype=np.int64, buffer=shm.buf)
+        ctrl[:] = 0
+        ctrl[:len(GEOMETRY)] = (slots, max_points, columns)
+        del ctrl
+        ring = cls(shm)
+        ring.seqs[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name=SHM_NAME, untrack=True):
+        """Maps an existing ring. Unrelated processes untrack it so exiting does not unlink
+        the creator's block; children of the creator share its tracker and must not."""
+        shm = shared_memory.SharedMemory(name=name)
+        if untrack:
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        return cls(shm)
+
+    def stats(self):
+        stats = super().stats()
+        stats["reconnects"] = self.reconnects
+        return stats
+
+    def close(self):
+        del self.ctrl, self.seqs, self.counts, self.data
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def open_lidar(driver, port, baudrate):
+    """Returns (lidar, exception class) for either supported driver."""
+    if driver == "adafruit":
+        from adafruit_rplidar import RPLidar, RPLidarException
+        lidar = RPLidar(None, port, baudrate=baudrate, timeout=3)
+        lidar.stop()
+        lidar.disconnect()
+        time.sleep(0.5)
+        lidar.connect()
+    else:
+        from rplidar import RPLidar, RPLidarException
+        lidar = RPLidar(port, baudrate=baudrate)
+        lidar.clean_input()
+    return lidar, RPLidarException
+
+
+def close_lidar(lidar):
+    try:
+        lidar.stop()
+        lidar.stop_motor()
+        lidar.disconnect()
+    except Exception:
+        pass
+
+
+def run_acquisition(ring, driver, port, baudrate, stop_event, scan_filter=None):
+    """Reads scans into `ring` until `stop_event` is set, reconnecting on errors."""
+    if driver == "async": return run_supervised(ring, port, baudrate, stop_event, scan_filter)
+    while not stop_event.is_set():
+        lidar = None
+        sync_error = Exception
+        if scan_filter is not None: scan_filter.reset()
+        try:
+            lidar, sync_error = open_lidar(driver, port, baudrate)
+            for scan in lidar.iter_scans():
+                if stop_event.is_set(): break
+                points = process_scan(scan, scan_filter=scan_filter)
+                if len(points): ring.publish(points)
+        except Exception as e:
+            if isinstance(e, sync_error):
+                print(f"Acquisition: sync error: {e} -> resetting driver...")
+                delay = SYNC_ERROR_DELAY
+            else:
+                print(f"Acquisition: critical error: {e}")
+                delay = CRITICAL_ERROR_DELAY
+            ring.reconnects += 1
+            stop_event.wait(delay)
+        finally:
+            if lidar: close_lidar(lidar)
+
+
+def _acquisition_entry(name, driver, port, baudrate, stop_event, filtered):
+    ring = SharedScanRing.attach(name, untrack=False)
+    scan_filter = ScanFilter() if filtered else None
+    try:
+        run_acquisition(ring, driver, port, baudrate, stop_event, scan_filter)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if scan_filter is not None: print(f"Acquisition: {scan_filter.summary()}")
+        ring.close()
+
+
+class AcquisitionProcess:
+    """Owns the shared ring and the child process that fills it."""
+    def __init__(self, driver, port, baudrate, name=SHM_NAME, slots=RING_SLOTS, max_points=MAX_SCAN_POINTS, filtered=False):
+        self.ring = SharedScanRing.create(name, slots, max_points)
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_acquisition_entry, args=(name, driver, port, baudrate, self.stop_event, filtered), daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive(): self.process.terminate()
+        self.ring.close()
+        self.ring.unlink()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--filter"]
+    driver = args[0] if len(args) > 0 else "adafruit"
+    port = args[1] if len(args) > 1 else "/dev/ttyUSB0"
+    baudrate = int(args[2]) if len(args) > 2 else (256000 if driver == "adafruit" else 115200)
+    acquisition = AcquisitionProcess(driver, port, baudrate, filtered="--filter" in sys.argv)
+    acquisition.start()
+    print(f"Publishing {driver} scans from {port} to shared memory '{SHM_NAME}'. Ctrl+C to stop.")
+    try:
+        while acquisition.process.is_alive():
+            time.sleep(1.0)
+            print(acquisition.ring.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acquisition.stop()
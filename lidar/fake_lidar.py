@@ -0,0 +1,376 @@
+"""Recording, replay and synthetic scans for running without an A1M8.
+
+FakeRPLidar implements the parts of `rplidar.RPLidar` and
+`adafruit_rplidar.RPLidar` the scripts use, fed either from a recording or
+from a synthetic room. `install()` puts it behind both module names so the
+scripts run unchanged:
+
+    python3 fake_lidar.py record scans.rbscan [port] [rplidar|adafruit] [count]
+    python3 fake_lidar.py run test2.py [--replay scans.rbscan] [--max-speed] [--loop] [--faults]
+    python3 fake_lidar.py bench [scans.rbscan] [count]
+
+Recording format: RECORD_MAGIC, then per scan a SCAN_HEADER (float64 seconds
+since the first scan, uint32 n) followed by n float32 (quality, angle,
+distance) triples.
+
+FaultyDevice stands in for the serial port itself (for supervisor.py): it
+answers SCAN with the synthetic room in the A1M8 packet format and injects
+faults. `install()` also puts it behind supervisor.open_serial, the lidar
+port of the async driver; other serial ports such as the ESP32 stay real.
+`run --faults` turns the faults on.
+"""
+import math
+import os
+import runpy
+import struct
+import sys
+import threading
+import time
+import types
+import numpy as np
+import supervisor
+from supervisor import CMD_SCAN, CMD_STOP, SCAN_DESCRIPTOR, encode_packets
+
+RECORD_MAGIC = b"RBSCAN\x00\x01"
+SCAN_HEADER = struct.Struct("<dI")
+SCAN_RATE_HZ = 7.0
+POINTS_PER_SCAN = 360
+# Chance per scan of each fault FaultyDevice injects
+DEFAULT_FAULTS = {"garbage": 0.05, "drop": 0.05, "stall": 0.02, "unplug": 0.01}
+UNPLUG_S = 0.5
+MAX_GARBAGE_BYTES = 64
+
+
+class FakeRPLidarException(Exception):
+    pass
+
+
+class ScanRecorder:
+    """Appends raw iter_scans batches with timestamps to a .rbscan file."""
+    def __init__(self, filename):
+        self.file = open(filename, "wb")
+        self.file.write(RECORD_MAGIC)
+        self.t0 = None
+        self.count = 0
+
+    def write(self, scan, timestamp=None):
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.t0 is None: self.t0 = now
+        data = np.asarray(scan, dtype=np.float32).reshape(-1, 3)
+        self.file.write(SCAN_HEADER.pack(now - self.t0, len(data)))
+        self.file.write(data.tobytes())
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_recording(filename):
+    """Yields (seconds, (n, 3) float32 quality/angle/distance) per recorded scan."""
+    with open(filename, "rb") as f:
+        if f.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError(f"{filename}: not a scan recording")
+        while True:
+            head = f.read(SCAN_HEADER.size)
+            if len(head) < SCAN_HEADER.size: return
+            t, n = SCAN_HEADER.unpack(head)
+            data = np.frombuffer(f.read(n * 12), dtype=np.float32)
+            if len(data) < n * 3: return
+            yield t, data.reshape(n, 3)
+
+
+class SyntheticRoom:
+    """Rectangular room with round pillars, scanned from a slowly drifting pose."""
+    def __init__(self, width=8000.0, depth=6000.0, pillars=((1500.0, 1000.0, 250.0), (-2000.0, -1200.0, 400.0)),
+                 points_per_scan=POINTS_PER_SCAN, noise_mm=8.0, dropout=0.03, seed=0):
+        self.half = np.array([width / 2, depth / 2])
+        self.pillars = np.array(pillars, dtype=np.float64).reshape(-1, 3)
+        self.points_per_scan = points_per_scan
+        self.noise_mm = noise_mm
+        self.dropout = dropout
+        self.rng = np.random.default_rng(seed)
+
+    def pose(self, t):
+        """(x, y, heading_deg) of the sensor at time t."""
+        return 1000.0 * math.sin(0.2 * t), 600.0 * math.sin(0.13 * t), 10.0 * t
+
+    def scan(self, t):
+        """(n, 3) float32 quality, angle, distance as the sensor would report at time t."""
+        px, py, heading = self.pose(t)
+        n = self.points_per_scan
+        angles = (np.arange(n) * (360.0 / n) + self.rng.uniform(0, 360.0 / n)) % 360.0
+        rad = np.deg2rad(angles + heading)
+        c, s = np.cos(rad), np.sin(rad)
+        with np.errstate(divide="ignore"):
+            tx = np.where(c > 0, self.half[0] - px, -self.half[0] - px) / c
+            ty = np.where(s > 0, self.half[1] - py, -self.half[1] - py) / s
+        dist = np.minimum(np.abs(tx), np.abs(ty))
+        for cx, cy, r in self.pillars:
+            ox, oy = px - cx, py - cy
+            b = ox * c + oy * s
+            disc = b * b - (ox * ox + oy * oy - r * r)
+            hit = -b - np.sqrt(np.maximum(disc, 0.0))
+            dist = np.where((disc > 0) & (hit > 0), np.minimum(dist, hit), dist)
+        dist = dist + self.rng.normal(0.0, self.noise_mm, n)
+        dist[self.rng.random(n) < self.dropout] = 0.0
+        quality = np.where(dist > 0, 15.0, 0.0)
+        return np.column_stack([quality, angles, dist]).astype(np.float32)
+
+
+class FakeRPLidar:
+    """Stand-in for both driver classes; constructor arguments are accepted and ignored."""
+    config = {"recording": None, "realtime": True, "loop": False, "max_scans": None}
+
+    def __init__(self, *args, **kwargs):
+        self.recording = self.config["recording"]
+        self.realtime = self.config["realtime"]
+        self.loop = self.config["loop"]
+        self.max_scans = self.config["max_scans"]
+        self.scene = SyntheticRoom()
+        self.motor_running = False
+        self.connected = True
+
+    # Both drivers
+    def connect(self): self.connected = True
+    def disconnect(self): self.connected = False
+    def stop(self): pass
+    def start_motor(self): self.motor_running = True
+    def stop_motor(self): self.motor_running = False
+    def clean_input(self): pass
+    def reset(self): pass
+
+    def get_info(self):
+        return {"model": 24, "firmware": (1, 29), "hardware": 7, "serialnumber": "FAKE"}
+
+    def get_health(self):
+        return ("Good", 0)
+
+    # adafruit_rplidar exposes these as properties
+    info = property(get_info)
+    health = property(get_health)
+
+    def _scans(self):
+        """(timestamp, scan array) from the recording or the synthetic room."""
+        if self.recording:
+            while True:
+                yield from read_recording(self.recording)
+                if not self.loop: return
+        t = 0.0
+        while True:
+            yield t, self.scene.scan(t)
+            t += 1.0 / SCAN_RATE_HZ
+
+    def iter_scans(self, max_buf_meas=500, min_len=5, scan_type=None):
+        """Yields lists of (quality, angle, distance) just like the real drivers."""
+        self.start_motor()
+        start = time.monotonic()
+        base = None
+        for i, (t, scan) in enumerate(self._scans()):
+            if self.max_scans is not None and i >= self.max_scans: return
+            if self.realtime:
+                if base is None or t < base: base, start = t, time.monotonic()
+                delay = (t - base) - (time.monotonic() - start)
+                if delay > 0: time.sleep(delay)
+            if len(scan) < min_len: continue
+            yield [tuple(m) for m in scan.tolist()]
+
+    def iter_measurements(self, max_buf_meas=500, scan_type=None):
+        for scan in self.iter_scans(max_buf_meas):
+            for j, (quality, angle, distance) in enumerate(scan):
+                yield j == 0, quality, angle, distance
+
+
+class FaultyDevice:
+    """A lidar on a flaky USB link; open() gives a FaultySerial while it is plugged in.
+
+    `faults` maps each fault to its chance per scan:
+        garbage  a burst of random bytes inside the scan
+        drop     a few bytes lost, so the packets go out of alignment
+        stall    the sensor goes quiet until it gets the next SCAN command
+        unplug   reads fail and the port cannot be opened for UNPLUG_S
+    `injected` counts what was actually injected.
+    """
+    def __init__(self, faults=None, realtime=True, seed=0):
+        self.faults = dict(faults or {})
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.scene = SyntheticRoom(seed=seed)
+        self.t = 0.0
+        self.unplugged_until = 0.0
+        self.injected = dict.fromkeys(("garbage", "drop", "stall", "unplug"), 0)
+
+    @property
+    def plugged(self):
+        return time.monotonic() >= self.unplugged_until
+
+    def open(self, *args, **kwargs):
+        if not self.plugged: raise OSError(2, "could not open port: No such file or directory")
+        return FaultySerial(self)
+
+    def next_scan(self):
+        """(packet bytes, fault or None) of the next rotation."""
+        data = bytearray(encode_packets(self.scene.scan(self.t)))
+        self.t += 1.0 / SCAN_RATE_HZ
+        fault = next((f for f, p in self.faults.items() if self.rng.random() < p), None)
+        if fault == "garbage":
+            i = int(self.rng.integers(len(data)))
+            data[i:i] = self.rng.integers(0, 256, int(self.rng.integers(1, MAX_GARBAGE_BYTES)), dtype=np.uint8).tobytes()
+        elif fault == "drop":
+            i = int(self.rng.integers(len(data)))
+            del data[i:i + int(self.rng.integers(1, 5))]
+        if fault is not None: self.injected[fault] += 1
+        return bytes(data), fault
+
+
+class FaultySerial:
+    """The parts of serial.Serial (timeout=0) that supervisor.py uses, fed through a pipe.
+
+    The pipe gives the port a real file descriptor for event loop readers.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.dtr = True
+        self.rfd, self.wfd = os.pipe()
+        os.set_blocking(self.rfd, False)
+        self.writer = None
+        self.stop_event = threading.Event()
+
+    def fileno(self):
+        return self.rfd
+
+    def read(self, size=1):
+        try:
+            data = os.read(self.rfd, size)
+        except BlockingIOError:
+            return b""
+        if not data:
+            raise OSError("device reports readiness to read but returned no data "
+                          "(device disconnected or multiple access on port?)")
+        return data
+
+    def write(self, data):
+        if not self.device.plugged or self.wfd is None: raise OSError(5, "write failed: Input/output error")
+        if CMD_STOP in data: self._stop_scan()
+        if CMD_SCAN in data:
+            self._stop_scan()
+            os.write(self.wfd, SCAN_DESCRIPTOR)
+            self.stop_event.clear()
+            self.writer = threading.Thread(target=self._send_scans, daemon=True)
+            self.writer.start()
+        return len(data)
+
+    def reset_input_buffer(self):
+        try:
+            while os.read(self.rfd, 65536): pass
+        except BlockingIOError:
+            pass
+
+    def _stop_scan(self):
+        self.stop_event.set()
+        if self.writer is not None: self.writer.join()
+        self.writer = None
+
+    def _send_scans(self):
+        device = self.device
+        start, sent = time.monotonic(), 0
+        while not self.stop_event.is_set():
+            data, fault = device.next_scan()
+            if fault == "stall": return
+            if fault == "unplug":
+                device.unplugged_until = time.monotonic() + UNPLUG_S
+                os.close(self.wfd)
+                self.wfd = None
+                return
+            if device.realtime:
+                self.stop_event.wait(start + sent / SCAN_RATE_HZ - time.monotonic())
+            try:
+                os.write(self.wfd, data)
+            except OSError:
+                return
+            sent += 1
+
+    def close(self):
+        self._stop_scan()
+        for fd in (self.rfd, self.wfd):
+            if fd is not None: os.close(fd)
+        self.rfd = self.wfd = None
+
+
+def install(recording=None, realtime=True, loop=False, max_scans=None, faults=None):
+    """Makes `rplidar` and `adafruit_rplidar` imports resolve to FakeRPLidar and the async lidar port to a FaultyDevice."""
+    FakeRPLidar.config.update(recording=recording, realtime=realtime, loop=loop, max_scans=max_scans)
+    for name in ("rplidar", "adafruit_rplidar"):
+        module = types.ModuleType(name)
+        module.RPLidar = FakeRPLidar
+        module.RPLidarException = FakeRPLidarException
+        sys.modules[name] = module
+    supervisor.open_serial = FaultyDevice(faults, realtime).open
+
+
+def record(filename, port="/dev/ttyUSB0", driver="rplidar", count=None):
+    from acquisition import open_lidar, close_lidar
+    baudrate = 256000 if driver == "adafruit" else 115200
+    lidar, _ = open_lidar(driver, port, baudrate)
+    try:
+        with ScanRecorder(filename) as recorder:
+            for scan in lidar.iter_scans():
+                recorder.write(scan)
+                if count is not None and recorder.count >= count: break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_lidar(lidar)
+
+
+def bench(recording=None, count=500):
+    """Max-speed throughput of the scan conversion pipeline."""
+    from scan_processing import process_scan
+    install(recording, realtime=False, max_scans=count)
+    lidar = FakeRPLidar()
+    scans = list(lidar.iter_scans())
+    start = time.perf_counter()
+    points = sum(len(process_scan(scan)) for scan in scans)
+    elapsed = time.perf_counter() - start
+    print(f"{len(scans)} scans, {points} points in {elapsed * 1000:.1f} ms "
+          f"({len(scans) / elapsed:.0f} scans/s, {points / elapsed:.0f} points/s)")
+
+
+def _flag_value(args, flag):
+    if flag in args:
+        i = args.index(flag)
+        value = args[i + 1]
+        del args[i:i + 2]
+        return value
+    return None
+
+
+def _flag(args, flag):
+    if flag in args:
+        args.remove(flag)
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] not in ("record", "run", "bench"):
+        print(__doc__)
+        sys.exit(1)
+    mode = args.pop(0)
+    if mode == "record":
+        record(args[0], *(args[1:3]), count=int(args[3]) if len(args) > 3 else None)
+    elif mode == "bench":
+        bench(args[0] if args else None, int(args[1]) if len(args) > 1 else 500)
+    else:
+        recording = _flag_value(args, "--replay")
+        install(recording, realtime=not _flag(args, "--max-speed"), loop=_flag(args, "--loop"),
+                faults=DEFAULT_FAULTS if _flag(args, "--faults") else None)
+        script = args.pop(0)
+        sys.argv = [script] + args
+        runpy.run_path(script, run_name="__main__")
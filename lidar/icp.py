@@ -0,0 +1,160 @@
+"""2D point-to-line ICP scan matching for lidar odometry.
+
+Scans come in as the (n, 3) float32 x, y, distance arrays from
+scan_processing. ScanMatcher matches each scan against the last keyframe
+and returns the sensor pose (x, y, theta) in the frame of the first scan.
+Correspondences use scipy's cKDTree when it is installed, otherwise a
+chunked brute-force NumPy search. That costs O(n * m) per scan against an
+O(n log m) tree, but at A1M8 scan sizes it still keeps ahead of the scan
+rate (see lidar/icp_odometry in bench.py).
+"""
+import math
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+ICP_ITERATIONS = 20
+MAX_CORRESPONDENCE_MM = 300.0
+NORMAL_NEIGHBOURS = 5
+TRIM_FRACTION = 0.8
+CONVERGED_MM = 0.1
+CONVERGED_RAD = 1e-4
+KEYFRAME_MM = 300.0
+KEYFRAME_RAD = math.radians(15.0)
+BRUTE_CHUNK = 4096
+
+
+class NearestNeighbors:
+    """k-nearest-neighbour queries over a fixed 2D point set."""
+    def __init__(self, points):
+        self.points = np.ascontiguousarray(points[:, :2], dtype=np.float64)
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+
+    def query(self, query, k=1):
+        """(distances, indices), shaped (n,) for k == 1 and (n, k) otherwise."""
+        query = np.asarray(query, dtype=np.float64)
+        if self.tree is not None:
+            return self.tree.query(query, k=k)
+        k = min(k, len(self.points))
+        dists = np.empty((len(query), k)); idx = np.empty((len(query), k), dtype=np.int64)
+        for s in range(0, len(query), BRUTE_CHUNK):
+            q = query[s:s + BRUTE_CHUNK]
+            d2 = ((q[:, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+            part = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < d2.shape[1] else np.tile(np.arange(k), (len(q), 1))
+            pd = np.take_along_axis(d2, part, axis=1)
+            order = np.argsort(pd, axis=1)
+            idx[s:s + len(q)] = np.take_along_axis(part, order, axis=1)
+            dists[s:s + len(q)] = np.sqrt(np.take_along_axis(pd, order, axis=1))
+        if k == 1: return dists[:, 0], idx[:, 0]
+        return dists, idx
+
+
+def estimate_normals(points, nn, k=NORMAL_NEIGHBOURS):
+    """Unit normals from the smallest principal axis of each point's k neighbours."""
+    _, idx = nn.query(points, k=k)
+    nb = nn.points[idx]
+    centered = nb - nb.mean(axis=1, keepdims=True)
+    sxx = (centered[..., 0] ** 2).sum(axis=1)
+    syy = (centered[..., 1] ** 2).sum(axis=1)
+    sxy = (centered[..., 0] * centered[..., 1]).sum(axis=1)
+    # orientation of the major axis; the normal is perpendicular to it
+    phi = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    return np.column_stack([-np.sin(phi), np.cos(phi)])
+
+
+def transform(points, pose):
+    x, y, theta = pose
+    c, s = math.cos(theta), math.sin(theta)
+    p = points[:, :2]
+    return np.column_stack([c * p[:, 0] - s * p[:, 1] + x, s * p[:, 0] + c * p[:, 1] + y])
+
+
+def transform_scan(points, pose):
+    """Scan array (x, y, distance) moved into the world frame; distance is kept for colouring."""
+    out = np.empty((len(points), 3), dtype=np.float32)
+    out[:, :2] = transform(points, pose)
+    out[:, 2] = points[:, 2]
+    return out
+
+
+def compose(a, b):
+    """Pose of b expressed in a's parent frame."""
+    x, y = transform(np.array([[b[0], b[1]]]), a)[0]
+    return (x, y, (a[2] + b[2] + math.pi) % (2 * math.pi) - math.pi)
+
+
+def inverse(pose):
+    x, y, theta = pose
+    c, s = math.cos(theta), math.sin(theta)
+    return (-(c * x + s * y), -(-s * x + c * y), -theta)
+
+
+def match(source, target, nn=None, normals=None, init=(0.0, 0.0, 0.0), iterations=ICP_ITERATIONS,
+          max_dist=MAX_CORRESPONDENCE_MM, trim=TRIM_FRACTION):
+    """Pose mapping `source` onto `target`; returns (pose, rms_mm, inliers)."""
+    if nn is None: nn = NearestNeighbors(target)
+    if normals is None: normals = estimate_normals(nn.points, nn)
+    src = np.asarray(source[:, :2], dtype=np.float64)
+    x, y, theta = init
+    rms, inliers = float("inf"), 0
+    for _ in range(iterations):
+        p = transform(src, (x, y, theta))
+        dist, idx = nn.query(p)
+        keep = dist < max_dist
+        if keep.sum() < 3: break
+        # trimmed: drop the worst correspondences
+        cutoff = np.quantile(dist[keep], trim)
+        keep &= dist <= cutoff
+        p, q, n = p[keep], nn.points[idx[keep]], normals[idx[keep]]
+        r = ((p - q) * n).sum(axis=1)
+        # d(residual)/d(tx, ty, theta) for a rotation about the origin
+        J = np.column_stack([n[:, 0], n[:, 1], n[:, 1] * p[:, 0] - n[:, 0] * p[:, 1]])
+        H = J.T @ J
+        if np.linalg.cond(H) > 1e12: break
+        dx, dy, dth = np.linalg.solve(H, -J.T @ r)
+        # apply the increment as a rotation about the origin followed by a translation
+        c, s = math.cos(dth), math.sin(dth)
+        x, y = c * x - s * y + dx, s * x + c * y + dy
+        theta += dth
+        rms, inliers = float(np.sqrt(np.mean(r ** 2))), int(keep.sum())
+        if abs(dx) < CONVERGED_MM and abs(dy) < CONVERGED_MM and abs(dth) < CONVERGED_RAD: break
+    return (x, y, theta), rms, inliers
+
+
+class ScanMatcher:
+    """Scan-to-keyframe odometry with a constant-velocity initial guess."""
+    def __init__(self, keyframe_mm=KEYFRAME_MM, keyframe_rad=KEYFRAME_RAD):
+        self.keyframe_mm = keyframe_mm
+        self.keyframe_rad = keyframe_rad
+        self.pose = (0.0, 0.0, 0.0)
+        self.keyframe = None
+        self.keyframe_pose = self.pose
+        self.nn = None
+        self.normals = None
+        self.last_delta = (0.0, 0.0, 0.0)
+        self.rms = 0.0
+
+    def _set_keyframe(self, points):
+        self.keyframe = np.array(points[:, :2], dtype=np.float64)
+        self.keyframe_pose = self.pose
+        self.nn = NearestNeighbors(self.keyframe)
+        self.normals = estimate_normals(self.nn.points, self.nn)
+
+    def update(self, points):
+        """Matches one scan; returns its pose (x_mm, y_mm, theta_rad)."""
+        if len(points) < NORMAL_NEIGHBOURS: return self.pose
+        if self.keyframe is None:
+            self._set_keyframe(points)
+            return self.pose
+        # guess: previous pose advanced by the last motion, relative to the keyframe
+        guess = compose(inverse(self.keyframe_pose), compose(self.pose, self.last_delta))
+        relative, self.rms, _ = match(points, self.keyframe, self.nn, self.normals, init=guess)
+        new_pose = compose(self.keyframe_pose, relative)
+        self.last_delta = compose(inverse(self.pose), new_pose)
+        self.pose = new_pose
+        if math.hypot(relative[0], relative[1]) > self.keyframe_mm or abs(relative[2]) > self.keyframe_rad:
+            self._set_keyframe(points)
+        return self.pose
@@ -0,0 +1,150 @@
+"""Batched renderer for the live lidar mappers.
+
+The last `history_size` scans live in two VBOs: x, y, distance vertices
+(uploaded straight from the scan ring, stride 12) and uint8 RGB colours from
+a distance->RGB lookup table. A new scan overwrites the oldest slot and only
+that slot's range is uploaded. The history fade is not stored per vertex:
+each slot is drawn with its own constant blend alpha, oldest first.
+"""
+import colorsys
+import numpy as np
+from OpenGL.GL import *
+from scan_ring import MAX_SCAN_POINTS
+
+LUT_SIZE = 1024
+VERTEX_BYTES = 3 * 4
+COLOR_BYTES = 3
+HIT_SATURATION = 20
+MAP_COLOR = (0.7, 0.7, 0.75)
+
+
+def build_color_lut(size=LUT_SIZE):
+    """Same rainbow as the old get_rainbow_color: blue near, red at max distance, as uint8 RGB."""
+    lut = np.empty((size, 3), dtype=np.float32)
+    for i in range(size):
+        hue = (1.0 - i / (size - 1)) * 0.66
+        lut[i] = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
+    return np.rint(lut * 255).astype(np.uint8)
+
+
+class ScanHistoryRenderer:
+    def __init__(self, history_size, max_distance, mode=GL_POINTS, max_points=MAX_SCAN_POINTS):
+        self.history_size = history_size
+        self.max_distance = float(max_distance)
+        self.mode = mode
+        self.max_points = max_points
+        self.lut = build_color_lut()
+
+        self.colors = np.zeros((history_size, max_points, 3), dtype=np.uint8)
+        self.firsts = (np.arange(history_size, dtype=np.int32) * max_points)
+        self.counts = np.zeros(history_size, dtype=np.int32)
+        self.head = 0
+        self.scans_added = 0
+
+        self.vertex_vbo, self.color_vbo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo)
+        glBufferData(GL_ARRAY_BUFFER, history_size * max_points * VERTEX_BYTES, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.colors.nbytes, self.colors, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def slot_alphas(self):
+        """Alpha per slot: newest scan 1.0, fading linearly with age."""
+        age = (self.head - 1 - np.arange(self.history_size)) % self.history_size
+        return (1.0 - age / self.history_size).astype(np.float32)
+
+    def add_scan(self, points):
+        """points: (n, 3) float32 x, y, distance, e.g. a view from ScanRing.read_new."""
+        slot = self.head
+        n = min(len(points), self.max_points)
+        idx = (np.minimum(points[:n, 2], self.max_distance) * ((LUT_SIZE - 1) / self.max_distance)).astype(np.intp)
+        self.colors[slot, :n] = self.lut[idx]
+        self.counts[slot] = n
+        self.head = (self.head + 1) % self.history_size
+        self.scans_added += 1
+
+        if n:
+            glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, slot * self.max_points * VERTEX_BYTES, np.ascontiguousarray(points[:n]))
+            glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, slot * self.max_points * COLOR_BYTES, self.colors[slot, :n])
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        if self.scans_added == 0: return
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo); glVertexPointer(2, GL_FLOAT, VERTEX_BYTES, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo); glColorPointer(3, GL_UNSIGNED_BYTE, 0, None)
+        # the fade is a constant blend alpha per slot; the caller's blend function is restored afterwards
+        glPushAttrib(GL_COLOR_BUFFER_BIT)
+        glEnable(GL_BLEND); glBlendFunc(GL_CONSTANT_ALPHA, GL_ONE_MINUS_CONSTANT_ALPHA)
+        alphas = self.slot_alphas()
+        for slot in np.argsort(alphas, kind="stable"):
+            if self.counts[slot] == 0: continue
+            glBlendColor(0.0, 0.0, 0.0, float(alphas[slot]))
+            glDrawArrays(self.mode, int(self.firsts[slot]), int(self.counts[slot]))
+        glPopAttrib()
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY); glDisableClientState(GL_COLOR_ARRAY)
+
+
+class VoxelMapRenderer:
+    """Accumulated occupancy map from a 2D VoxelGrid: one point per voxel.
+
+    Voxels only ever get appended, so centers are uploaded once; colours of
+    the voxels a scan touched are refreshed as one dirty range.
+    """
+    def __init__(self, grid, min_hits=2, saturation=HIT_SATURATION, color=MAP_COLOR):
+        self.grid = grid
+        self.min_hits = min_hits
+        self.saturation = float(saturation)
+        self.color = np.asarray(color, dtype=np.float32)
+        self.colors = np.zeros((0, 4), dtype=np.float32)
+        self.vertex_vbo, self.color_vbo = glGenBuffers(2)
+        self.capacity = 0
+        self.uploaded = 0
+
+    def _reserve(self, count):
+        if count <= self.capacity: return
+        self.capacity = max(count, 2 * self.capacity, 1024)
+        for vbo in (self.vertex_vbo, self.color_vbo):
+            glBindBuffer(GL_ARRAY_BUFFER, vbo)
+            glBufferData(GL_ARRAY_BUFFER, self.capacity * (8 if vbo == self.vertex_vbo else 16), None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded = 0
+        self._upload_colors(0, self.grid.size)
+
+    def _upload_colors(self, start, end):
+        if end <= start: return
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, start * 16, self.colors[start:end])
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def add_scan(self, points):
+        """points: (n, >=2) x, y in mm."""
+        _, ids = self.grid.insert(points)
+        size = self.grid.size
+        if len(self.colors) < size:
+            grown = np.zeros((max(size, 2 * len(self.colors)), 4), dtype=np.float32)
+            grown[:len(self.colors)] = self.colors
+            self.colors = grown
+        hits = self.grid.hits[ids]
+        self.colors[ids, :3] = self.color
+        self.colors[ids, 3] = np.where(hits >= self.min_hits, np.minimum(hits / self.saturation, 1.0), 0.0)
+
+        self._reserve(size)
+        if size > self.uploaded:
+            glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo)
+            glBufferSubData(GL_ARRAY_BUFFER, self.uploaded * 8, self.grid.centers[self.uploaded:size])
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self.uploaded = size
+        if len(ids): self._upload_colors(int(ids.min()), int(ids.max()) + 1)
+
+    def draw(self):
+        if self.uploaded == 0: return
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_vbo); glVertexPointer(2, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo); glColorPointer(4, GL_FLOAT, 0, None)
+        glDrawArrays(GL_POINTS, 0, self.uploaded)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY); glDisableClientState(GL_COLOR_ARRAY)
@@ -0,0 +1,151 @@
+"""Scoped stage timers with ring-buffered statistics and Chrome trace export.
+
+    profiler = Profiler.from_argv(sys.argv)     # --profile, --trace out.json
+    with profiler.stage("render"):
+        ...
+    profiler.frame()
+
+A disabled profiler hands out one shared no-op scope, so instrumented code
+costs a method call and an empty `with` per stage. Stages may be timed from
+any thread; each keeps the last `history` durations. With --trace every
+scope is also recorded as a complete ("X") event and written on save() in
+the Chrome trace format (chrome://tracing, ui.perfetto.dev). Milestones
+records one-off times such as time-to-first-frame.
+"""
+import json
+import os
+import threading
+import time
+import numpy as np
+
+STAGE_HISTORY = 240
+STATS_EVERY = 30
+MAX_TRACE_EVENTS = 1_000_000
+FRAME = "frame"
+
+
+class _NullScope:
+    __slots__ = ()
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc): return False
+
+
+NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, history=STAGE_HISTORY, trace=None):
+        self.enabled = enabled or trace is not None
+        self.history = history
+        self.trace = trace
+        self.events = []
+        self.samples = {}    # stage -> [ring of durations in s, next slot]
+        self.order = []      # stages in first-seen order, for display
+        self.cached = {}
+        self.frames = 0
+        self.last_frame = None
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_argv(cls, argv):
+        trace = argv[argv.index("--trace") + 1] if "--trace" in argv[:-1] else None
+        return cls(enabled="--profile" in argv, trace=trace)
+
+    def stage(self, name):
+        return _Scope(self, name) if self.enabled else NULL_SCOPE
+
+    def record(self, name, start, end):
+        with self.lock:
+            entry = self.samples.get(name)
+            if entry is None:
+                entry = self.samples[name] = [[], 0]
+                self.order.append(name)
+            ring, slot = entry
+            if len(ring) < self.history: ring.append(end - start)
+            else: ring[slot] = end - start
+            entry[1] = (slot + 1) % self.history
+            if self.trace is not None and len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append((name, start, end, threading.get_ident()))
+
+    def frame(self):
+        """Marks the end of a frame; its duration is kept as the "frame" stage."""
+        if not self.enabled: return
+        now = time.perf_counter()
+        if self.last_frame is not None: self.record(FRAME, self.last_frame, now)
+        self.last_frame = now
+        self.frames += 1
+        if self.frames % STATS_EVERY == 0: self.cached = self.stats()
+
+    def stats(self):
+        """{stage: (p50_ms, p99_ms, max_ms)} over each stage's ring."""
+        with self.lock:
+            rings = {name: np.array(self.samples[name][0]) * 1000.0 for name in self.order}
+        return {name: (float(np.percentile(r, 50)), float(np.percentile(r, 99)), float(r.max()))
+                for name, r in rings.items() if len(r)}
+
+    def summary(self):
+        return ", ".join(f"{name} {p50:.1f}/{p99:.1f} ms" for name, (p50, p99, _) in self.cached.items())
+
+    def frame_times(self):
+        """Frame durations in ms, oldest first, for plotting."""
+        with self.lock:
+            ring, slot = self.samples.get(FRAME, ([], 0))
+            values = ring[slot:] + ring[:slot] if len(ring) == self.history else list(ring)
+        return np.array(values, dtype=np.float32) * 1000.0
+
+    def draw_imgui(self, imgui):
+        """Overlay window with p50/p99/max per stage and a frame-time plot."""
+        imgui.begin("Profiler", True)
+        imgui.text(f"{'stage':<18}{'p50':>8}{'p99':>8}{'max':>8}  ms")
+        for name, (p50, p99, worst) in self.cached.items():
+            imgui.text(f"{name:<18}{p50:8.2f}{p99:8.2f}{worst:8.2f}")
+        frames = self.frame_times()
+        if len(frames):
+            imgui.plot_lines("Frame (ms)", frames, graph_size=(0, 60), scale_min=0.0)
+        imgui.end()
+
+    def save(self, path=None):
+        """Writes recorded scopes as a Chrome trace; returns the path, or None when not tracing."""
+        path = path or self.trace
+        if path is None: return None
+        pid = os.getpid()
+        with self.lock:
+            events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                       "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+                      for name, start, end, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+class Milestones:
+    """Seconds from `start` (default: now) to one-off events, such as the steps to a program's first frame."""
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.marks = {}
+
+    def mark(self, name):
+        """Records `name` the first time only; returns its time."""
+        return self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def summary(self):
+        return ", ".join(f"{name} {t * 1000:.0f} ms" for name, t in self.marks.items())
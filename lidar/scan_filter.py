@@ -0,0 +1,141 @@
+"""Streaming speckle filter for polar scans, kept under a per-scan time budget.
+
+Motor vibration and reflections show up as isolated returns far from their
+angular neighbours and as range jitter on stable surfaces. ScanFilter runs
+three vectorized stages on each (quality, angle, distance) scan:
+
+    quality   drops returns below `min_quality`
+    outliers  drops returns further than max(min_deviation, relative *
+              median) from the median of their `window` angular neighbours
+              (the window wraps around 360 degrees)
+    smoothing per angle bin exponential average across scans; a bin resets
+              instead of smearing when the range jumps by more than `reset_mm`
+
+Stage times are tracked as moving averages. When the outlier stage eats more
+than its share of the budget its window shrinks (and grows back when there
+is room again); a scan that is already over budget skips its remaining
+stages. `stats()` reports the counters.
+"""
+import time
+import numpy as np
+from scan_processing import QUALITY, ANGLE, DIST
+
+MIN_QUALITY = 10
+MEDIAN_WINDOW = 7
+MIN_WINDOW = 3
+MIN_DEVIATION_MM = 60.0
+RELATIVE_DEVIATION = 0.05
+ANGLE_BINS = 720
+SMOOTHING = 0.5
+RESET_MM = 150.0
+BUDGET_MS = 2.0
+# Share of the budget the outlier stage may take before its window shrinks
+OUTLIER_SHARE = 0.6
+TIMING_DECAY = 0.1
+STAGES = ("quality", "outliers", "smoothing")
+
+
+def angular_median(dist, window):
+    """Median over `window` neighbours of every sample in a closed ring of samples."""
+    half = window // 2
+    if len(dist) < window: return np.full(len(dist), np.median(dist)) if len(dist) else dist
+    ring = np.concatenate([dist[-half:], dist, dist[:half]])
+    return np.median(np.lib.stride_tricks.sliding_window_view(ring, window), axis=1)
+
+
+class ScanFilter:
+    def __init__(self, min_quality=MIN_QUALITY, window=MEDIAN_WINDOW, min_deviation=MIN_DEVIATION_MM,
+                 relative=RELATIVE_DEVIATION, bins=ANGLE_BINS, smoothing=SMOOTHING, reset_mm=RESET_MM,
+                 budget_ms=BUDGET_MS):
+        self.min_quality = min_quality
+        self.max_window = window | 1
+        self.window = self.max_window
+        self.min_deviation = min_deviation
+        self.relative = relative
+        self.bins = bins
+        self.smoothing = smoothing
+        self.reset_mm = reset_mm
+        self.budget = budget_ms / 1000.0
+        self.ema = np.zeros(bins, dtype=np.float32)
+        self.valid = np.zeros(bins, dtype=bool)
+        self.stage_time = dict.fromkeys(STAGES, 0.0)   # moving averages in s
+        self.total_time = 0.0
+        self.worst_time = 0.0
+        self.scans = 0
+        self.points_in = 0
+        self.low_quality = 0
+        self.outliers = 0
+        self.over_budget = 0
+        self.skipped = 0
+
+    def __call__(self, polar):
+        return self.filter(polar)
+
+    def _timed(self, stage, start):
+        now = time.perf_counter()
+        self.stage_time[stage] += (now - start - self.stage_time[stage]) * TIMING_DECAY
+        return now
+
+    def filter(self, polar):
+        """Filtered copy of an (n, 3) polar scan with zero distances already removed."""
+        start = t = time.perf_counter()
+        self.scans += 1
+        self.points_in += len(polar)
+        deadline = start + self.budget
+
+        keep = polar[:, QUALITY] >= self.min_quality
+        self.low_quality += int(len(polar) - keep.sum())
+        polar = polar[keep]
+        t = self._timed("quality", t)
+
+        if t < deadline and len(polar) >= MIN_WINDOW:
+            polar = polar[np.argsort(polar[:, ANGLE], kind="stable")]
+            dist = polar[:, DIST]
+            median = angular_median(dist, self.window)
+            keep = np.abs(dist - median) <= np.maximum(self.min_deviation, self.relative * median)
+            self.outliers += int(len(polar) - keep.sum())
+            polar = polar[keep]
+            t = self._timed("outliers", t)
+            self._adapt_window()
+        elif len(polar) >= MIN_WINDOW:
+            self.skipped += 1
+
+        if t < deadline and self.smoothing < 1.0 and len(polar):
+            polar = polar.copy()
+            b = (polar[:, ANGLE] * (self.bins / 360.0)).astype(np.int64) % self.bins
+            dist = polar[:, DIST]
+            old = self.ema[b]
+            steady = self.valid[b] & (np.abs(dist - old) <= self.reset_mm)
+            smoothed = np.where(steady, old + (dist - old) * self.smoothing, dist)
+            # several returns in one bin: the last one becomes the bin state
+            self.ema[b] = smoothed
+            self.valid[b] = True
+            polar[:, DIST] = smoothed
+            t = self._timed("smoothing", t)
+        elif len(polar) and self.smoothing < 1.0:
+            self.skipped += 1
+
+        elapsed = t - start
+        self.total_time += (elapsed - self.total_time) * TIMING_DECAY
+        self.worst_time = max(self.worst_time, elapsed)
+        if elapsed > self.budget: self.over_budget += 1
+        return polar
+
+    def _adapt_window(self):
+        share = self.stage_time["outliers"] / self.budget
+        if share > OUTLIER_SHARE and self.window > MIN_WINDOW: self.window -= 2
+        elif share < OUTLIER_SHARE / 2 and self.window < self.max_window: self.window += 2
+
+    def reset(self):
+        """Forgets the smoothing state, e.g. after a reconnect."""
+        self.valid[:] = False
+
+    def stats(self):
+        return {"scans": self.scans, "points": self.points_in, "low_quality": self.low_quality,
+                "outliers": self.outliers, "over_budget": self.over_budget, "skipped": self.skipped,
+                "window": self.window, "mean_ms": self.total_time * 1000.0, "worst_ms": self.worst_time * 1000.0,
+                **{f"{stage}_ms": t * 1000.0 for stage, t in self.stage_time.items()}}
+
+    def summary(self):
+        return ("filter {mean_ms:.2f}/{worst_ms:.2f} ms, {outliers} outliers, {low_quality} low quality, "
+                "{over_budget} over budget, window {window}").format(**self.stats())
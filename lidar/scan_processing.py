@@ -0,0 +1,49 @@
+"""Vectorized conversion of RPLidar scans into contiguous float32 arrays.
+
+Both drivers yield scans as lists of (quality, angle_deg, distance_mm). One
+np.asarray call replaces the per-measurement math.radians/cos/sin loop.
+"""
+import numpy as np
+
+# Columns of a polar array
+QUALITY, ANGLE, DIST = 0, 1, 2
+# Columns of a cartesian array (distance kept for colouring)
+X, Y, D = 0, 1, 2
+
+
+def scan_to_polar(scan):
+    """(n, 3) float32 array of quality, angle (deg), distance (mm)."""
+    if len(scan) == 0:
+        return np.empty((0, 3), dtype=np.float32)
+    return np.asarray(scan, dtype=np.float32).reshape(-1, 3)
+
+
+def filter_polar(polar, min_quality=0, min_distance=0.0, max_distance=None):
+    """Drops zero/invalid distances, low quality returns and out of range hits."""
+    dist = polar[:, DIST]
+    mask = dist > min_distance
+    if min_quality > 0: mask &= polar[:, QUALITY] >= min_quality
+    if max_distance is not None: mask &= dist <= max_distance
+    return polar[mask]
+
+
+def polar_to_cartesian(polar, out=None):
+    """(n, 3) float32 array of x, y, distance in mm."""
+    n = len(polar)
+    if out is None: out = np.empty((n, 3), dtype=np.float32)
+    rad = np.deg2rad(polar[:, ANGLE])
+    dist = polar[:, DIST]
+    np.multiply(dist, np.cos(rad), out=out[:n, X])
+    np.multiply(dist, np.sin(rad), out=out[:n, Y])
+    out[:n, D] = dist
+    return out[:n]
+
+
+def process_scan(scan, min_quality=0, max_distance=None, scan_filter=None):
+    """One iter_scans batch -> contiguous (n, 3) float32 x, y, distance.
+
+    `scan_filter` (a scan_filter.ScanFilter) cleans the polar scan before conversion.
+    """
+    polar = filter_polar(scan_to_polar(scan), min_quality=min_quality, max_distance=max_distance)
+    if scan_filter is not None: polar = scan_filter(polar)
+    return polar_to_cartesian(polar)
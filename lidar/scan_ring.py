@@ -0,0 +1,74 @@
+"""Single-producer / single-consumer scan handoff without locks.
+
+The lidar thread writes each scan into a preallocated NumPy slab and then
+publishes its sequence number; the render loop reads slab views directly.
+Each slot carries the sequence number it holds (-1 while being written),
+so a reader can tell a finished scan from one that is being overwritten
+under it (seqlock style). Only the producer writes `write_seq`, `overruns`
+and `truncated`; only the consumer writes `read_seq`, `dropped` and `torn`.
+"""
+import numpy as np
+
+RING_SLOTS = 8
+MAX_SCAN_POINTS = 2048
+
+
+class ScanRing:
+    def __init__(self, slots=RING_SLOTS, max_points=MAX_SCAN_POINTS, columns=3):
+        self.slots = slots
+        self.max_points = max_points
+        self.data = np.zeros((slots, max_points, columns), dtype=np.float32)
+        self.counts = np.zeros(slots, dtype=np.int64)
+        self.seqs = np.full(slots, -1, dtype=np.int64)
+        self.write_seq = 0
+        self.read_seq = 0
+        self.overruns = 0   # scans published over one the consumer had not read yet
+        self.truncated = 0  # scans clipped to max_points
+        self.dropped = 0    # scans the consumer never got to see
+        self.torn = 0       # scans overwritten while the consumer was using them
+
+    # Producer side
+    def publish(self, points):
+        seq = self.write_seq
+        slot = seq % self.slots
+        if seq - self.read_seq >= self.slots: self.overruns += 1
+        n = len(points)
+        if n > self.max_points:
+            self.truncated += 1
+            n = self.max_points
+        self.seqs[slot] = -1
+        self.data[slot, :n] = points[:n]
+        self.counts[slot] = n
+        self.seqs[slot] = seq
+        self.write_seq = seq + 1
+
+    # Consumer side
+    def read_new(self):
+        """Yields (seq, points) for completed scans not seen yet, oldest first.
+
+        `points` is a view into the ring, valid until the generator resumes.
+        """
+        end = self.write_seq
+        start = self.read_seq
+        if end - start > self.slots:
+            self.dropped += end - start - self.slots
+            start = end - self.slots
+        self.read_seq = end
+        for seq in range(start, end):
+            slot = seq % self.slots
+            if self.seqs[slot] != seq:
+                self.dropped += 1
+                continue
+            yield seq, self.data[slot, :self.counts[slot]]
+            if self.seqs[slot] != seq: self.torn += 1
+
+    def latest(self):
+        """Newest completed scan as (seq, view), or (None, None); does not advance read_seq."""
+        for seq in range(self.write_seq - 1, max(self.write_seq - 1 - self.slots, -1), -1):
+            slot = seq % self.slots
+            if self.seqs[slot] == seq: return seq, self.data[slot, :self.counts[slot]]
+        return None, None
+
+    def stats(self):
+        return {"published": self.write_seq, "overruns": self.overruns, "truncated": self.truncated,
+                "dropped": self.dropped, "torn": self.torn}
@@ -0,0 +1,286 @@
+"""Streams scans and motor telemetry from the Pi to a workstation over TCP.
+
+The drone only reads the serial ports and sends compact frames; fusion and
+rendering happen on the subscriber (the viewer with a tcp:// source). Every
+frame is a FRAME_HEADER (magic, kind, flags, seq, monotonic seconds, rows,
+payload bytes) followed by the payload:
+
+    KIND_SCAN    (n, 3) x, y, distance in mm: float32, or int16 mm with
+                 FLAG_QUANTIZED, row-to-row differences with FLAG_DELTA
+                 (consecutive points of a rotation are close, so zlib packs
+                 them well), deflated with FLAG_ZLIB
+    KIND_MOTORS  (n, 6) float32 throttle, pitch, FL, FR, RL, RR
+
+Each subscriber has a short queue; when it falls behind the oldest frames
+are dropped instead of letting latency grow.
+
+    python3 streaming.py serve [--driver adafruit|rplidar|async] [--lidar-port /dev/ttyUSB0]
+                         [--esp-port /dev/ttyUSB1] [--listen 0.0.0.0:5600] [--raw] [--zlib] [--filter]
+    python3 streaming.py loopback [--scans 200] [--raw] [--zlib]   # fake lidar, local subscriber
+"""
+import argparse
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from acquisition import run_acquisition
+from telemetry import TelemetryReader, ScanStamper, ESP_BAUDRATE
+from scan_filter import ScanFilter
+
+MAGIC = b"GM"
+FRAME_HEADER = struct.Struct("<2sBBIdII")
+KIND_SCAN, KIND_MOTORS = 1, 2
+FLAG_QUANTIZED, FLAG_DELTA, FLAG_ZLIB = 1, 2, 4
+SCAN_COLUMNS, MOTOR_COLUMNS = 3, 6
+DEFAULT_PORT = 5600
+CLIENT_QUEUE_FRAMES = 32
+ZLIB_LEVEL = 1
+
+
+class StreamError(Exception):
+    pass
+
+
+def encode_frame(kind, seq, stamp, array, flags=0):
+    """Header + payload bytes for one frame; only scans honour `flags`."""
+    array = np.asarray(array, dtype=np.float32)
+    if kind != KIND_SCAN: flags = 0
+    if flags & FLAG_QUANTIZED:
+        data = np.clip(np.rint(array), -32768, 32767).astype(np.int16)
+        # int16 differences wrap around and the cumsum on decode wraps back
+        if flags & FLAG_DELTA and len(data): data = np.diff(data, axis=0, prepend=np.zeros((1, data.shape[1]), np.int16))
+    else:
+        flags &= ~(FLAG_QUANTIZED | FLAG_DELTA)
+        data = array
+    payload = np.ascontiguousarray(data).tobytes()
+    if flags & FLAG_ZLIB: payload = zlib.compress(payload, ZLIB_LEVEL)
+    return FRAME_HEADER.pack(MAGIC, kind, flags, seq, stamp, len(array), len(payload)) + payload
+
+
+def decode_payload(kind, flags, rows, payload):
+    """(rows, columns) float32 array of a frame payload."""
+    columns = SCAN_COLUMNS if kind == KIND_SCAN else MOTOR_COLUMNS
+    if flags & FLAG_ZLIB: payload = zlib.decompress(payload)
+    if flags & FLAG_QUANTIZED:
+        data = np.frombuffer(payload, dtype=np.int16).reshape(rows, columns)
+        if flags & FLAG_DELTA: data = np.cumsum(data, axis=0, dtype=np.int16)
+        return data.astype(np.float32)
+    return np.frombuffer(payload, dtype=np.float32).reshape(rows, columns).copy()
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:])
+        if n == 0: return None
+        got += n
+    return bytes(buffer)
+
+
+def read_frames(sock):
+    """Yields (kind, seq, stamp, array) until the publisher closes the connection."""
+    while True:
+        header = _recv_exact(sock, FRAME_HEADER.size)
+        if header is None: return
+        magic, kind, flags, seq, stamp, rows, size = FRAME_HEADER.unpack(header)
+        if magic != MAGIC: raise StreamError(f"bad frame magic {magic!r}")
+        payload = _recv_exact(sock, size)
+        if payload is None: return
+        yield kind, seq, stamp, decode_payload(kind, flags, rows, payload)
+
+
+def parse_address(address, default_host="localhost"):
+    """("host", port) from "tcp://host:port", "host:port", ":port" or "host"."""
+    if address.startswith("tcp://"): address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+class _Client:
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.frames = queue.Queue(CLIENT_QUEUE_FRAMES)
+        self.dropped = 0
+        self.alive = True
+        self.thread = threading.Thread(target=self._send, daemon=True)
+        self.thread.start()
+
+    def offer(self, frame):
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _send(self):
+        try:
+            while self.alive:
+                frame = self.frames.get()
+                if frame is None: break
+                self.sock.sendall(frame)
+        except OSError:
+            pass
+        finally:
+            self.alive = False
+            self.sock.close()
+
+
+class StreamPublisher:
+    """Serves frames to any number of subscribers.
+
+    Stands in for a ScanRing (`publish`) in run_acquisition and for the
+    events queue (`put`) of ScanStamper and TelemetryReader.
+    """
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT, flags=FLAG_QUANTIZED | FLAG_DELTA):
+        self.flags = flags
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.clients = []
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.sent_bytes = 0
+        self.published = 0
+        self.reconnects = 0
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print(f"Streaming: subscriber {address[0]}:{address[1]} connected")
+            with self.lock: self.clients.append(_Client(sock, address))
+
+    def _send(self, kind, stamp, array):
+        with self.lock:
+            self.clients = [c for c in self.clients if c.alive]
+            if not self.clients: return
+            frame = encode_frame(kind, self.seq, stamp, array, self.flags)
+            self.seq += 1
+            for client in self.clients: client.offer(frame)
+            self.sent_bytes += len(frame)
+
+    def publish(self, points):
+        self.published += 1
+        self._send(KIND_SCAN, time.monotonic(), points)
+
+    def put(self, event):
+        kind, stamp, data = event
+        if kind == "scan": self.published += 1
+        self._send(KIND_SCAN if kind == "scan" else KIND_MOTORS, stamp, data)
+
+    def stats(self):
+        with self.lock:
+            return {"published": self.published, "subscribers": len(self.clients), "sent_bytes": self.sent_bytes,
+                    "dropped": sum(c.dropped for c in self.clients), "reconnects": self.reconnects}
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for client in self.clients:
+                client.alive = False
+                client.offer(None)
+
+
+def serve(driver, lidar_port, lidar_baudrate, esp_port=None, esp_baudrate=ESP_BAUDRATE, listen=":5600",
+          flags=FLAG_QUANTIZED | FLAG_DELTA, stop_event=None, scan_filter=None):
+    """Publishes lidar scans (and ESP32 telemetry when `esp_port` is given) until interrupted."""
+    host, port = parse_address(listen, default_host="0.0.0.0")
+    publisher = StreamPublisher(host, port, flags)
+    stop_event = stop_event or threading.Event()
+    lidar = threading.Thread(target=run_acquisition, daemon=True,
+                             args=(ScanStamper(publisher), driver, lidar_port, lidar_baudrate, stop_event, scan_filter))
+    lidar.start()
+    if esp_port: TelemetryReader(esp_port, esp_baudrate, publisher, stop_event).start()
+    print(f"Streaming {driver} lidar on {lidar_port} on {host}:{publisher.address[1]}. Ctrl+C to stop.")
+    try:
+        while not stop_event.wait(5.0):
+            print("Streaming: {published} scans, {subscribers} subscribers, {sent_bytes} bytes, {dropped} dropped"
+                  .format(**publisher.stats()))
+            if scan_filter is not None: print(f"Streaming: {scan_filter.summary()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        lidar.join(5.0)
+        publisher.close()
+
+
+def loopback(scans=200, flags=FLAG_QUANTIZED | FLAG_DELTA):
+    """Streams the fake lidar to a local subscriber; checks the points and reports size and latency."""
+    import fake_lidar
+    from scan_processing import process_scan
+    fake_lidar.install(realtime=True, max_scans=scans)
+    publisher = StreamPublisher("127.0.0.1", 0, flags)
+    sock = socket.create_connection(publisher.address)
+    while not publisher.stats()["subscribers"]: time.sleep(0.01)
+    stop_event = threading.Event()
+    reader = threading.Thread(target=run_acquisition, daemon=True,
+                              args=(publisher, "rplidar", "loopback", 115200, stop_event))
+    reader.start()
+    received, latencies, error = 0, [], 0.0
+    # a second fake lidar replays the same synthetic scans to compare against
+    reference = fake_lidar.FakeRPLidar()
+    reference.realtime = False
+    reference_scans = reference.iter_scans()
+    sock.settimeout(5.0)
+    try:
+        for kind, seq, stamp, points in read_frames(sock):
+            latencies.append(time.monotonic() - stamp)
+            exact = process_scan(next(reference_scans))
+            error = max(error, float(np.abs(points - exact).max()) if len(points) else 0.0)
+            received += 1
+            if received == scans: break
+    except socket.timeout:
+        pass
+    stop_event.set()
+    sent = publisher.stats()["sent_bytes"]
+    publisher.close(); sock.close()
+    lat = np.array(latencies) * 1000.0
+    print(f"{received}/{scans} scans, {sent / max(received, 1):.0f} bytes/scan, max error {error:.2f} mm, "
+          f"latency p50 {np.percentile(lat, 50):.2f} ms p99 {np.percentile(lat, 99):.2f} ms")
+    return received, error
+
+
+def _flags(args):
+    flags = 0 if args.raw else FLAG_QUANTIZED | FLAG_DELTA
+    return flags | (FLAG_ZLIB if args.zlib else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream lidar scans and motor telemetry over TCP.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    s = sub.add_parser("serve")
+    s.add_argument("--driver", default="adafruit", choices=("adafruit", "rplidar", "async"))
+    s.add_argument("--lidar-port", default="/dev/ttyUSB0")
+    s.add_argument("--lidar-baudrate", type=int)
+    s.add_argument("--esp-port", help="also stream ESP32 motor telemetry (needs pyserial)")
+    s.add_argument("--esp-baudrate", type=int, default=ESP_BAUDRATE)
+    s.add_argument("--listen", default=f"0.0.0.0:{DEFAULT_PORT}")
+    s.add_argument("--filter", action="store_true", help="remove speckle and smooth ranges before sending")
+    l = sub.add_parser("loopback")
+    l.add_argument("--scans", type=int, default=200)
+    for p in (s, l):
+        p.add_argument("--raw", action="store_true", help="send float32 scans instead of delta coded int16 mm")
+        p.add_argument("--zlib", action="store_true", help="deflate scan payloads")
+    args = parser.parse_args()
+    if args.mode == "loopback":
+        loopback(args.scans, _flags(args))
+    else:
+        baudrate = args.lidar_baudrate or (256000 if args.driver == "adafruit" else 115200)
+        serve(args.driver, args.lidar_port, baudrate, args.esp_port, args.esp_baudrate, args.listen, _flags(args),
+              scan_filter=ScanFilter() if args.filter else None)
@@ -0,0 +1,370 @@
+"""Asyncio lidar reader that resyncs on the packet stream instead of reconnecting.
+
+The driver loops (acquisition.run_acquisition, test3.py) answer every
+RPLidarException by sleeping 1-2 s and rebuilding the driver, so one bad
+byte mid-flight costs several seconds of map. LidarSupervisor speaks the A1M8
+scan protocol itself: the port is read non-blocking from an event loop and
+the 5-byte measurement packets are checked and decoded with NumPy. Faults
+are handled in escalating steps:
+
+    bad packet   skip bytes until two consecutive packets pass their check
+                 bits again (a resync; the scan in progress is kept)
+    stall        no valid packet for `stall_timeout`: STOP + SCAN again on
+                 the open port
+    port error   reopen the port, also after `max_restarts` stalls in a row
+
+Only repeated failures without a complete scan in between back off,
+exponentially from `backoff` up to `max_backoff`. stats() reports resyncs,
+restarts, dropped bytes and measurements and the time from each fault to
+the next complete scan. Uses loop.add_reader, so POSIX only.
+
+    python3 supervisor.py [port] [baudrate]          # reads a real lidar, prints stats
+    python3 supervisor.py faults [--scans 300]        # against fake_lidar.FaultyDevice
+"""
+import asyncio
+import collections
+import sys
+import threading
+import time
+import numpy as np
+from scan_processing import process_scan
+
+CMD_STOP = b"\xa5\x25"
+CMD_SCAN = b"\xa5\x20"
+SCAN_DESCRIPTOR = b"\xa5\x5a\x05\x00\x00\x40\x81"
+PACKET = 5
+MAX_ANGLE_Q6 = 360 * 64
+MIN_SCAN_LEN = 5
+READ_SIZE = 4096
+POLL_INTERVAL = 0.05
+# The A1 sends ~2000 packets/s, so this much silence means it has hung
+STALL_TIMEOUT = 0.3
+# The A1 ignores commands for ~1 ms after STOP
+STOP_SETTLE = 0.002
+BACKOFF = 0.05
+MAX_BACKOFF = 2.0
+MAX_RESTARTS = 3
+RECOVERY_HISTORY = 256
+EMPTY_PACKETS = np.zeros((0, PACKET), dtype=np.uint8)
+
+
+class LidarStalled(Exception):
+    pass
+
+
+def packet_mask(rows):
+    """Rows of (n, 5) packet bytes whose start/inverse-start and check bits hold and whose angle is < 360."""
+    b0, b1 = rows[:, 0], rows[:, 1]
+    angle = (b1 >> 1).astype(np.uint16) | (rows[:, 2].astype(np.uint16) << 7)
+    return (((b0 ^ (b0 >> 1)) & b1 & 1) == 1) & (angle < MAX_ANGLE_Q6)
+
+
+def decode_packets(rows):
+    """(n, 5) packets -> ((n, 3) float32 quality, angle, distance as iter_scans gives them; start flags)."""
+    out = np.empty((len(rows), 3), dtype=np.float32)
+    out[:, 0] = rows[:, 0] >> 2
+    out[:, 1] = ((rows[:, 1] >> 1).astype(np.uint16) | (rows[:, 2].astype(np.uint16) << 7)) / np.float32(64.0)
+    out[:, 2] = (rows[:, 3].astype(np.uint16) | (rows[:, 4].astype(np.uint16) << 8)) / np.float32(4.0)
+    return out, (rows[:, 0] & 1) == 1
+
+
+def encode_packets(scan):
+    """(n, 3) quality, angle, distance -> packet bytes of one rotation, as the sensor sends them."""
+    scan = np.asarray(scan, dtype=np.float32).reshape(-1, 3)
+    start = np.zeros(len(scan), dtype=np.uint8)
+    start[:1] = 1
+    angle = np.rint(scan[:, 1] * 64.0).astype(np.int64) % MAX_ANGLE_Q6
+    dist = np.clip(np.rint(scan[:, 2] * 4.0), 0, 65535).astype(np.int64)
+    out = np.empty((len(scan), PACKET), dtype=np.uint8)
+    out[:, 0] = (np.clip(scan[:, 0], 0, 63).astype(np.uint8) << 2) | ((1 - start) << 1) | start
+    out[:, 1] = ((angle & 0x7F) << 1) | 1
+    out[:, 2] = angle >> 7
+    out[:, 3] = dist & 0xFF
+    out[:, 4] = dist >> 8
+    return out.tobytes()
+
+
+class PacketDecoder:
+    """Cuts a byte stream into valid measurement packets, skipping bytes that break the framing."""
+    def __init__(self):
+        self.buffer = b""
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def reset(self):
+        self.buffer = b""
+
+    def _next_sync(self, b, start):
+        """First offset >= start where two packets in a row pass, or None if the data runs out first."""
+        tail = b[start:]
+        candidates = len(tail) - 2 * PACKET + 1
+        if candidates <= 0: return None
+        valid = packet_mask(np.lib.stride_tricks.sliding_window_view(tail, PACKET))
+        hits = np.flatnonzero(valid[:candidates] & valid[PACKET:PACKET + candidates])
+        return start + int(hits[0]) if len(hits) else None
+
+    def feed(self, data):
+        """(n, 5) uint8 packets completed by `data`; a partial packet is kept for the next call."""
+        raw = self.buffer + data
+        b = np.frombuffer(raw, dtype=np.uint8)
+        chunks, pos = [], 0
+        while len(b) - pos >= PACKET:
+            n = (len(b) - pos) // PACKET
+            rows = b[pos:pos + n * PACKET].reshape(n, PACKET)
+            ok = packet_mask(rows)
+            good = n if ok.all() else int(ok.argmin())
+            if good:
+                chunks.append(rows[:good])
+                pos += good * PACKET
+                continue
+            sync = self._next_sync(b, pos + 1)
+            self.resyncs += 1
+            if sync is None:
+                # offsets that could still start a pair once more bytes arrive are kept
+                sync = max(pos + 1, len(b) - 2 * PACKET + 1)
+                self.dropped_bytes += sync - pos
+                pos = sync
+                break
+            self.dropped_bytes += sync - pos
+            pos = sync
+        self.buffer = raw[pos:]
+        if not chunks: return EMPTY_PACKETS
+        return chunks[0].copy() if len(chunks) == 1 else np.concatenate(chunks)
+
+
+class ScanAssembler:
+    """Collects decoded measurements into rotations split at the start flags, like iter_scans."""
+    def __init__(self, min_len=MIN_SCAN_LEN):
+        self.min_len = min_len
+        self.parts = []
+        self.count = 0
+        self.started = False
+
+    def _extend(self, measurements):
+        if self.started and len(measurements):
+            self.parts.append(measurements)
+            self.count += len(measurements)
+
+    def add(self, measurements, starts):
+        """Completed (n, 3) scans; measurements before the first start flag are ignored."""
+        scans, prev = [], 0
+        for edge in np.flatnonzero(starts):
+            self._extend(measurements[prev:edge])
+            prev = edge
+            if self.count >= self.min_len: scans.append(np.concatenate(self.parts))
+            self.parts, self.count, self.started = [], 0, True
+        self._extend(measurements[prev:])
+        return scans
+
+    def reset(self):
+        """Drops the rotation in progress; returns how many measurements it held."""
+        dropped = self.count
+        self.parts, self.count, self.started = [], 0, False
+        return dropped
+
+
+def open_serial(port, baudrate):
+    import serial
+    return serial.Serial(port, baudrate, timeout=0)
+
+
+class LidarSupervisor:
+    """Reads scans from ports made by `open_port()` and hands each (n, 3) scan to `on_scan`.
+
+    `on_restart` is called after every stall restart and reopen.
+    """
+    def __init__(self, open_port, on_scan, on_restart=None, stall_timeout=STALL_TIMEOUT, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF, max_restarts=MAX_RESTARTS):
+        self.open_port = open_port
+        self.on_scan = on_scan
+        self.on_restart = on_restart
+        self.stall_timeout = stall_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_restarts = max_restarts
+        self.decoder = PacketDecoder()
+        self.assembler = ScanAssembler()
+        self.scans = 0
+        self.measurements = 0
+        self.restarts = 0
+        self.reopens = 0
+        self.discarded = 0
+        self.failures = 0       # in a row, without a complete scan in between
+        self.fault_since = None
+        self.recovery = collections.deque(maxlen=RECOVERY_HISTORY)
+
+    def _fault(self):
+        if self.fault_since is None: self.fault_since = time.monotonic()
+
+    def _failed(self):
+        self._fault()
+        self.failures += 1
+        self.discarded += self.assembler.reset()
+        if self.on_restart is not None: self.on_restart()
+
+    def _publish(self, scans):
+        for scan in scans:
+            self.scans += 1
+            self.measurements += len(scan)
+            self.on_scan(scan)
+        if scans:
+            self.failures = 0
+            if self.fault_since is not None:
+                self.recovery.append(time.monotonic() - self.fault_since)
+                self.fault_since = None
+
+    def backoff_delay(self):
+        """No wait after a single failure, then doubling from `backoff`."""
+        if self.failures <= 1: return 0.0
+        return min(self.backoff * 2 ** (self.failures - 2), self.max_backoff)
+
+    async def _sleep(self, delay, stop_event):
+        end = time.monotonic() + delay
+        while not stop_event.is_set() and time.monotonic() < end:
+            await asyncio.sleep(min(POLL_INTERVAL, end - time.monotonic()))
+
+    async def run(self, stop_event):
+        """Until `stop_event` (anything with is_set()) is set."""
+        while not stop_event.is_set():
+            port = None
+            try:
+                port = self.open_port()
+                await self._serve(port, stop_event)
+            except Exception as e:
+                # SerialException is an OSError; other errors get the same reopen and backoff
+                if self.failures == 0 or isinstance(e, LidarStalled): print(f"Supervisor: {type(e).__name__}: {e}")
+                self.reopens += 1
+                if not isinstance(e, LidarStalled): self._failed()
+            finally:
+                if port is not None: close_port(port)
+            await self._sleep(self.backoff_delay(), stop_event)
+
+    async def _serve(self, port, stop_event):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        fd = port.fileno()
+        loop.add_reader(fd, ready.set)
+        try:
+            port.dtr = False   # A1 motor on
+            while not await self._stream(port, ready, stop_event):
+                self.restarts += 1
+                self._failed()
+                if self.failures > self.max_restarts:
+                    raise LidarStalled(f"no data after {self.max_restarts} restarts")
+                await self._sleep(self.backoff_delay(), stop_event)
+        finally:
+            loop.remove_reader(fd)
+
+    async def _stream(self, port, ready, stop_event):
+        """(Re)starts the scan on `port`; False once no valid packet arrived for `stall_timeout`."""
+        port.write(CMD_STOP)
+        await asyncio.sleep(STOP_SETTLE)
+        port.reset_input_buffer()
+        self.decoder.reset()
+        port.write(CMD_SCAN)
+        header = b""
+        last_valid = time.monotonic()
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(ready.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
+            data = port.read(READ_SIZE)
+            now = time.monotonic()
+            if data and header is not None:
+                header += data
+                i = header.find(SCAN_DESCRIPTOR)
+                if i < 0:
+                    header = header[-len(SCAN_DESCRIPTOR):]
+                    data = b""
+                else:
+                    data, header = header[i + len(SCAN_DESCRIPTOR):], None
+            if data:
+                resyncs = self.decoder.resyncs
+                packets = self.decoder.feed(data)
+                if self.decoder.resyncs != resyncs: self._fault()
+                if len(packets):
+                    last_valid = now
+                    self._publish(self.assembler.add(*decode_packets(packets)))
+            if now - last_valid > self.stall_timeout: return False
+        return True
+
+    def stats(self):
+        recovery = np.array(self.recovery) * 1000.0
+        return {"scans": self.scans, "measurements": self.measurements, "resyncs": self.decoder.resyncs,
+                "restarts": self.restarts, "reopens": self.reopens, "dropped_bytes": self.decoder.dropped_bytes,
+                "dropped_measurements": self.decoder.dropped_bytes // PACKET + self.discarded,
+                "recoveries": len(recovery),
+                "recovery_p50_ms": float(np.median(recovery)) if len(recovery) else 0.0,
+                "recovery_max_ms": float(recovery.max()) if len(recovery) else 0.0}
+
+    def summary(self):
+        return ("{scans} scans, {resyncs} resyncs, {restarts} restarts, {reopens} reopens, "
+                "{dropped_measurements} measurements dropped, recovery p50 {recovery_p50_ms:.0f} ms "
+                "max {recovery_max_ms:.0f} ms").format(**self.stats())
+
+
+def close_port(port):
+    try:
+        port.write(CMD_STOP)
+        port.dtr = True
+    except Exception:
+        pass
+    try:
+        port.close()
+    except Exception:
+        pass
+
+
+def run_supervised(ring, port, baudrate, stop_event, scan_filter=None, open_port=None):
+    """run_acquisition for the "async" driver: publishes scans into `ring` until `stop_event` is set."""
+    def on_scan(scan):
+        points = process_scan(scan, scan_filter=scan_filter)
+        if len(points): ring.publish(points)
+
+    def on_restart():
+        ring.reconnects += 1
+        if scan_filter is not None: scan_filter.reset()
+
+    supervisor = LidarSupervisor(open_port or (lambda: open_serial(port, baudrate)), on_scan, on_restart)
+    try:
+        asyncio.run(supervisor.run(stop_event))
+    finally:
+        print(f"Supervisor: {supervisor.summary()}")
+    return supervisor
+
+
+def fault_test(scans=300, faults=None, realtime=True):
+    """Runs the supervisor against a FaultyDevice until `scans` scans arrived; returns (supervisor, device)."""
+    from fake_lidar import FaultyDevice, DEFAULT_FAULTS
+    device = FaultyDevice(DEFAULT_FAULTS if faults is None else faults, realtime=realtime)
+    stop_event = threading.Event()
+    received = []
+
+    def on_scan(scan):
+        received.append(scan)
+        if len(received) >= scans: stop_event.set()
+
+    supervisor = LidarSupervisor(device.open, on_scan)
+    asyncio.run(supervisor.run(stop_event))
+    return supervisor, device
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "faults":
+        count = int(args[args.index("--scans") + 1]) if "--scans" in args else 300
+        supervisor, device = fault_test(count, realtime="--max-speed" not in args)
+        print(f"Injected: {device.injected}")
+        print(f"Supervisor: {supervisor.summary()}")
+    else:
+        port = args[0] if args else "/dev/ttyUSB0"
+        baudrate = int(args[1]) if len(args) > 1 else 115200
+        supervisor = LidarSupervisor(lambda: open_serial(port, baudrate), lambda scan: None)
+        print(f"Reading {port}. Ctrl+C to stop.")
+        try:
+            asyncio.run(supervisor.run(threading.Event()))
+        except KeyboardInterrupt:
+            pass
+        print(f"Supervisor: {supervisor.summary()}")
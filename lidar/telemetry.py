@@ -0,0 +1,229 @@
+"""Fuses ESP32 motor telemetry with lidar scans into a viewer .rbtsof file.
+
+The mixer sketch (hardware/motor_mixer_pid) prints a line every 100 ms:
+
+    Throt:1300 | InPitch:0.00 | FL:1350 FR:1350 RL:1250 RR:1250
+
+Two threads read the serial ports: the lidar through acquisition.run_acquisition
+and the ESP32 through TelemetryReader. The main thread stamps every point
+(spread over its scan's rotation), interpolates the four PWM channels at
+those times and appends batches to an RbtsofWriter, so the viewer gets
+motor data in its usual columns.
+
+    python3 telemetry.py flight.rbtsof [--driver adafruit|rplidar|async] [--lidar-port /dev/ttyUSB0]
+                         [--esp-port /dev/ttyUSB1] [--height 1.0] [--odometry] [--filter]
+"""
+import argparse
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import numpy as np
+from acquisition import run_acquisition, CRITICAL_ERROR_DELAY
+from scan_filter import ScanFilter
+from scan_processing import X, Y, D
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "visualization"))
+from rbtsof import RbtsofWriter, DEFAULT_PWM
+
+NUMBER = rb"\s*(-?\d+(?:\.\d*)?)"
+TELEMETRY_LINE = re.compile(rb"Throt:" + NUMBER + rb"\s*\|\s*InPitch:" + NUMBER + rb"\s*\|\s*FL:" + NUMBER +
+                            rb"\s+FR:" + NUMBER + rb"\s+RL:" + NUMBER + rb"\s+RR:" + NUMBER)
+# Columns of a parsed telemetry array
+THROTTLE, PITCH = 0, 1
+MOTORS = slice(2, 6)
+
+TELEMETRY_PERIOD = 0.1
+SCAN_PERIOD = 1 / 7.0
+SCAN_HEIGHT_M = 1.0
+MAX_DISTANCE_MM = 6000.0
+BATCH_POINTS = 65536
+ESP_BAUDRATE = 115200
+
+
+def parse_telemetry(buffer):
+    """Parses every complete telemetry line in `buffer`.
+
+    Returns ((n, 6) float64 throttle, pitch, FL, FR, RL, RR; bytes consumed).
+    Other output (status messages, partial lines) is skipped. All matches are
+    converted in one NumPy call instead of a float() per field.
+    """
+    end = buffer.rfind(b"\n") + 1
+    if end == 0: return np.zeros((0, 6)), 0
+    rows = TELEMETRY_LINE.findall(buffer, 0, end)
+    return np.array(rows, dtype="S16").astype(np.float64).reshape(-1, 6), end
+
+
+class TelemetryReader(threading.Thread):
+    """Reads the ESP32 port into `events` as ("motors", time, values) until `stop_event` is set."""
+    def __init__(self, port, baudrate, events, stop_event):
+        super().__init__(daemon=True)
+        self.port = port
+        self.baudrate = baudrate
+        self.events = events
+        self.stop_event = stop_event
+        self.reconnects = 0
+
+    def run(self):
+        import serial
+        while not self.stop_event.is_set():
+            try:
+                with serial.Serial(self.port, self.baudrate, timeout=0.1) as port:
+                    buffer = bytearray()
+                    while not self.stop_event.is_set():
+                        data = port.read(max(port.in_waiting, 1))
+                        if not data: continue
+                        stamp = time.monotonic()
+                        buffer += data
+                        values, used = parse_telemetry(buffer)
+                        del buffer[:used]
+                        if len(values): self.events.put(("motors", stamp, values))
+            except Exception as e:
+                print(f"Telemetry: {e}")
+                self.reconnects += 1
+                self.stop_event.wait(CRITICAL_ERROR_DELAY)
+
+
+class ScanStamper:
+    """Stands in for a ScanRing in run_acquisition, queueing each scan with its arrival time."""
+    def __init__(self, events):
+        self.events = events
+        self.reconnects = 0
+
+    def publish(self, points):
+        self.events.put(("scan", time.monotonic(), points))
+
+
+def distance_rgb(dist, max_distance=MAX_DISTANCE_MM):
+    """Blue near, red at `max_distance`, as in the live renderer."""
+    norm = np.clip(dist / max_distance, 0.0, 1.0)
+    return np.column_stack([norm, 1.0 - np.abs(norm - 0.5) * 2.0, 1.0 - norm]).astype(np.float32)
+
+
+class TelemetryFuser:
+    """Stamps scan points, interpolates motor PWM at their times and writes them in batches.
+
+    Points are held back until a motor sample newer than them has arrived, so
+    they are interpolated rather than extrapolated; flush(final=True) writes
+    the rest with the edge values.
+    """
+    def __init__(self, writer, height=SCAN_HEIGHT_M, matcher=None, batch_points=BATCH_POINTS):
+        self.writer = writer
+        self.height = height
+        self.matcher = matcher
+        self.batch_points = batch_points
+        self.t0 = None
+        self.last_scan = None
+        self.motor_times = np.zeros(0)
+        self.motor_pwm = np.zeros((0, 4))
+        self.pending = []
+        self.pending_count = 0
+        self.written = 0
+
+    def add_motors(self, stamp, values):
+        """Lines read together arrived TELEMETRY_PERIOD apart, the last one at `stamp`."""
+        n = len(values)
+        times = stamp - TELEMETRY_PERIOD * np.arange(n - 1, -1, -1)
+        self.motor_times = np.concatenate([self.motor_times, times])
+        self.motor_pwm = np.concatenate([self.motor_pwm, values[:, MOTORS]])
+
+    def add_scan(self, stamp, points):
+        n = len(points)
+        if n == 0: return
+        if self.t0 is None: self.t0 = stamp - SCAN_PERIOD
+        start = self.last_scan if self.last_scan is not None else stamp - SCAN_PERIOD
+        self.last_scan = stamp
+        # points arrive in rotation order over the time since the previous scan
+        times = start + (stamp - start) * (np.arange(1, n + 1) / n)
+        if self.matcher is not None:
+            from icp import transform_scan
+            points = transform_scan(points, self.matcher.update(points))
+        xyz = np.empty((n, 3), dtype=np.float32)
+        xyz[:, 0] = points[:, X] / 1000.0
+        xyz[:, 1] = self.height
+        xyz[:, 2] = points[:, Y] / 1000.0
+        self.pending.append((times, xyz, distance_rgb(points[:, D])))
+        self.pending_count += n
+        if self.pending_count >= self.batch_points: self.flush()
+
+    def flush(self, final=False):
+        if not self.pending: return
+        times = np.concatenate([p[0] for p in self.pending])
+        xyz = np.concatenate([p[1] for p in self.pending])
+        rgb = np.concatenate([p[2] for p in self.pending])
+        if final: ready = len(times)
+        elif len(self.motor_times): ready = int(np.searchsorted(times, self.motor_times[-1], side="right"))
+        else: ready = 0
+        if ready == 0: return
+        if len(self.motor_times):
+            pwm = np.column_stack([np.interp(times[:ready], self.motor_times, self.motor_pwm[:, c]) for c in range(4)])
+        else:
+            pwm = np.full((ready, 4), DEFAULT_PWM)
+        self.writer.append(xyz[:ready], rgb[:ready], times[:ready] - self.t0, pwm)
+        self.written += ready
+        self.pending = [(times[ready:], xyz[ready:], rgb[ready:])] if ready < len(times) else []
+        self.pending_count = len(times) - ready
+        # keep one sample before the oldest pending point for interpolation
+        keep = max(int(np.searchsorted(self.motor_times, times[ready - 1])) - 1, 0)
+        self.motor_times, self.motor_pwm = self.motor_times[keep:], self.motor_pwm[keep:]
+
+
+def run(output, driver, lidar_port, lidar_baudrate, esp_port, esp_baudrate=ESP_BAUDRATE,
+        height=SCAN_HEIGHT_M, odometry=False, scan_filter=None):
+    events = queue.Queue()
+    stop_event = threading.Event()
+    stamper = ScanStamper(events)
+    lidar = threading.Thread(target=run_acquisition, daemon=True,
+                             args=(stamper, driver, lidar_port, lidar_baudrate, stop_event, scan_filter))
+    esp = TelemetryReader(esp_port, esp_baudrate, events, stop_event)
+    matcher = None
+    if odometry:
+        from icp import ScanMatcher
+        matcher = ScanMatcher()
+    scans = samples = 0
+    with RbtsofWriter(output) as writer:
+        fuser = TelemetryFuser(writer, height, matcher)
+        lidar.start(); esp.start()
+        print(f"Recording {driver} lidar on {lidar_port} and telemetry on {esp_port} to {output}. Ctrl+C to stop.")
+        last_report = time.monotonic()
+        try:
+            while True:
+                try:
+                    kind, stamp, data = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if kind == "scan": fuser.add_scan(stamp, data); scans += 1
+                else: fuser.add_motors(stamp, data); samples += len(data)
+                if stamp - last_report > 5.0:
+                    print(f"{scans} scans, {samples} telemetry samples, {fuser.written} points written")
+                    last_report = stamp
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            lidar.join(5.0); esp.join(1.0)
+            while not events.empty():
+                kind, stamp, data = events.get()
+                if kind == "scan": fuser.add_scan(stamp, data)
+                else: fuser.add_motors(stamp, data)
+            fuser.flush(final=True)
+    print(f"Wrote {writer.count} points to {output}")
+    if scan_filter is not None: print(f"Scan filter: {scan_filter.summary()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record lidar scans fused with ESP32 motor telemetry.")
+    parser.add_argument("output")
+    parser.add_argument("--driver", default="adafruit", choices=("adafruit", "rplidar", "async"))
+    parser.add_argument("--lidar-port", default="/dev/ttyUSB0")
+    parser.add_argument("--lidar-baudrate", type=int)
+    parser.add_argument("--esp-port", default="/dev/ttyUSB1")
+    parser.add_argument("--esp-baudrate", type=int, default=ESP_BAUDRATE)
+    parser.add_argument("--height", type=float, default=SCAN_HEIGHT_M, help="lidar height above the floor in metres")
+    parser.add_argument("--odometry", action="store_true", help="place scans with ICP odometry")
+    parser.add_argument("--filter", action="store_true", help="remove speckle and smooth ranges (scan_filter.py)")
+    args = parser.parse_args()
+    baudrate = args.lidar_baudrate or (256000 if args.driver == "adafruit" else 115200)
+    run(args.output, args.driver, args.lidar_port, baudrate, args.esp_port, args.esp_baudrate,
+        args.height, args.odometry, ScanFilter() if args.filter else None)
@@ -1,25 +1,18 @@
 import os
-import math
 import pygame
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from rplidar import RPLidar
 import time
+from scan_processing import process_scan
 
 PORT_NAME = '/dev/ttyUSB0' 
 WINDOW_SIZE = (800, 600)
 MAX_DISTANCE_MM = 6000 # 6 m
 
 def process_data(scan):
-    """Converts polar (angle, dist) to cartesian (x, y)"""
-    points = []
-    for quality, angle, distance in scan:
-        if distance > 0:
-            angle_rad = math.radians(angle)
-            x = distance * math.cos(angle_rad)
-            y = distance * math.sin(angle_rad)
-            points.append((x, y))
-    return points
+    """Converts polar (angle, dist) to cartesian (x, y, dist) as one float32 array"""
+    return process_scan(scan)
 
 def init_opengl():
     """Sets up a 2D orthographic view for mapping"""
@@ -57,11 +50,14 @@ def run():
 
             points = process_data(scan)
             
-            glBegin(GL_POINTS)
             glColor3f(0.0, 1.0, 0.0)
-            for x, y in points:
-                glVertex2f(x, y)
+            if len(points):
+                glEnableClientState(GL_VERTEX_ARRAY)
+                glVertexPointer(2, GL_FLOAT, points.strides[0], points)
+                glDrawArrays(GL_POINTS, 0, len(points))
+                glDisableClientState(GL_VERTEX_ARRAY)
             
+            glBegin(GL_POINTS)
             glColor3f(1.0, 0.0, 0.0) 
             glVertex2f(0, 0)
             glEnd()
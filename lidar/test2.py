@@ -1,20 +1,34 @@
+import sys
 import math
 import time
 import threading
-import collections
-import colorsys
 import pygame
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from rplidar import RPLidar, RPLidarException
+from scan_processing import process_scan
+from live_renderer import ScanHistoryRenderer, VoxelMapRenderer
+from voxel_grid import VoxelGrid
+from icp import ScanMatcher, transform_scan
+from scan_ring import ScanRing
+from acquisition import AcquisitionProcess, SharedScanRing, SHM_NAME
+from profiling import Profiler
+from streaming import StreamPublisher
+from scan_filter import ScanFilter
 
 PORT_NAME = '/dev/ttyUSB0'
 BAUD_RATE = 115200 
 MAX_DISTANCE_MM = 4000
 WINDOW_SIZE = (1024, 768)
 HISTORY_SIZE = 30 
+VOXEL_SIZE_MM = 50
 
-scan_history = collections.deque(maxlen=HISTORY_SIZE)
+CAPTION = "Advanced Lidar Mapper V1.0"
+
+scan_ring = ScanRing()
+profiler = Profiler.from_argv(sys.argv)
+streamer = None
+scan_filter = ScanFilter() if "--filter" in sys.argv else None
 running = True
 
 class LidarThread(threading.Thread):
@@ -28,15 +42,11 @@ class LidarThread(threading.Thread):
             for scan in lidar.iter_scans(max_buf_meas=500):
                 if not running: break
                 
-                current_points = []
-                for _, angle, distance in scan:
-                    if distance > 0:
-                        rad = math.radians(angle)
-                        x = distance * math.cos(rad)
-                        y = distance * math.sin(rad)
-                        current_points.append((x, y, distance))
+                with profiler.stage("process_scan"): current_points = process_scan(scan, scan_filter=scan_filter)
                 
-                scan_history.append(current_points)
+                with profiler.stage("publish"): scan_ring.publish(current_points)
+                if streamer is not None:
+                    with profiler.stage("stream"): streamer.publish(current_points)
                 
         except RPLidarException as e:
             print(f"Lidar Error: {e}")
@@ -50,13 +60,6 @@ class LidarThread(threading.Thread):
             lidar.stop_motor()
             lidar.disconnect()
 
-def get_rainbow_color(distance, max_dist):
-    """Returns an RGB color based on distance (Heatmap style)"""
-    norm = min(distance, max_dist) / max_dist
-    hue = (1.0 - norm) * 0.66 
-    r, g, b = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-    return (r, g, b)
-
 def init_opengl():
     glClearColor(0.05, 0.05, 0.1, 1.0)
     glMatrixMode(GL_PROJECTION)
@@ -69,58 +72,94 @@ def init_opengl():
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
     glPointSize(2.0)
 
-def render():
+def render(renderer, voxel_map, ring, matcher=None):
     glClear(GL_COLOR_BUFFER_BIT)
     
+    for _, points in ring.read_new():
+        if matcher is not None:
+            with profiler.stage("icp"): points = transform_scan(points, matcher.update(points))
+        with profiler.stage("voxel_insert"): voxel_map.add_scan(points)
+        with profiler.stage("history_add"): renderer.add_scan(points)
+    with profiler.stage("gl_submit"):
+        voxel_map.draw()
+        renderer.draw()
+
+    glPushMatrix()
+    if matcher is not None:
+        x, y, theta = matcher.pose
+        glTranslatef(x, y, 0.0); glRotatef(math.degrees(theta), 0.0, 0.0, 1.0)
     glBegin(GL_TRIANGLES)
     glColor3f(1.0, 1.0, 1.0)
     glVertex2f(-50, -50)
     glVertex2f(50, -50)
     glVertex2f(0, 100)
     glEnd()
+    glPopMatrix()
 
-    current_history = list(scan_history) 
-    
-    for i, scan in enumerate(reversed(current_history)):
-        alpha = 1.0 - (i / HISTORY_SIZE)
-        if alpha <= 0: continue
+    with profiler.stage("swap"): pygame.display.flip()
 
-        glBegin(GL_POINTS)
-        for x, y, dist in scan:
-            r, g, b = get_rainbow_color(dist, MAX_DISTANCE_MM)
-            glColor4f(r, g, b, alpha)
-            glVertex2f(x, y)
-        glEnd()
+def start_acquisition():
+    """Reader thread by default, a child process with --process, or an already running acquisition.py with --attach.
 
-    pygame.display.flip()
+    With --serve the reader thread also streams its scans to viewers (see streaming.py).
+    """
+    global streamer
+    if "--attach" in sys.argv:
+        ring = SharedScanRing.attach(SHM_NAME)
+        return ring, ring.close
+    if "--process" in sys.argv:
+        acquisition = AcquisitionProcess("rplidar", PORT_NAME, BAUD_RATE, filtered=scan_filter is not None)
+        acquisition.start()
+        return acquisition.ring, acquisition.stop
+    if "--serve" in sys.argv: streamer = StreamPublisher()
+    lidar_thread = LidarThread()
+    lidar_thread.start()
+    return scan_ring, lidar_thread.join
 
 def main():
     global running
     
-    lidar_thread = LidarThread()
-    lidar_thread.start()
+    ring, stop_acquisition = start_acquisition()
 
     pygame.init()
     pygame.display.set_mode(WINDOW_SIZE, pygame.DOUBLEBUF | pygame.OPENGL)
-    pygame.display.set_caption("Advanced Lidar Mapper V1.0")
+    pygame.display.set_caption(CAPTION)
     init_opengl()
+    renderer = ScanHistoryRenderer(HISTORY_SIZE, MAX_DISTANCE_MM, mode=GL_POINTS)
+    voxel_map = VoxelMapRenderer(VoxelGrid(VOXEL_SIZE_MM, dims=2))
+    matcher = ScanMatcher() if "--odometry" in sys.argv else None
 
     clock = pygame.time.Clock()
+    frame = 0
     
     try:
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                    running = False
+            with profiler.stage("events"):
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                        running = False
             
-            render()
-            clock.tick(60)
+            with profiler.stage("render"): render(renderer, voxel_map, ring, matcher)
+            with profiler.stage("idle"): clock.tick(60)
+            profiler.frame()
+            frame += 1
+            if frame % 60 == 0:
+                caption = CAPTION + " | {published} scans, {dropped} dropped, {overruns} overruns".format(**ring.stats())
+                if scan_filter is not None: caption += " | " + scan_filter.summary()
+                if profiler.enabled: caption += " | " + profiler.summary()
+                pygame.display.set_caption(caption)
             
     except KeyboardInterrupt:
         pass
     finally:
         running = False
-        lidar_thread.join()
+        print(f"Scan ring: {ring.stats()}")
+        if scan_filter is not None: print(f"Scan filter: {scan_filter.stats()}")
+        if profiler.enabled: print(f"Stages (p50/p99): {profiler.summary()}")
+        trace = profiler.save()
+        if trace: print(f"Chrome trace written to {trace}")
+        stop_acquisition()
+        if streamer is not None: streamer.close()
         pygame.quit()
 
 if __name__ == '__main__':
@@ -0,0 +1,152 @@
+"""Sparse voxel occupancy grid backed by a vectorized open-addressing hash.
+
+Points are binned at a fixed resolution; each occupied voxel keeps a hit
+count and optional per-channel sums (e.g. colour). Voxels are stored in
+insertion order, so their centers only ever get appended and a renderer
+can upload new ones incrementally. Memory grows with the mapped volume,
+not with the number of points inserted.
+"""
+import numpy as np
+
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+EMPTY = -1
+MAX_LOAD = 0.5
+HASH_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _grow(array, size):
+    """Returns `array` with room for `size` rows (doubling), preserving contents."""
+    if size <= len(array): return array
+    new = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    new[:len(array)] = array
+    return new
+
+
+class VoxelGrid:
+    def __init__(self, resolution, dims=3, channels=0, capacity=1 << 12):
+        self.resolution = float(resolution)
+        self.dims = dims
+        self.channels = channels
+        self.size = 0
+        self._alloc_table(capacity)
+        self._cells = np.zeros((capacity, dims), dtype=np.int32)
+        self._centers = np.zeros((capacity, dims), dtype=np.float32)
+        self._hits = np.zeros(capacity, dtype=np.int64)
+        self._sums = np.zeros((capacity, channels), dtype=np.float64)
+        self._means = np.zeros((capacity, channels), dtype=np.float32)
+
+    # Views over the occupied voxels, in insertion order
+    @property
+    def centers(self): return self._centers[:self.size]
+    @property
+    def hits(self): return self._hits[:self.size]
+    @property
+    def means(self): return self._means[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def memory_bytes(self):
+        arrays = (self.table_keys, self.table_ids, self._cells, self._centers, self._hits, self._sums, self._means)
+        return sum(a.nbytes for a in arrays)
+
+    def _alloc_table(self, capacity):
+        bits = max(int(capacity - 1).bit_length(), 4)
+        self.table_bits = bits
+        self.table_keys = np.full(1 << bits, EMPTY, dtype=np.int64)
+        self.table_ids = np.zeros(1 << bits, dtype=np.int64)
+
+    def _slots(self, keys):
+        return ((keys.astype(np.uint64) * HASH_MULT) >> np.uint64(64 - self.table_bits)).astype(np.int64)
+
+    def _place(self, keys, ids):
+        """Writes distinct, absent keys into the table with linear probing."""
+        mask = (1 << self.table_bits) - 1
+        slots = self._slots(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slots[pending]
+            free = self.table_keys[s] == EMPTY
+            # several keys may race for one free slot; the first wins, the rest probe on
+            _, first = np.unique(s[free], return_index=True)
+            winners = pending[free][first]
+            self.table_keys[slots[winners]] = keys[winners]
+            self.table_ids[slots[winners]] = ids[winners]
+            won = np.zeros(len(pending), dtype=bool)
+            won[np.nonzero(free)[0][first]] = True
+            pending = pending[~won]
+            slots[pending] = (slots[pending] + 1) & mask
+
+    def _lookup(self, keys):
+        """Voxel id per key, or -1 when absent."""
+        mask = (1 << self.table_bits) - 1
+        ids = np.full(len(keys), -1, dtype=np.int64)
+        slots = self._slots(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            s = slots[pending]
+            tk = self.table_keys[s]
+            found = tk == keys[pending]
+            ids[pending[found]] = self.table_ids[s[found]]
+            pending = pending[~found & (tk != EMPTY)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return ids
+
+    def _rehash(self, capacity):
+        self._alloc_table(capacity)
+        if self.size: self._place(self._pack(self._cells[:self.size]), np.arange(self.size))
+
+    def _pack(self, cells):
+        c = cells.astype(np.int64) + KEY_OFFSET
+        key = c[:, 0]
+        for d in range(1, self.dims): key = (key << KEY_BITS) | c[:, d]
+        return key
+
+    def cells_of(self, points):
+        return np.floor(np.asarray(points, dtype=np.float64)[:, :self.dims] / self.resolution).astype(np.int32)
+
+    def insert(self, points, values=None):
+        """Adds a batch; returns (index of the first new voxel, ids of all touched voxels)."""
+        first_new = self.size
+        if len(points) == 0: return first_new, np.zeros(0, dtype=np.int64)
+        cells = self.cells_of(points)
+        keys, first, inverse = np.unique(self._pack(cells), return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        ids = self._lookup(keys)
+
+        new = ids < 0
+        n_new = int(new.sum())
+        if n_new:
+            if (self.size + n_new) > MAX_LOAD * len(self.table_keys):
+                self._rehash(int((self.size + n_new) / MAX_LOAD) * 2)
+            new_ids = np.arange(self.size, self.size + n_new)
+            ids[new] = new_ids
+            end = self.size + n_new
+            self._cells = _grow(self._cells, end)
+            self._centers = _grow(self._centers, end)
+            self._hits = _grow(self._hits, end)
+            self._sums = _grow(self._sums, end)
+            self._means = _grow(self._means, end)
+            self._hits[self.size:end] = 0
+            self._sums[self.size:end] = 0
+            self._cells[self.size:end] = cells[first[new]]
+            self._centers[self.size:end] = (cells[first[new]] + 0.5) * self.resolution
+            self._place(keys[new], new_ids)
+            self.size = end
+
+        self._hits[ids] += np.bincount(inverse, minlength=len(keys))
+        if self.channels and values is not None:
+            values = np.asarray(values, dtype=np.float64)
+            for c in range(self.channels):
+                self._sums[ids, c] += np.bincount(inverse, weights=values[:, c], minlength=len(keys))
+            self._means[ids] = self._sums[ids] / self._hits[ids, None]
+        return first_new, ids
+
+    def occupied(self, min_hits=1):
+        """Ids of voxels hit at least `min_hits` times."""
+        return np.nonzero(self.hits >= min_hits)[0]
+
+    def clear(self):
+        self.size = 0
+        self.table_keys[:] = EMPTY
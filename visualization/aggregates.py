@@ -0,0 +1,84 @@
+"""Streaming aggregates for the analytics panel.
+
+Both structures only ever look at the slice of points revealed (or hidden)
+since the previous frame, so their cost per frame does not depend on how
+much of the scan has been played.
+"""
+import numpy as np
+
+
+class StreamingHistogram:
+    """Running bin counts; matches np.histogram over everything added so far."""
+    def __init__(self, bins=50, value_range=(0.0, 5.0)):
+        self.bins = bins
+        self.range = value_range
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def add(self, values):
+        if len(values): self.counts += np.histogram(values, bins=self.bins, range=self.range)[0]
+
+    def remove(self, values):
+        if len(values): self.counts -= np.histogram(values, bins=self.bins, range=self.range)[0]
+
+    def reset(self, counts=None):
+        self.counts[:] = 0 if counts is None else counts
+
+    def as_float(self):
+        return self.counts.astype(np.float32)
+
+
+class MotorRing:
+    """Fixed-size per-channel ring of motor PWM samples.
+
+    `values` rows are drawn with imgui.plot_lines(values_offset=head), so
+    pushing a sample never shifts memory. Mean is kept as a running sum.
+    """
+    def __init__(self, channels=4, size=100, fill=1500.0):
+        self.channels = channels
+        self.size = size
+        self.fill = fill
+        self.values = np.full((channels, size), fill, dtype=np.float32)
+        self.head = 0
+        self.sums = self.values.sum(axis=1, dtype=np.float64)
+
+    @property
+    def latest(self):
+        return self.values[:, (self.head - 1) % self.size]
+
+    def push(self, sample):
+        old = self.values[:, self.head].astype(np.float64)
+        self.values[:, self.head] = sample
+        self.sums += self.values[:, self.head] - old
+        self.head = (self.head + 1) % self.size
+
+    def rewind(self, n):
+        """Drops the newest `n` samples, padding the oldest end with `fill`."""
+        n = min(n, self.size)
+        for _ in range(n):
+            self.head = (self.head - 1) % self.size
+            self.sums += self.fill - self.values[:, self.head]
+            self.values[:, self.head] = self.fill
+
+    def seek(self, motor_data, end, step):
+        """Rebuilds the window as averages of `size` blocks of `step` points ending at `end`."""
+        step = max(int(step), 1)
+        blocks = min(end // step, self.size)
+        window = motor_data[end - blocks * step:end].reshape(blocks, step, self.channels)
+        self.load(window.mean(axis=1))
+
+    def load(self, samples):
+        """Replaces the window with the newest `size` rows of `samples` (oldest first)."""
+        samples = samples[len(samples) - min(len(samples), self.size):]
+        self.values[:] = self.fill
+        if len(samples): self.values[:, self.size - len(samples):] = np.asarray(samples).T
+        self.head = 0
+        self.sums = self.values.sum(axis=1, dtype=np.float64)
+
+    def reset(self):
+        self.values[:] = self.fill
+        self.head = 0
+        self.sums = self.values.sum(axis=1, dtype=np.float64)
+
+    def window_stats(self):
+        """Per-channel (min, mean, max) over the window."""
+        return self.values.min(axis=1), self.sums / self.size, self.values.max(axis=1)
@@ -0,0 +1,190 @@
+"""Background loader streaming a .rbtsof file into growable column buffers.
+
+The viewer can start playing as soon as the first chunk lands: `loaded` only
+moves forward after a chunk's rows are fully written, so `[:loaded]` of every
+column is always safe to read from the UI thread. Chunks are read in
+timestamp order (binary files by their chunk index, text files in file
+order) and the loader stops reading once it is `read_ahead` points ahead of what
+the consumer has reported with `consume`. This limits read-ahead only, not
+memory: played rows stay resident, since the viewer keeps drawing and
+querying every point up to the playback position and seeks back over them,
+so memory grows with playback up to the whole file. Columns are held compactly (see quantize.py): fixed-point
+positions, uint8 colors, float32 timestamps and uint16 PWM.
+
+The bounds and last timestamp are tracked while loading; a summary cached
+by an earlier complete load (see file_summary.py) supplies them, the point
+count and the motor flag before the first chunk is read.
+"""
+import itertools
+import os
+import threading
+import numpy as np
+import rbtsof
+from quantize import PointEncoding, FixedPoints, encode_colors, encode_pwm
+from file_summary import load_summary
+
+READ_AHEAD = 4_000_000
+TEXT_CHUNK_ROWS = 65536
+
+
+def grow_rows(array, size):
+    """Returns `array` with room for `size` rows (doubling), preserving contents."""
+    if size <= len(array): return array
+    new = np.empty((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    new[:len(array)] = array
+    return new
+
+
+def _binary_chunks(rb, chunk_size):
+    """(points, colors, timestamps, motors or None) slices of a binary file, by chunk start time."""
+    if rb.chunks is not None:
+        ranges = [(int(c["start"]), int(c["start"] + c["count"])) for c in np.sort(rb.chunks, order="t_min")]
+    else:
+        ranges = [(s, min(s + chunk_size, rb.count)) for s in range(0, rb.count, chunk_size)]
+    for s, e in ranges:
+        yield rb.points[s:e], rb.colors[s:e], rb.timestamps[s:e], rb.motor_data[s:e] if rb.has_motors else None
+
+
+def _text_chunks(filename, rows):
+    with open(filename, "r") as f:
+        while True:
+            # loadtxt warns when handed the end of the file, so check for it first
+            first = f.readline()
+            if not first: return
+            data = np.loadtxt(itertools.chain((first,), f), dtype=np.float32, ndmin=2, max_rows=rows)
+            if len(data) == 0: continue
+            if data.shape[1] < 7:
+                raise ValueError(f"{filename}: expected at least 7 columns, found {data.shape[1]}")
+            yield data[:, 0:3], data[:, 3:6], data[:, 6], data[:, 7:11] if data.shape[1] >= 11 else None
+
+
+def iter_chunks(filename, chunk_size=rbtsof.DEFAULT_CHUNK_SIZE):
+    """Column slices of a binary or text .rbtsof file, in timestamp order."""
+    if rbtsof.is_rbtsof(filename): return _binary_chunks(rbtsof.RbtsofFile(filename), chunk_size)
+    return _text_chunks(filename, chunk_size)
+
+
+def _estimate_rows(filename):
+    """Row count of a text file guessed from its size and first line."""
+    with open(filename, "rb") as f:
+        first = f.readline()
+    return os.path.getsize(filename) // max(len(first), 1) + 1
+
+
+class ChunkLoader:
+    live = False
+    summary_key = None
+    summary = None
+
+    def __init__(self, filename, read_ahead=READ_AHEAD, chunk_size=rbtsof.DEFAULT_CHUNK_SIZE):
+        self.filename = filename
+        self.read_ahead = read_ahead
+        self.binary = rbtsof.is_rbtsof(filename)
+        self.summary_key, summary = load_summary(filename)
+        self.summary = summary
+        if self.binary:
+            rb = rbtsof.RbtsofFile(filename)
+            self.total = rb.count
+            self.has_motors = rb.has_motors
+            self.chunks = _binary_chunks(rb, chunk_size)
+            capacity = self.total
+            if rb.chunks is not None and len(rb.chunks):
+                encoding = PointEncoding.for_bounds(rb.chunks["bbox_min"].min(axis=0), rb.chunks["bbox_max"].max(axis=0))
+            elif summary is not None:
+                encoding = PointEncoding.for_bounds(summary.bbox_min, summary.bbox_max)
+            else:
+                encoding = PointEncoding.unbounded()
+        elif summary is not None:
+            self.total = summary.count
+            self.has_motors = summary.has_motors
+            self.chunks = _text_chunks(filename, TEXT_CHUNK_ROWS)
+            capacity = summary.count
+            encoding = PointEncoding.for_bounds(summary.bbox_min, summary.bbox_max)
+        else:
+            self.total = None
+            self.has_motors = None
+            self.chunks = _text_chunks(filename, TEXT_CHUNK_ROWS)
+            capacity = _estimate_rows(filename)
+            encoding = PointEncoding.unbounded()
+        self._init_buffers(capacity, encoding)
+
+    def _init_buffers(self, capacity, encoding):
+        # np.empty only commits pages once they are written
+        capacity = max(capacity, 1)
+        self.points = FixedPoints.empty(capacity, encoding)
+        self.colors = np.empty((capacity, 3), dtype=np.uint8)
+        self.timestamps = np.empty(capacity, dtype=np.float32)
+        self.motor_data = np.empty((capacity, 4), dtype=np.uint16)
+        self.loaded = 0
+        self.bbox_min = np.full(3, np.inf, dtype=np.float32)
+        self.bbox_max = np.full(3, -np.inf, dtype=np.float32)
+        self.t_max = -np.inf
+        self.consumed = 0
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def capacity(self):
+        return len(self.points)
+
+    @property
+    def encoding(self):
+        return self.points.encoding
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def consume(self, count):
+        """Reports how far playback has got; the loader may read `read_ahead` points past it."""
+        if count <= self.consumed: return
+        with self.cond:
+            self.consumed = count
+            self.cond.notify()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def _wait_for_room(self):
+        with self.cond:
+            while self.read_ahead is not None and self.loaded - self.consumed >= self.read_ahead and not self.cancelled:
+                self.cond.wait()
+        return not self.cancelled
+
+    def _append(self, points, colors, timestamps, motors):
+        s, e = self.loaded, self.loaded + len(points)
+        if e > self.capacity:
+            self.points = FixedPoints(grow_rows(self.points.q, e), self.encoding)
+            self.colors = grow_rows(self.colors, e)
+            self.timestamps = grow_rows(self.timestamps, e)
+            self.motor_data = grow_rows(self.motor_data, e)
+        self.points[s:e] = points
+        self.colors[s:e] = encode_colors(colors)
+        self.timestamps[s:e] = timestamps
+        if motors is None: self.motor_data[s:e] = rbtsof.DEFAULT_PWM
+        else: self.motor_data[s:e] = encode_pwm(motors)
+        if self.has_motors is None: self.has_motors = motors is not None
+        if e > s:
+            np.minimum(self.bbox_min, points.min(axis=0), out=self.bbox_min)
+            np.maximum(self.bbox_max, points.max(axis=0), out=self.bbox_max)
+            self.t_max = max(self.t_max, float(timestamps.max()))
+        self.loaded = e
+
+    def _run(self):
+        try:
+            for chunk in self.chunks:
+                if not self._wait_for_room(): return
+                self._append(*chunk)
+            self.total = self.loaded
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
@@ -0,0 +1,73 @@
+"""Per-file summaries cached next to the data, so a reopened file starts with what the last load derived.
+
+<file>.summary.npz holds the point count, whether motor data is present,
+the bounding box, the last timestamp and the Timeline keyframes (height
+histogram snapshots and motor block means). With it a text file gets its
+exact capacity and an int16 encoding up front instead of an estimate and
+int32, and the keyframes need not be rebuilt while loading.
+
+The key hashes the file's size, mtime and its first and last SAMPLE_BYTES;
+hashing the whole file would take about as long as loading it. A summary
+whose key or version does not match is ignored and rewritten after the next
+complete load.
+"""
+import hashlib
+import os
+import numpy as np
+
+SUFFIX = ".summary.npz"
+VERSION = 1
+SAMPLE_BYTES = 1 << 16
+
+
+class FileSummary:
+    def __init__(self, count, has_motors, bbox_min, bbox_max, t_max, keyframes, block_means, layout):
+        self.count = int(count)
+        self.has_motors = bool(has_motors)
+        self.bbox_min = np.asarray(bbox_min, dtype=np.float32)
+        self.bbox_max = np.asarray(bbox_max, dtype=np.float32)
+        self.t_max = float(t_max)
+        self.keyframes = keyframes
+        self.block_means = block_means
+        self.layout = tuple(float(v) for v in layout)
+
+
+def summary_path(filename):
+    return filename + SUFFIX
+
+
+def summary_key(filename):
+    st = os.stat(filename)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.array([st.st_size, st.st_mtime_ns, VERSION], dtype=np.int64).tobytes())
+    with open(filename, "rb") as f:
+        h.update(f.read(SAMPLE_BYTES))
+        if st.st_size > 2 * SAMPLE_BYTES: f.seek(st.st_size - SAMPLE_BYTES)
+        h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def load_summary(filename):
+    """(key, FileSummary or None) for `filename`; the key is what save_summary needs later."""
+    key = summary_key(filename)
+    try:
+        with np.load(summary_path(filename)) as data:
+            if str(data["key"]) != key: return key, None
+            return key, FileSummary(data["count"], data["has_motors"], data["bbox_min"], data["bbox_max"],
+                                    data["t_max"], data["keyframes"], data["block_means"], data["layout"])
+    except (OSError, KeyError, ValueError):
+        return key, None
+
+
+def save_summary(filename, key, summary):
+    """Writes the sidecar atomically; a read-only data directory just means no cache."""
+    path = summary_path(filename)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, key=key, count=summary.count, has_motors=summary.has_motors,
+                     bbox_min=summary.bbox_min, bbox_max=summary.bbox_max, t_max=summary.t_max,
+                     keyframes=summary.keyframes, block_means=summary.block_means, layout=summary.layout)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not cache the summary of {filename}: {e}")
@@ -0,0 +1,52 @@
+"""Distance-to-drone heatmap, evaluated per vertex on the GPU.
+
+The drone position is a single uniform, so moving it costs nothing on the CPU
+no matter how many points are visible. `heatmap_rgb` (heatmap_colors.py) is
+the NumPy twin of the shader, used when GLSL is unavailable.
+"""
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from heatmap_colors import HEAT_MIN_DIST, HEAT_RANGE
+
+VERTEX_SRC = """
+#version 120
+uniform vec3 drone_pos;
+uniform float heat_min;
+uniform float heat_range;
+varying vec4 heat_color;
+void main() {
+    gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+    float n = clamp((distance(gl_Vertex.xyz, drone_pos) - heat_min) / heat_range, 0.0, 1.0);
+    heat_color = vec4(n, 1.0 - abs(n - 0.5) * 2.0, 1.0 - n, 1.0);
+}
+"""
+
+FRAGMENT_SRC = """
+#version 120
+varying vec4 heat_color;
+void main() {
+    gl_FragColor = heat_color;
+}
+"""
+
+
+class HeatmapShader:
+    def __init__(self):
+        self.program = shaders.compileProgram(
+            shaders.compileShader(VERTEX_SRC, GL_VERTEX_SHADER),
+            shaders.compileShader(FRAGMENT_SRC, GL_FRAGMENT_SHADER))
+        self.drone_loc = glGetUniformLocation(self.program, "drone_pos")
+        self.min_loc = glGetUniformLocation(self.program, "heat_min")
+        self.range_loc = glGetUniformLocation(self.program, "heat_range")
+
+    def use(self, drone_pos, encoding=None):
+        """Binds the program; with a PointEncoding, distances are measured in its fixed-point units."""
+        step = 1.0
+        if encoding is not None: drone_pos, step = encoding.to_local(drone_pos), encoding.step
+        glUseProgram(self.program)
+        glUniform3f(self.drone_loc, *drone_pos)
+        glUniform1f(self.min_loc, HEAT_MIN_DIST / step)
+        glUniform1f(self.range_loc, HEAT_RANGE / step)
+
+    def release(self):
+        glUseProgram(0)
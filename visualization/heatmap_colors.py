@@ -0,0 +1,21 @@
+"""Distance-to-drone heatmap colours on the CPU.
+
+The NumPy twin of the shader in heatmap.py, kept free of OpenGL so headless
+rendering (software_render.py) can import it without a GL installation.
+"""
+import numpy as np
+
+HEAT_MIN_DIST = 1.0
+HEAT_RANGE = 14.0
+
+
+def heatmap_rgb(points, drone_pos, out=None):
+    """CPU version of the shader; writes into `out` (float, or uint8 scaled to 0-255) when given."""
+    dists = np.linalg.norm(points - np.asarray(drone_pos, dtype=np.float32), axis=1)
+    norm = np.clip((dists - HEAT_MIN_DIST) / HEAT_RANGE, 0.0, 1.0)
+    if out is None: out = np.empty((len(points), 3), dtype=np.float32)
+    full = 255.0 if out.dtype == np.uint8 else 1.0
+    out[:, 0] = norm * full
+    out[:, 1] = (1.0 - np.abs(norm - 0.5) * 2.0) * full
+    out[:, 2] = (1.0 - norm) * full
+    return out
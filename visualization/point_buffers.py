@@ -0,0 +1,129 @@
+"""GPU-resident point storage for the viewer.
+
+Positions are static once recorded, so they are appended to a vertex buffer
+as `visible_count` grows and never sent again. Colors live in a second buffer
+that is patched in place for whatever range the CPU side marks dirty. An
+optional element buffer (from SpatialIndex) lets culled/LOD'd subsets be
+drawn as index ranges.
+
+With a PointEncoding the position buffer holds the fixed-point integers
+(FixedPoints.q) and the draw calls wrap them in a translate/scale, so the
+GPU does the decoding. Colors are always uploaded as uint8.
+"""
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from quantize import encode_colors
+
+COLOR_BYTES = 3
+GL_POSITION_TYPES = {np.dtype(np.float32): GL_FLOAT, np.dtype(np.int16): GL_SHORT, np.dtype(np.int32): GL_INT}
+
+
+class PointBuffers:
+    def __init__(self, capacity=0, encoding=None):
+        self.encoding = encoding
+        self.position_dtype = np.dtype(np.float32) if encoding is None else encoding.dtype
+        self.point_bytes = 3 * self.position_dtype.itemsize
+        self.position_vbo, self.color_vbo = glGenBuffers(2)
+        self.element_vbo = None
+        self.capacity = 0
+        self.uploaded = 0
+        self.dirty_start = None
+        self.dirty_end = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        """(Re)creates both buffers; existing contents are dropped."""
+        self.capacity = max(int(capacity), 1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * self.point_bytes, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity * COLOR_BYTES, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded = 0
+        self.dirty_start, self.dirty_end = None, 0
+
+    def ensure_capacity(self, count, points):
+        """Grows (doubling) when `count` no longer fits and re-uploads what was there."""
+        if count <= self.capacity: return
+        uploaded = self.uploaded
+        self.allocate(max(count, self.capacity * 2))
+        self.append_points(points, uploaded)
+        self.mark_dirty(0, uploaded)
+
+    def append_points(self, points, count):
+        """Uploads positions in [uploaded, count); earlier points are already resident.
+
+        `points` is a FixedPoints in this buffer's encoding, or float positions without one.
+        """
+        count = min(count, self.capacity)
+        if count <= self.uploaded: return
+        s = self.uploaded
+        raw = points.q if self.encoding is not None else points
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, s * self.point_bytes, np.ascontiguousarray(raw[s:count], dtype=self.position_dtype))
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded = count
+
+    def mark_dirty(self, start, end):
+        if end <= start: return
+        if self.dirty_start is None:
+            self.dirty_start, self.dirty_end = start, end
+        else:
+            self.dirty_start, self.dirty_end = min(self.dirty_start, start), max(self.dirty_end, end)
+
+    def flush_colors(self, colors):
+        """Uploads the dirty color range collected since the last flush."""
+        if self.dirty_start is None: return
+        s, e = self.dirty_start, min(self.dirty_end, self.capacity)
+        if e > s:
+            glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo)
+            rgb = colors[s:e]
+            if rgb.dtype != np.uint8: rgb = encode_colors(rgb)
+            glBufferSubData(GL_ARRAY_BUFFER, s * COLOR_BYTES, np.ascontiguousarray(rgb))
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.dirty_start, self.dirty_end = None, 0
+
+    def _bind(self):
+        if self.encoding is not None:
+            # decode fixed-point positions in the vertex transform
+            glPushMatrix(); glTranslatef(*self.encoding.origin); glScalef(*(self.encoding.step,) * 3)
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_vbo)
+        glVertexPointer(3, GL_POSITION_TYPES[self.position_dtype], 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, self.color_vbo); glColorPointer(3, GL_UNSIGNED_BYTE, 0, None)
+
+    def _unbind(self):
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY); glDisableClientState(GL_COLOR_ARRAY)
+        if self.encoding is not None: glPopMatrix()
+
+    def draw(self, count, first=0):
+        count = min(count, self.uploaded) - first
+        if count <= 0: return
+        self._bind()
+        glDrawArrays(GL_POINTS, first, count)
+        self._unbind()
+
+    def upload_elements(self, order):
+        """Uploads a uint32 point order once; draw_ranges then indexes into it."""
+        if self.element_vbo is None: self.element_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.element_vbo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, np.ascontiguousarray(order, dtype=np.uint32), GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw_ranges(self, firsts, counts):
+        """One glMultiDrawElements over element ranges [first, first + count)."""
+        if len(counts) == 0 or self.element_vbo is None: return
+        counts = np.ascontiguousarray(counts, dtype=np.int32)
+        offsets = np.ascontiguousarray(firsts, dtype=np.uintp) * 4
+        self._bind()
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.element_vbo)
+        glMultiDrawElements(GL_POINTS, counts, GL_UNSIGNED_INT,
+                            offsets.ctypes.data_as(ctypes.POINTER(ctypes.c_void_p)), len(counts))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        self._unbind()
+
+    def delete(self):
+        glDeleteBuffers(2, [self.position_vbo, self.color_vbo])
+        if self.element_vbo is not None: glDeleteBuffers(1, [self.element_vbo])
@@ -0,0 +1,118 @@
+"""Compact in-memory columns: fixed-point positions, uint8 colors, uint16 PWM.
+
+Positions are stored as integers relative to an origin (the cloud's or a
+tile's bounding box centre): point = origin + q * step. With known bounds
+int16 gives sub-millimetre steps for rooms and a few millimetres for whole
+sites; when bounds are unknown up front (text files, live streams) int32 at
+0.1 mm is used. The GPU takes the integers as-is and decodes them with a
+translate/scale around the draw, so only CPU consumers pay for decoding, and
+only for the rows they touch.
+"""
+import numpy as np
+
+INT16_MAX = 32767
+# Coarsest int16 step accepted before falling back to int32
+MAX_INT16_STEP = 0.002
+INT32_STEP = 1e-4
+PWM_MAX = 65535
+
+
+class PointEncoding:
+    def __init__(self, origin, step, dtype):
+        self.origin = np.asarray(origin, dtype=np.float32).reshape(3)
+        self.step = float(step)
+        self.dtype = np.dtype(dtype)
+        self.limit = np.iinfo(self.dtype).max
+
+    @classmethod
+    def for_bounds(cls, bbox_min, bbox_max):
+        """int16 around the box centre, or int32 when the box is too large for MAX_INT16_STEP."""
+        lo, hi = np.asarray(bbox_min, dtype=np.float64), np.asarray(bbox_max, dtype=np.float64)
+        step = max(float((hi - lo).max()) / 2 / (INT16_MAX - 1), 1e-6)
+        if step > MAX_INT16_STEP: return cls.unbounded((lo + hi) / 2)
+        return cls((lo + hi) / 2, step, np.int16)
+
+    @classmethod
+    def unbounded(cls, origin=(0.0, 0.0, 0.0)):
+        return cls(origin, INT32_STEP, np.int32)
+
+    def encode(self, points, columns=slice(None)):
+        q = np.rint((np.asarray(points, dtype=np.float32) - self.origin[columns]) * np.float32(1.0 / self.step))
+        return np.clip(q, -self.limit, self.limit).astype(self.dtype)
+
+    def decode(self, q, columns=slice(None)):
+        return q.astype(np.float32) * np.float32(self.step) + self.origin[columns]
+
+    def to_local(self, point):
+        """World position in encoded units, e.g. for shader uniforms."""
+        return (np.asarray(point, dtype=np.float64) - self.origin) / self.step
+
+
+class FixedColumn:
+    """Lazily decoded view of one coordinate; slicing decodes only the selected rows."""
+    def __init__(self, points, column):
+        self.points = points
+        self.column = column
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, rows):
+        return self.points.encoding.decode(self.points.q[rows, self.column], self.column)
+
+
+class FixedPoints:
+    """(n, 3) positions held as encoded integers; indexing returns decoded float32."""
+    def __init__(self, q, encoding):
+        self.q = q
+        self.encoding = encoding
+
+    @classmethod
+    def empty(cls, capacity, encoding):
+        return cls(np.empty((capacity, 3), dtype=encoding.dtype), encoding)
+
+    @classmethod
+    def encode(cls, points, encoding):
+        return cls(encoding.encode(points), encoding)
+
+    def __len__(self):
+        return len(self.q)
+
+    @property
+    def shape(self):
+        return self.q.shape
+
+    @property
+    def nbytes(self):
+        return self.q.nbytes
+
+    def __getitem__(self, key):
+        columns = key[1] if isinstance(key, tuple) else slice(None)
+        return self.encoding.decode(self.q[key], columns)
+
+    def __setitem__(self, rows, points):
+        self.q[rows] = self.encoding.encode(points)
+
+    def __array__(self, dtype=None, copy=None):
+        points = self.encoding.decode(self.q)
+        return points if dtype is None else points.astype(dtype, copy=False)
+
+    def head(self, count):
+        """The first `count` rows, sharing storage."""
+        return FixedPoints(self.q[:count], self.encoding)
+
+    def column(self, index):
+        return FixedColumn(self, index)
+
+
+def encode_colors(colors):
+    """[0, 1] float RGB -> uint8."""
+    return np.clip(np.rint(np.asarray(colors, dtype=np.float32) * 255.0), 0, 255).astype(np.uint8)
+
+
+def decode_colors(rgb):
+    return rgb.astype(np.float32) * np.float32(1 / 255.0)
+
+
+def encode_pwm(pwm):
+    return np.clip(np.rint(np.asarray(pwm, dtype=np.float32)), 0, PWM_MAX).astype(np.uint16)
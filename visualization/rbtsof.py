@@ -0,0 +1,287 @@
+"""Binary .rbtsof container: versioned header + fixed-dtype column blocks.
+
+Layout (little endian):
+    header (HEADER_SIZE bytes, see HEADER)
+    xyz        float32 (N, 3)
+    rgb        float32 (N, 3)
+    timestamp  float32 (N,)
+    motors     float32 (N, 4)   only if FLAG_MOTORS
+    chunk index CHUNK_DTYPE (n_chunks,)   only if FLAG_INDEX
+
+Every block starts on an ALIGN boundary so it can be np.memmap'ed directly.
+The legacy text layout (whitespace separated x y z r g b t, then four motor
+PWM columns when there are at least 11; further columns are ignored) is still
+readable and can be converted both ways from the command line:
+
+    python3 rbtsof.py to-bin room_scan.txt room_scan.rbtsof
+    python3 rbtsof.py to-text room_scan.rbtsof room_scan.txt
+"""
+import os
+import struct
+import sys
+import numpy as np
+
+MAGIC = b"RBTSOFB\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHHQIIdd5Q")
+HEADER_SIZE = 128
+ALIGN = 64
+
+FLAG_MOTORS = 1
+FLAG_INDEX = 2
+
+DEFAULT_CHUNK_SIZE = 65536
+TEXT_BATCH_ROWS = 1_000_000
+DEFAULT_PWM = 1500.0
+
+CHUNK_DTYPE = np.dtype([
+    ("start", "<u8"), ("count", "<u4"), ("pad", "<u4"),
+    ("t_min", "<f4"), ("t_max", "<f4"),
+    ("bbox_min", "<f4", (3,)), ("bbox_max", "<f4", (3,)),
+])
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(count, has_motors, n_chunks):
+    """Byte offsets of every column block for a file holding `count` points."""
+    xyz = HEADER_SIZE
+    rgb = _align(xyz + count * 12)
+    ts = _align(rgb + count * 12)
+    end = _align(ts + count * 4)
+    motors = 0
+    if has_motors:
+        motors = end
+        end = _align(motors + count * 16)
+    index = 0
+    if n_chunks:
+        index = end
+        end = index + n_chunks * CHUNK_DTYPE.itemsize
+    return xyz, rgb, ts, motors, index, end
+
+
+def is_rbtsof(filename):
+    """True if `filename` is a binary container (as opposed to the text layout)."""
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def build_chunk_index(points, timestamps, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Per-chunk time range and bounding box, used for seeking and culling."""
+    count = len(points)
+    n_chunks = (count + chunk_size - 1) // chunk_size
+    index = np.zeros(n_chunks, dtype=CHUNK_DTYPE)
+    for i in range(n_chunks):
+        s, e = i * chunk_size, min((i + 1) * chunk_size, count)
+        p = points[s:e]
+        index[i] = (s, e - s, 0, timestamps[s:e].min(), timestamps[s:e].max(), p.min(axis=0), p.max(axis=0))
+    return index
+
+
+class RbtsofFile:
+    """Read-only memory-mapped view over a binary .rbtsof file.
+
+    Nothing is read from the column blocks until it is sliced, so opening a
+    file costs the same regardless of its size.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError(f"{filename}: truncated header")
+        (magic, self.version, self.flags, self.count, self.chunk_size, n_chunks,
+         self.t_min, self.t_max, xyz, rgb, ts, motors, index) = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{filename}: not a binary rbtsof file")
+        if self.version > VERSION:
+            raise ValueError(f"{filename}: unsupported rbtsof version {self.version}")
+
+        n = self.count
+        self.points = self._map(xyz, np.float32, (n, 3))
+        self.colors = self._map(rgb, np.float32, (n, 3))
+        self.timestamps = self._map(ts, np.float32, (n,))
+        if self.flags & FLAG_MOTORS:
+            self.motor_data = self._map(motors, np.float32, (n, 4))
+        else:
+            self.motor_data = np.broadcast_to(np.float32(DEFAULT_PWM), (n, 4))
+        if self.flags & FLAG_INDEX and n_chunks:
+            self.chunks = self._map(index, CHUNK_DTYPE, (n_chunks,))
+        else:
+            self.chunks = None
+
+    @property
+    def has_motors(self):
+        return bool(self.flags & FLAG_MOTORS)
+
+    def _map(self, offset, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def create_rbtsof(filename, count, has_motors=True, chunk_size=DEFAULT_CHUNK_SIZE, with_index=True):
+    """Preallocates a file for `count` points and returns writable column memmaps."""
+    n_chunks = (count + chunk_size - 1) // chunk_size if with_index else 0
+    xyz, rgb, ts, motors, index, end = _layout(count, has_motors, n_chunks)
+    with open(filename, "wb") as f:
+        f.truncate(end)
+    cols = {
+        "points": np.memmap(filename, np.float32, "r+", xyz, (count, 3)) if count else np.zeros((0, 3), np.float32),
+        "colors": np.memmap(filename, np.float32, "r+", rgb, (count, 3)) if count else np.zeros((0, 3), np.float32),
+        "timestamps": np.memmap(filename, np.float32, "r+", ts, (count,)) if count else np.zeros(0, np.float32),
+        "motor_data": None,
+    }
+    if has_motors and count:
+        cols["motor_data"] = np.memmap(filename, np.float32, "r+", motors, (count, 4))
+    return cols
+
+
+def finalize_rbtsof(filename, count, has_motors=True, chunk_size=DEFAULT_CHUNK_SIZE, with_index=True):
+    """Writes the header (and chunk index) once all column data is in place."""
+    n_chunks = (count + chunk_size - 1) // chunk_size if with_index else 0
+    xyz, rgb, ts, motors, index, _ = _layout(count, has_motors, n_chunks)
+    t_min = t_max = 0.0
+    chunk_index = None
+    if count:
+        points = np.memmap(filename, np.float32, "r", xyz, (count, 3))
+        timestamps = np.memmap(filename, np.float32, "r", ts, (count,))
+        t_min, t_max = float(timestamps[0]), float(timestamps[-1])
+        if n_chunks:
+            chunk_index = build_chunk_index(points, timestamps, chunk_size)
+            t_min, t_max = float(chunk_index["t_min"].min()), float(chunk_index["t_max"].max())
+        del points, timestamps
+    flags = (FLAG_MOTORS if has_motors else 0) | (FLAG_INDEX if n_chunks else 0)
+    with open(filename, "r+b") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, flags, count, chunk_size, n_chunks,
+                            t_min, t_max, xyz, rgb, ts, motors, index))
+        if chunk_index is not None:
+            f.seek(index)
+            f.write(chunk_index.tobytes())
+
+
+def write_rbtsof(filename, points, colors, timestamps, motor_data=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, with_index=True):
+    """Writes in-memory arrays as a binary .rbtsof file."""
+    count = len(points)
+    has_motors = motor_data is not None
+    cols = create_rbtsof(filename, count, has_motors, chunk_size, with_index)
+    if count:
+        cols["points"][:] = points
+        cols["colors"][:] = colors
+        cols["timestamps"][:] = timestamps
+        if has_motors: cols["motor_data"][:] = motor_data
+        for col in cols.values():
+            if isinstance(col, np.memmap): col.flush()
+    del cols
+    finalize_rbtsof(filename, count, has_motors, chunk_size, with_index)
+
+
+class RbtsofWriter:
+    """Appends batches of rows to per-column spool files; close() assembles the container.
+
+    Columns have to be contiguous in the file, so the final layout can only be
+    written once the row count is known.
+    """
+    COLUMNS = (("points", 3), ("colors", 3), ("timestamps", 1), ("motor_data", 4))
+
+    def __init__(self, filename, has_motors=True, chunk_size=DEFAULT_CHUNK_SIZE, batch_rows=TEXT_BATCH_ROWS):
+        self.filename = filename
+        self.has_motors = has_motors
+        self.chunk_size = chunk_size
+        self.batch_rows = batch_rows
+        self.count = 0
+        names = [name for name, _ in self.COLUMNS if has_motors or name != "motor_data"]
+        self.spools = {name: open(f"{filename}.{name}.tmp", "wb") for name in names}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, points, colors, timestamps, motor_data=None):
+        columns = {"points": points, "colors": colors, "timestamps": timestamps, "motor_data": motor_data}
+        for name, f in self.spools.items():
+            f.write(np.ascontiguousarray(columns[name], dtype=np.float32).tobytes())
+        self.count += len(points)
+
+    def close(self):
+        if self.spools is None: return
+        for f in self.spools.values(): f.close()
+        cols = create_rbtsof(self.filename, self.count, self.has_motors, self.chunk_size)
+        for name, width in self.COLUMNS:
+            if name not in self.spools: continue
+            spool = f"{self.filename}.{name}.tmp"
+            if self.count:
+                src = np.memmap(spool, np.float32, "r", shape=(self.count, width) if width > 1 else (self.count,))
+                for s in range(0, self.count, self.batch_rows):
+                    cols[name][s:s + self.batch_rows] = src[s:s + self.batch_rows]
+                cols[name].flush()
+                del src
+            os.remove(spool)
+        del cols
+        finalize_rbtsof(self.filename, self.count, self.has_motors, self.chunk_size)
+        self.spools = None
+
+
+def _count_rows(filename):
+    rows = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            if line.strip() and not line.lstrip().startswith(b"#"): rows += 1
+    return rows
+
+
+def text_to_binary(src, dst, chunk_size=DEFAULT_CHUNK_SIZE, batch_rows=TEXT_BATCH_ROWS):
+    """Converts the legacy text layout without holding it all in RAM."""
+    count = _count_rows(src)
+    with open(src, "r") as f:
+        first = np.loadtxt(f, dtype=np.float32, ndmin=2, max_rows=1)
+    if count and first.shape[1] < 7:
+        raise ValueError(f"{src}: expected at least 7 columns, found {first.shape[1]}")
+    has_motors = count > 0 and first.shape[1] >= 11
+
+    cols = create_rbtsof(dst, count, has_motors, chunk_size)
+    done = 0
+    with open(src, "r") as f:
+        while done < count:
+            data = np.loadtxt(f, dtype=np.float32, ndmin=2, max_rows=batch_rows)
+            if len(data) == 0: break
+            s, e = done, done + len(data)
+            cols["points"][s:e] = data[:, 0:3]
+            cols["colors"][s:e] = data[:, 3:6]
+            cols["timestamps"][s:e] = data[:, 6]
+            if has_motors: cols["motor_data"][s:e] = data[:, 7:11]
+            done = e
+    for col in cols.values():
+        if isinstance(col, np.memmap): col.flush()
+    del cols
+    finalize_rbtsof(dst, count, has_motors, chunk_size)
+    return count
+
+
+def binary_to_text(src, dst, batch_rows=TEXT_BATCH_ROWS):
+    """Writes a binary file back out in the text layout (11 columns if it has motors)."""
+    rb = RbtsofFile(src)
+    with open(dst, "w") as f:
+        for s in range(0, rb.count, batch_rows):
+            e = min(s + batch_rows, rb.count)
+            cols = [rb.points[s:e], rb.colors[s:e], rb.timestamps[s:e, None]]
+            if rb.has_motors: cols.append(rb.motor_data[s:e])
+            np.savetxt(f, np.hstack(cols), fmt="%.6f")
+    return rb.count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("to-bin", "to-text"):
+        print("Usage: python3 rbtsof.py to-bin|to-text <src> <dst>")
+        sys.exit(1)
+    mode, src, dst = sys.argv[1:]
+    if os.path.abspath(src) == os.path.abspath(dst):
+        print("Source and destination must differ.")
+        sys.exit(1)
+    n = text_to_binary(src, dst) if mode == "to-bin" else binary_to_text(src, dst)
+    print(f"Converted {n} points: {src} -> {dst}")
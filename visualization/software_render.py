@@ -0,0 +1,210 @@
+"""Headless rendering of recorded flights with a NumPy point rasterizer.
+
+Reproduces what draw_scene shows (same perspective, camera transform, heatmap
+and drone marker) without a window or GL context, so flythroughs and
+thumbnails can be made on build boxes. Frames are rendered by a pool of
+worker processes that each memory-map the binary file; they are written as
+PNGs or piped in order to ffmpeg when it is installed. Started from the
+viewer:
+
+    python3 viewer.py flight1.rbtsof flight2.rbtsof --render out/ [--fps 30] [--size 1280x720]
+                      [--path fixed|orbit|follow] [--workers 8] [--video]
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+import zlib
+import numpy as np
+import rbtsof
+from heatmap_colors import heatmap_rgb
+
+FOVY = 60.0
+NEAR, FAR = 0.1, 1000.0
+CAM_POS = (0.0, -2.0, -12.0)
+MAX_RENDER_POINTS = 2_000_000
+DRONE_SIZE = 0.2
+LINE_SAMPLES = 64
+
+_files = {}
+
+
+def perspective(fovy, aspect, near, far):
+    """gluPerspective as a row-major matrix."""
+    f = 1.0 / math.tan(math.radians(fovy) / 2)
+    return np.array([[f / aspect, 0, 0, 0], [0, f, 0, 0],
+                     [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)], [0, 0, -1, 0]])
+
+
+def _rotation(angle_deg, axis):
+    c, s = math.cos(math.radians(angle_deg)), math.sin(math.radians(angle_deg))
+    m = np.eye(4)
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    m[i, i], m[i, j], m[j, i], m[j, j] = c, -s, s, c
+    return m
+
+
+def modelview(cam_pos, cam_rot):
+    """glTranslatef(*cam_pos); glRotatef(rot[0], 1, 0, 0); glRotatef(rot[1], 0, 1, 0)."""
+    t = np.eye(4)
+    t[:3, 3] = cam_pos
+    return t @ _rotation(cam_rot[0], 0) @ _rotation(cam_rot[1], 1)
+
+
+def segment_points(a, b, n=LINE_SAMPLES):
+    return np.linspace(a, b, n, dtype=np.float32)
+
+
+def drone_points(center, s=DRONE_SIZE):
+    """Edges of the wireframe cube draw_scene puts at the drone position."""
+    v = np.array([(-s, -s, -s), (s, -s, -s), (s, -s, s), (-s, -s, s),
+                  (-s, s, -s), (s, s, -s), (s, s, s), (-s, s, s)]) + np.asarray(center)
+    edges = [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7)]
+    return np.concatenate([segment_points(v[a], v[b], 16) for a, b in edges])
+
+
+def axes_points():
+    """(points, colors) of the 5 unit X/Y/Z axes."""
+    ends = np.eye(3, dtype=np.float32) * 5
+    points = np.concatenate([segment_points(np.zeros(3), end) for end in ends])
+    colors = np.repeat(np.eye(3, dtype=np.float32), LINE_SAMPLES, axis=0)
+    return points, colors
+
+
+def rasterize(points, colors, mvp, size, point_size=2, background=(0.0, 0.0, 0.0)):
+    """(h, w, 3) uint8 image of square point sprites, nearest point wins per pixel."""
+    w, h = size
+    image = np.empty((h, w, 3), dtype=np.uint8)
+    image[:] = np.clip(np.asarray(background) * 255, 0, 255).astype(np.uint8)
+    if len(points) == 0: return image
+    clip = np.asarray(points, dtype=np.float32) @ mvp[:3, :3].T.astype(np.float32) + mvp[:3, 3].astype(np.float32)
+    cw = np.asarray(points, dtype=np.float32) @ mvp[3, :3].astype(np.float32) + np.float32(mvp[3, 3])
+    keep = cw > NEAR
+    clip, cw, colors = clip[keep], cw[keep], np.asarray(colors)[keep]
+    ndc = clip / cw[:, None]
+    keep = (np.abs(ndc) <= 1.0).all(axis=1)
+    ndc, colors = ndc[keep], colors[keep]
+    # painter's order: farthest first, so nearer points overwrite them below
+    order = np.argsort(-ndc[:, 2], kind="stable")
+    ndc, rgb = ndc[order], np.clip(colors[order] * 255, 0, 255).astype(np.uint8)
+    px = np.minimum(((ndc[:, 0] + 1) * 0.5 * w).astype(np.int32), w - 1)
+    py = np.minimum(((1 - ndc[:, 1]) * 0.5 * h).astype(np.int32), h - 1)
+    # grow each point into a point_size x point_size square, like glPointSize; one row per point
+    # keeps the sprite pixels in depth order too, so overlapping sprites resolve like single pixels
+    offsets = np.arange(point_size, dtype=np.int32) - (point_size - 1) // 2
+    ox, oy = np.meshgrid(offsets, offsets)
+    x = px[:, None] + ox.ravel()
+    y = py[:, None] + oy.ravel()
+    inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    # with repeated indices the last assignment wins, i.e. the nearest point
+    image.reshape(-1, 3)[(y * w + x)[inside]] = np.broadcast_to(rgb[:, None], x.shape + (3,))[inside]
+    return image
+
+
+def write_png(path, image):
+    """Minimal RGB PNG writer (no imaging library needed)."""
+    h, w, _ = image.shape
+    raw = np.zeros((h, w * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(h, w * 3)
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def camera_at(path, frame, frames, drone_x):
+    """(cam_pos, cam_rot) for one frame of a camera path."""
+    if path == "orbit": return CAM_POS, (20.0, 360.0 * frame / frames)
+    if path == "follow": return (-drone_x, CAM_POS[1], CAM_POS[2] + 4.0), (15.0, 0.0)
+    return CAM_POS, (0.0, 0.0)
+
+
+def render_frame(job):
+    """Worker entry: renders one frame; writes a PNG or returns the raw RGB bytes."""
+    filename, frame, frames, opts, out = job
+    rb = _files.get(filename)
+    if rb is None: rb = _files[filename] = rbtsof.RbtsofFile(filename)
+    t = opts["duration"] * frame / max(frames - 1, 1)
+    visible = int(np.searchsorted(rb.timestamps, t * opts["speed"]))
+    step = max(1, math.ceil(visible / MAX_RENDER_POINTS))
+    points = np.asarray(rb.points[:visible:step])
+    drone = (opts["start_x"] + t * opts["speed"], 2.0, 0.0)
+    colors = heatmap_rgb(points, drone) if opts["heatmap"] else np.asarray(rb.colors[:visible:step])
+    axes, axes_colors = axes_points()
+    cube = drone_points(drone)
+    points = np.concatenate([points, axes, cube])
+    colors = np.concatenate([colors, axes_colors, np.tile([1.0, 0.0, 0.0], (len(cube), 1))])
+    cam_pos, cam_rot = camera_at(opts["path"], frame, frames, drone[0])
+    w, h = opts["size"]
+    mvp = perspective(FOVY, w / h, NEAR, FAR) @ modelview(cam_pos, cam_rot)
+    image = rasterize(points, colors, mvp, opts["size"], opts["point_size"])
+    if out is None: return image.tobytes()
+    write_png(out, image)
+    return None
+
+
+def render_batch(files, out_dir, start_x, end_x, speed=1.0, fps=30, size=(1280, 720), path="fixed",
+                 workers=None, video=False, heatmap=True, point_size=2):
+    """Renders every flight in `files`; returns the total number of frames written."""
+    os.makedirs(out_dir, exist_ok=True)
+    duration = (end_x - start_x) / speed
+    frames = max(int(duration * fps), 1)
+    opts = {"duration": duration, "speed": speed, "start_x": start_x, "path": path, "size": size,
+            "heatmap": heatmap, "point_size": point_size}
+    if video and shutil.which("ffmpeg") is None:
+        print("ffmpeg not found, writing PNG frames instead.")
+        video = False
+    written = 0
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp, multiprocessing.Pool(workers) as pool:
+        for filename in files:
+            name = os.path.splitext(os.path.basename(filename))[0]
+            if not rbtsof.is_rbtsof(filename):
+                # workers memory-map the columns, so text scans are converted once up front
+                converted = os.path.join(tmp, name + ".rbtsof")
+                rbtsof.text_to_binary(filename, converted)
+                filename = converted
+            if video:
+                encoder = subprocess.Popen(
+                    ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                     "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p",
+                     os.path.join(out_dir, name + ".mp4")], stdin=subprocess.PIPE)
+                jobs = [(filename, k, frames, opts, None) for k in range(frames)]
+                for raw in pool.imap(render_frame, jobs, chunksize=4): encoder.stdin.write(raw)
+                encoder.stdin.close(); encoder.wait()
+            else:
+                frame_dir = os.path.join(out_dir, name)
+                os.makedirs(frame_dir, exist_ok=True)
+                jobs = [(filename, k, frames, opts, os.path.join(frame_dir, f"{k:05d}.png")) for k in range(frames)]
+                for _ in pool.imap_unordered(render_frame, jobs, chunksize=4): pass
+            written += frames
+    elapsed = time.perf_counter() - started
+    print(f"{len(files)} flights, {written} frames in {elapsed:.1f} s "
+          f"({written / elapsed:.1f} fps, {len(files) * duration / elapsed:.1f}x real time)")
+    return written
+
+
+def main(argv, start_x, end_x):
+    parser = argparse.ArgumentParser(prog="viewer.py --render", description="Render flights without a window.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--render", required=True, metavar="OUT_DIR")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--path", choices=("fixed", "orbit", "follow"), default="fixed")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--point-size", type=int, default=2)
+    parser.add_argument("--no-heatmap", action="store_true")
+    parser.add_argument("--video", action="store_true", help="encode an mp4 per flight with ffmpeg")
+    args, _ = parser.parse_known_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    render_batch(args.files, args.render, start_x, end_x, args.speed, args.fps, size, args.path,
+                 args.workers, args.video, not args.no_heatmap, args.point_size)
@@ -0,0 +1,299 @@
+"""Fixed-size spatial cells with frustum culling and level-of-detail.
+
+Every point gets a cell (by position) and an LOD level (random, so each
+level is a uniform subsample). The element order sorts points by
+(cell, level) and keeps time order inside each bucket, so the revealed
+part of a bucket is always a prefix of its range and can be drawn with a
+single element range. Visible counts per bucket are updated incrementally
+from the slice of points revealed since the last frame. The index grows
+with the data: extended() bins only the rows added since it was built and
+merges them in at the end of their buckets.
+
+The same buckets answer point queries (radius, nearest, ray pick) over the
+revealed points: candidate cells are ranked by their bounding boxes and only
+the points of cells that can still hold a better answer are touched.
+"""
+import copy
+import numpy as np
+
+CELL_SIZE = 1.0
+# Cumulative fraction of a cell's points drawn with 1, 2, 3 or 4 levels
+LOD_FRACTIONS = (1 / 64, 1 / 16, 1 / 4, 1.0)
+# Beyond these camera distances one more level is dropped
+LOD_DISTANCES = (25.0, 50.0, 100.0)
+POINT_BUDGET = 2_000_000
+KEY_BITS = 21
+
+
+def frustum_planes(modelview, projection):
+    """(6, 4) plane equations from GL matrices as returned by glGetFloatv (column-major)."""
+    m = np.asarray(modelview, dtype=np.float64).reshape(4, 4) @ np.asarray(projection, dtype=np.float64).reshape(4, 4)
+    c = [m[:, i] for i in range(4)]
+    planes = np.array([c[3] + c[0], c[3] - c[0], c[3] + c[1], c[3] - c[1], c[3] + c[2], c[3] - c[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def boxes_in_frustum(planes, bbox_min, bbox_max):
+    """Mask of axis-aligned boxes at least partly inside all planes."""
+    normals, d = planes[:, :3], planes[:, 3]
+    # farthest corner along each plane normal
+    far = np.where(normals[None, :, :] > 0, bbox_max[:, None, :], bbox_min[:, None, :])
+    return ((far * normals[None]).sum(axis=2) + d >= 0).all(axis=1)
+
+
+def _ranges(starts, counts):
+    """Concatenation of arange(s, s + c) for every (s, c) pair."""
+    total = int(counts.sum())
+    if total == 0: return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return offsets + np.arange(total)
+
+
+def _batches(order):
+    """Slices of `order` doubling in size, so early exits touch few cells and long scans few Python steps."""
+    start, size = 0, 1
+    while start < len(order):
+        yield order[start:start + size]
+        start, size = start + size, size * 2
+
+
+def box_distance(bbox_min, bbox_max, point):
+    """Distance from `point` to each box (0 inside)."""
+    gap = np.maximum(np.maximum(bbox_min - point, point - bbox_max), 0.0)
+    return np.sqrt((gap * gap).sum(axis=1))
+
+
+def ray_box_entry(bbox_min, bbox_max, origin, direction):
+    """Ray parameter where it enters each box, inf where it misses (slab test)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv = 1.0 / direction
+        t0, t1 = (bbox_min - origin) * inv, (bbox_max - origin) * inv
+    near = np.nan_to_num(np.minimum(t0, t1), nan=-np.inf).max(axis=1)
+    far = np.nan_to_num(np.maximum(t0, t1), nan=np.inf).min(axis=1)
+    hit = (far >= np.maximum(near, 0.0))
+    return np.where(hit, np.maximum(near, 0.0), np.inf)
+
+
+def ray_hits(points, origin, direction, tolerance):
+    """(row, depth) of the nearest point within `tolerance` per unit depth of a unit ray, or (-1, inf)."""
+    rel = np.asarray(points, dtype=np.float64) - origin
+    t = rel @ direction
+    off = np.linalg.norm(rel - t[:, None] * direction, axis=1)
+    t = np.where((t > 0) & (off <= tolerance * t), t, np.inf)
+    if len(t) == 0: return -1, np.inf
+    k = int(np.argmin(t))
+    return (k, float(t[k])) if np.isfinite(t[k]) else (-1, np.inf)
+
+
+def pick_ray(modelview, projection, viewport, pos):
+    """(origin, unit direction) through window position `pos` (pixels, y down), from glGet* state."""
+    m = np.asarray(modelview, dtype=np.float64).reshape(4, 4) @ np.asarray(projection, dtype=np.float64).reshape(4, 4)
+    vx, vy, w, h = viewport
+    x = 2.0 * (pos[0] - vx) / w - 1.0
+    y = 1.0 - 2.0 * (pos[1] - vy) / h
+    ends = np.array([[x, y, -1.0, 1.0], [x, y, 1.0, 1.0]]) @ np.linalg.inv(m)
+    near, far = ends[:, :3] / ends[:, 3:]
+    return near, (far - near) / np.linalg.norm(far - near)
+
+
+def eye_position(modelview):
+    return np.linalg.inv(np.asarray(modelview, dtype=np.float64).reshape(4, 4))[3, :3]
+
+
+class SpatialIndex:
+    def __init__(self, points=(), cell_size=CELL_SIZE, fractions=LOD_FRACTIONS, seed=0):
+        self.cell_size = cell_size
+        self.fractions = np.asarray(fractions[:-1], dtype=np.float32)
+        self.levels = len(fractions)
+        self.rng = np.random.default_rng(seed)
+        self.cell_keys = np.zeros(0, dtype=np.int64)
+        self.key_order = np.zeros(0, dtype=np.int64)
+        self.bucket_of_point = np.zeros(0, dtype=np.int32)
+        self.order = np.zeros(0, dtype=np.uint32)
+        self.bucket_start = np.zeros(0, dtype=np.int64)
+        self.bucket_size = np.zeros(0, dtype=np.int64)
+        self.bbox_min = np.zeros((0, 3), dtype=np.float32)
+        self.bbox_max = np.zeros((0, 3), dtype=np.float32)
+        self.center = np.zeros((0, 3), dtype=np.float32)
+        self.visible_in_bucket = np.zeros(0, dtype=np.int64)
+        self.revealed = 0
+        self.last_drawn = 0
+        self._insert(np.asarray(points, dtype=np.float32).reshape(-1, 3))
+
+    @property
+    def n_cells(self):
+        return len(self.cell_keys)
+
+    @property
+    def count(self):
+        """Number of points indexed; they are rows [0, count) of the points passed in."""
+        return len(self.bucket_of_point)
+
+    def extended(self, points):
+        """A new index that also covers rows [count, len(points)) of `points`.
+
+        Only the new rows are decoded and binned; the order is merged bucket by
+        bucket in O(n). This index is left untouched, so it can keep serving
+        draws and queries while the next one is built on another thread. The
+        new index starts with nothing revealed.
+        """
+        index = copy.copy(self)
+        index.visible_in_bucket = np.zeros_like(self.visible_in_bucket)
+        index.revealed = 0
+        index._insert(np.asarray(points[self.count:], dtype=np.float32).reshape(-1, 3))
+        return index
+
+    def _cell_ids(self, keys):
+        """Cell id per key; unseen keys get new cells appended after the existing ones."""
+        unique, inverse = np.unique(keys, return_inverse=True)
+        known = self.cell_keys[self.key_order]
+        pos = np.minimum(np.searchsorted(known, unique), max(len(known) - 1, 0))
+        found = (pos < len(known)) & (known[pos] == unique) if len(known) else np.zeros(len(unique), dtype=bool)
+        ids = np.empty(len(unique), dtype=np.int64)
+        ids[found] = self.key_order[pos[found]]
+        ids[~found] = self.n_cells + np.arange(np.count_nonzero(~found))
+        if not found.all():
+            self.cell_keys = np.concatenate((self.cell_keys, unique[~found]))
+            self.key_order = np.argsort(self.cell_keys, kind="stable")
+        return ids[inverse.reshape(-1)]
+
+    def _insert(self, points):
+        """Appends `points` as the next rows; every array is rebound, none is written in place."""
+        n_old, n = self.count, len(points)
+        if n == 0: return
+        cells = np.floor(points / self.cell_size).astype(np.int64) + (1 << (KEY_BITS - 1))
+        keys = (cells[:, 0] << (2 * KEY_BITS)) | (cells[:, 1] << KEY_BITS) | cells[:, 2]
+        del cells
+        cell_of_point = self._cell_ids(keys)
+        del keys
+        level = np.searchsorted(self.fractions, self.rng.random(n, dtype=np.float32), side="right")
+        buckets = (cell_of_point * self.levels + level).astype(np.int32)
+        del level
+
+        # new points go to the end of their bucket, so every bucket stays in time order
+        n_buckets = self.n_cells * self.levels
+        old_size = np.zeros(n_buckets, dtype=np.int64)
+        old_size[:len(self.bucket_size)] = self.bucket_size
+        added = np.bincount(buckets, minlength=n_buckets)
+        size = old_size + added
+        start = np.concatenate(([0], np.cumsum(size)[:-1])).astype(np.int64)
+        by_bucket = np.argsort(buckets, kind="stable")
+        if n_old:
+            order = np.empty(n_old + n, dtype=np.uint32)
+            shift = start[:len(self.bucket_start)] - self.bucket_start
+            order[np.arange(n_old) + np.repeat(shift, self.bucket_size)] = self.order
+            order[_ranges(start + old_size, added)] = n_old + by_bucket
+        else:
+            order = by_bucket.astype(np.uint32)
+
+        n_new_cells = self.n_cells - len(self.bbox_min)
+        bbox_min = np.concatenate((self.bbox_min, np.full((n_new_cells, 3), np.inf, dtype=np.float32)))
+        bbox_max = np.concatenate((self.bbox_max, np.full((n_new_cells, 3), -np.inf, dtype=np.float32)))
+        # sorted by bucket is sorted by cell, so each touched cell is one run
+        added_in_cell = added.reshape(self.n_cells, self.levels).sum(axis=1)
+        touched = np.nonzero(added_in_cell)[0]
+        runs = np.concatenate(([0], np.cumsum(added_in_cell[touched])[:-1]))
+        sorted_points = points[by_bucket]
+        bbox_min[touched] = np.minimum(bbox_min[touched], np.minimum.reduceat(sorted_points, runs))
+        bbox_max[touched] = np.maximum(bbox_max[touched], np.maximum.reduceat(sorted_points, runs))
+        del sorted_points
+
+        self.bucket_of_point = np.concatenate((self.bucket_of_point, buckets))
+        self.order, self.bucket_start, self.bucket_size = order, start, size
+        self.bbox_min, self.bbox_max = bbox_min, bbox_max
+        self.center = (bbox_min + bbox_max) / 2
+        visible = np.zeros(n_buckets, dtype=np.int64)
+        visible[:len(self.visible_in_bucket)] = self.visible_in_bucket
+        self.visible_in_bucket = visible
+
+    def reveal(self, count):
+        """Moves the visible prefix to `count` points (at most `count` indexed), touching only the difference."""
+        count = min(count, self.count)
+        n_buckets = len(self.visible_in_bucket)
+        if count > self.revealed:
+            self.visible_in_bucket += np.bincount(self.bucket_of_point[self.revealed:count], minlength=n_buckets)
+        elif count < self.revealed:
+            self.visible_in_bucket -= np.bincount(self.bucket_of_point[count:self.revealed], minlength=n_buckets)
+        self.revealed = count
+
+    def cull(self, planes):
+        """Mask of cells whose bounding box is at least partly inside all planes."""
+        return boxes_in_frustum(planes, self.bbox_min, self.bbox_max)
+
+    def select(self, planes, eye, budget=POINT_BUDGET, lod_distances=LOD_DISTANCES):
+        """Element (firsts, counts) to draw: culled, LOD'd and capped to `budget` points."""
+        if self.n_cells == 0: return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        cells = np.nonzero(self.cull(planes))[0]
+        dist = np.linalg.norm(self.center[cells] - eye, axis=1)
+        near_first = np.argsort(dist)
+        cells, dist = cells[near_first], dist[near_first]
+        keep = self.levels - np.searchsorted(np.asarray(lod_distances), dist)
+        keep = np.clip(keep, 1, self.levels)
+
+        per_level = self.visible_in_bucket.reshape(self.n_cells, self.levels)[cells]
+        cum = np.cumsum(per_level, axis=1)
+        for drop in range(self.levels):
+            k = np.clip(keep - drop, 1, self.levels)
+            drawn = cum[np.arange(len(cells)), k - 1]
+            if drawn.sum() <= budget: break
+        # Still over budget at the coarsest level: keep the nearest cells only
+        fits = np.cumsum(drawn) <= budget
+        cells, k, per_level = cells[fits], k[fits], per_level[fits]
+
+        level_mask = np.arange(self.levels)[None, :] < k[:, None]
+        level_mask &= per_level > 0
+        buckets = (cells[:, None] * self.levels + np.arange(self.levels)[None, :])[level_mask]
+        counts = self.visible_in_bucket[buckets]
+        self.last_drawn = int(counts.sum())
+        return self.bucket_start[buckets], counts
+
+    def visible_points(self, cells):
+        """Indices of the revealed points in `cells`."""
+        buckets = (np.asarray(cells)[:, None] * self.levels + np.arange(self.levels)).ravel()
+        return self.order[_ranges(self.bucket_start[buckets], self.visible_in_bucket[buckets])].astype(np.int64)
+
+    def _occupied(self):
+        return np.nonzero(self.visible_in_bucket.reshape(self.n_cells, self.levels).sum(axis=1))[0]
+
+    def within_radius(self, points, center, radius):
+        """Indices of revealed points within `radius` of `center`."""
+        if self.n_cells == 0: return np.zeros(0, dtype=np.int64)
+        cells = self._occupied()
+        cells = cells[box_distance(self.bbox_min[cells], self.bbox_max[cells], center) <= radius]
+        idx = self.visible_points(cells)
+        d = np.linalg.norm(points[idx] - center, axis=1)
+        return idx[d <= radius]
+
+    def nearest(self, points, center):
+        """(index, distance) of the revealed point closest to `center`, or (-1, inf)."""
+        best, best_d = -1, np.inf
+        if self.n_cells == 0: return best, best_d
+        cells = self._occupied()
+        bound = box_distance(self.bbox_min[cells], self.bbox_max[cells], center)
+        order = np.argsort(bound)
+        for group in _batches(order):
+            if bound[group[0]] >= best_d: break
+            idx = self.visible_points(cells[group])
+            d = np.linalg.norm(points[idx] - center, axis=1)
+            k = int(np.argmin(d))
+            if d[k] < best_d: best, best_d = int(idx[k]), float(d[k])
+        return best, best_d
+
+    def pick(self, points, origin, direction, tolerance):
+        """Index of the first revealed point within `tolerance` (per unit of ray length) of the ray, or -1."""
+        if self.n_cells == 0: return -1
+        direction = direction / np.linalg.norm(direction)
+        cells = self._occupied()
+        lo, hi = self.bbox_min[cells], self.bbox_max[cells]
+        # grow each box by the tolerance at its far side so points just off its faces still count
+        pad = tolerance * (np.linalg.norm(self.center[cells] - origin, axis=1) + np.linalg.norm(hi - lo, axis=1) / 2)
+        entry = ray_box_entry(lo - pad[:, None], hi + pad[:, None], origin, direction)
+        order = np.argsort(entry)
+        order = order[np.isfinite(entry[order])]
+        best, best_t = -1, np.inf
+        for group in _batches(order):
+            if entry[group[0]] >= best_t: break
+            idx = self.visible_points(cells[group])
+            k, t = ray_hits(points[idx], origin, direction, tolerance)
+            if t < best_t: best, best_t = int(idx[k]), t
+        return best
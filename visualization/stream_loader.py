@@ -0,0 +1,70 @@
+"""Live viewer source: scans and telemetry from a lidar/streaming.py publisher.
+
+Frames are fused the way telemetry.py records a flight (TelemetryFuser), but
+appended to the loader's column buffers instead of a file, so the viewer
+picks them up in poll_loader like chunks of a file that is still loading.
+Points wait for a newer motor sample to be interpolated against, but never
+longer than MAX_LATENCY; without telemetry they get the default PWM.
+
+    python3 viewer.py tcp://raspberrypi.local:5600
+"""
+import os
+import socket
+import sys
+import numpy as np
+from chunk_loader import ChunkLoader
+from quantize import PointEncoding
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lidar"))
+from streaming import read_frames, parse_address, KIND_SCAN
+from telemetry import TelemetryFuser, SCAN_HEIGHT_M
+
+STREAM_CAPACITY = 1 << 20
+MAX_LATENCY = 0.5
+CONNECT_TIMEOUT = 5.0
+
+
+class StreamLoader(ChunkLoader):
+    live = True
+
+    def __init__(self, address, height=SCAN_HEIGHT_M):
+        self.filename = address
+        self.read_ahead = None
+        self.total = None
+        self.has_motors = False
+        self.height = height
+        self.sock = None
+        self._init_buffers(STREAM_CAPACITY, PointEncoding.unbounded())
+
+    def append(self, points, colors, timestamps, motors):
+        """RbtsofWriter.append for TelemetryFuser."""
+        self._append(points, colors, timestamps, motors)
+
+    def cancel(self):
+        super().cancel()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _run(self):
+        fuser = TelemetryFuser(self, self.height, batch_points=1)
+        try:
+            self.sock = socket.create_connection(parse_address(self.filename), timeout=CONNECT_TIMEOUT)
+            self.sock.settimeout(None)
+            for kind, _, stamp, data in read_frames(self.sock):
+                if self.cancelled: break
+                if kind == KIND_SCAN:
+                    fuser.add_scan(stamp, data)
+                else:
+                    self.has_motors = True
+                    fuser.add_motors(stamp, data.astype(np.float64))
+                    fuser.flush()
+                if fuser.pending and fuser.last_scan - fuser.pending[0][0][0] > MAX_LATENCY: fuser.flush(final=True)
+            fuser.flush(final=True)
+            self.total = self.loaded
+        except Exception as e:
+            if not self.cancelled: self.error = e
+        finally:
+            if self.sock is not None: self.sock.close()
+            self.done = True
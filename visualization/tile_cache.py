@@ -0,0 +1,105 @@
+"""Pages tiles of a TileStore between disk and the GPU by camera distance.
+
+Each frame the tiles inside the view frustum are ranked nearest first and
+handed to a reader thread, which loads them from disk one at a time. The UI
+thread uploads finished tiles into their own PointBuffers, fixed-point relative to
+the tile's bounding box, and drops the CPU copy, so only tiles that have
+been on screen cost memory. When the resident
+points exceed the budget, the least recently visible tiles are freed; the
+nearest visible tile is always kept, even when it alone is over budget.
+A tile whose parts cannot be read is reported once and left out from then on.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from point_buffers import PointBuffers
+from quantize import PointEncoding, FixedPoints
+from spatial_index import boxes_in_frustum
+
+TILE_CACHE_POINTS = 20_000_000
+UPLOADS_PER_FRAME = 2
+
+
+class TileCache:
+    def __init__(self, store, budget=TILE_CACHE_POINTS):
+        self.store = store
+        self.budget = budget
+        self.names = sorted(store.tiles)
+        self.counts = np.array([store.tiles[n]["count"] for n in self.names], dtype=np.int64)
+        self.bbox_min, self.bbox_max = store.bounds(self.names)
+        self.center = (self.bbox_min + self.bbox_max) / 2
+        self.resident = OrderedDict()   # tile -> PointBuffers, least recently visible first
+        self.resident_points = 0
+        self.visible = []
+        self.wanted = []
+        self.loading = None
+        self.loaded = []
+        self.failed = set()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def _reader(self):
+        while True:
+            with self.cond:
+                while not self.wanted: self.cond.wait()
+                tile = self.loading = self.wanted.pop(0)
+            try:
+                points, colors = self.store.read_tile(self.names[tile])
+            except (OSError, ValueError) as e:
+                print(f"Tile {self.names[tile]} could not be read, leaving it out: {e}")
+                with self.cond:
+                    self.failed.add(tile)
+                    self.loading = None
+                continue
+            with self.cond:
+                self.loaded.append((tile, points, colors))
+                self.loading = None
+
+    def update(self, planes, eye):
+        """Ranks visible tiles, queues missing ones and uploads what the reader has finished."""
+        tiles = np.nonzero(boxes_in_frustum(planes, self.bbox_min, self.bbox_max))[0]
+        if self.failed: tiles = tiles[~np.isin(tiles, list(self.failed))]
+        tiles = tiles[np.argsort(np.linalg.norm(self.center[tiles] - eye, axis=1))]
+        # nearest tiles first, up to what fits in the budget, but never none
+        keep = np.cumsum(self.counts[tiles]) <= self.budget
+        keep[:1] = True
+        tiles = tiles[keep]
+        for tile in tiles:
+            if tile in self.resident: self.resident.move_to_end(tile)
+        with self.cond:
+            self.wanted = [t for t in tiles.tolist() if t not in self.resident and t != self.loading
+                           and all(t != done[0] for done in self.loaded)]
+            if self.wanted: self.cond.notify()
+            finished, self.loaded = self.loaded[:UPLOADS_PER_FRAME], self.loaded[UPLOADS_PER_FRAME:]
+        for tile, points, colors in finished:
+            self._upload(tile, points, colors)
+        self._evict(set(tiles.tolist()))
+        self.visible = [t for t in tiles.tolist() if t in self.resident]
+
+    def _upload(self, tile, points, colors):
+        encoding = PointEncoding.for_bounds(self.bbox_min[tile], self.bbox_max[tile])
+        gpu = PointBuffers(len(points), encoding)
+        gpu.append_points(FixedPoints.encode(points, encoding), len(points))
+        gpu.mark_dirty(0, len(points))
+        gpu.flush_colors(colors)
+        self.resident[tile] = gpu
+        self.resident_points += len(points)
+
+    def _evict(self, visible):
+        for tile in list(self.resident):
+            if self.resident_points <= self.budget: break
+            if tile in visible: continue
+            self.resident.pop(tile).delete()
+            self.resident_points -= int(self.counts[tile])
+
+    @property
+    def drawn_points(self):
+        return int(self.counts[self.visible].sum()) if self.visible else 0
+
+    def draw(self, prepare=None):
+        """Draws the visible tiles; `prepare(encoding)` is called before each, e.g. to set shader uniforms."""
+        for tile in self.visible:
+            gpu = self.resident[tile]
+            if prepare is not None: prepare(gpu.encoding)
+            gpu.draw(gpu.uploaded)
@@ -0,0 +1,135 @@
+"""On-disk tiled map store for merging several flights over one site.
+
+Points are partitioned into square tiles on the ground plane (x, z). Every
+flight added writes one binary .rbtsof part per tile it touches, so adding a
+flight never rewrites existing tiles. manifest.json records the tile size,
+the flights and, per tile, its bounds, point count and parts. Flights are
+expected to share one coordinate frame.
+
+    python3 tile_store.py build site/ flight1.rbtsof flight2.rbtsof [--tile-size 8]
+    python3 tile_store.py info site/
+"""
+import glob
+import json
+import os
+import sys
+import numpy as np
+import rbtsof
+from chunk_loader import iter_chunks
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+TILE_SIZE = 8.0
+BUILD_BATCH_ROWS = 1_000_000
+# Spooled row layout: x y z r g b t m1 m2 m3 m4
+ROW_COLUMNS = 11
+
+
+def tile_name(i, j):
+    return f"{i}_{j}"
+
+
+def is_site(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+class TileStore:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version", 0) > MANIFEST_VERSION:
+            raise ValueError(f"{directory}: unsupported manifest version {manifest['version']}")
+        self.tile_size = manifest["tile_size"]
+        self.flights = manifest["flights"]
+        self.tiles = manifest["tiles"]
+
+    @classmethod
+    def create(cls, directory, tile_size=TILE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        if not is_site(directory):
+            with open(os.path.join(directory, MANIFEST), "w") as f:
+                json.dump({"version": MANIFEST_VERSION, "tile_size": tile_size, "flights": [], "tiles": {}}, f)
+        return cls(directory)
+
+    def save(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "tile_size": self.tile_size,
+                       "flights": self.flights, "tiles": self.tiles}, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    @property
+    def total_points(self):
+        return sum(t["count"] for t in self.tiles.values())
+
+    def bounds(self, names):
+        """(n, 3) bbox_min and bbox_max arrays for the given tiles."""
+        return (np.array([self.tiles[n]["bbox_min"] for n in names], dtype=np.float32).reshape(-1, 3),
+                np.array([self.tiles[n]["bbox_max"] for n in names], dtype=np.float32).reshape(-1, 3))
+
+    def add_flight(self, filename, batch_rows=BUILD_BATCH_ROWS):
+        """Bins one flight into tiles; returns the number of tiles it touched."""
+        flight = len(self.flights)
+        for stale in glob.glob(os.path.join(self.directory, f"*.{flight}.spool")): os.remove(stale)
+        spools = {}
+        for points, colors, timestamps, motors in iter_chunks(filename, batch_rows):
+            ij = np.floor(np.asarray(points)[:, [0, 2]] / self.tile_size).astype(np.int64)
+            keys, inverse = np.unique(ij, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            order = np.argsort(inverse, kind="stable")
+            ends = np.cumsum(np.bincount(inverse, minlength=len(keys)))
+            rows = np.empty((len(points), ROW_COLUMNS), dtype=np.float32)
+            rows[:, 0:3] = points; rows[:, 3:6] = colors; rows[:, 6] = timestamps
+            rows[:, 7:11] = rbtsof.DEFAULT_PWM if motors is None else motors
+            rows = rows[order]
+            start = 0
+            for (i, j), end in zip(keys, ends):
+                name = tile_name(i, j)
+                path = spools.setdefault(name, os.path.join(self.directory, f"{name}.{flight}.spool"))
+                with open(path, "ab") as f:
+                    f.write(rows[start:end].tobytes())
+                start = end
+
+        for name, spool in spools.items():
+            rows = np.memmap(spool, np.float32, "r").reshape(-1, ROW_COLUMNS)
+            part = f"{name}.{flight}.rbtsof"
+            rbtsof.write_rbtsof(os.path.join(self.directory, part), rows[:, 0:3], rows[:, 3:6], rows[:, 6], rows[:, 7:11])
+            lo, hi = rows[:, 0:3].min(axis=0).tolist(), rows[:, 0:3].max(axis=0).tolist()
+            tile = self.tiles.setdefault(name, {"count": 0, "parts": [], "bbox_min": lo, "bbox_max": hi})
+            tile["count"] += len(rows)
+            tile["parts"].append(part)
+            tile["bbox_min"] = np.minimum(tile["bbox_min"], lo).tolist()
+            tile["bbox_max"] = np.maximum(tile["bbox_max"], hi).tolist()
+            del rows
+            os.remove(spool)
+        self.flights.append(os.path.abspath(filename))
+        self.save()
+        return len(spools)
+
+    def read_tile(self, name):
+        """(points, colors) of every part of a tile, concatenated."""
+        parts = [rbtsof.RbtsofFile(os.path.join(self.directory, p)) for p in self.tiles[name]["parts"]]
+        return (np.concatenate([rb.points for rb in parts]).astype(np.float32, copy=False),
+                np.concatenate([rb.colors for rb in parts]).astype(np.float32, copy=False))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("build", "info"):
+        print(__doc__)
+        sys.exit(1)
+    if args[0] == "info":
+        store = TileStore(args[1])
+        print(f"{len(store.tiles)} tiles of {store.tile_size} m, {store.total_points} points from {len(store.flights)} flights")
+        sys.exit(0)
+    tile_size = TILE_SIZE
+    if "--tile-size" in args:
+        i = args.index("--tile-size")
+        tile_size = float(args[i + 1])
+        del args[i:i + 2]
+    store = TileStore.create(args[1], tile_size)
+    for flight in args[2:]:
+        touched = store.add_flight(flight)
+        print(f"{flight}: {touched} tiles")
+    print(f"{args[1]}: {len(store.tiles)} tiles, {store.total_points} points")
@@ -0,0 +1,76 @@
+"""Keyframe index for seeking and scrubbing through a flight.
+
+As chunks load, the height histogram is snapshotted every `interval` points
+and the motor channels are averaged over blocks of `block` points. Seeking to
+any point count then restores the histogram from the keyframe below it plus
+at most `interval` points, and the motor window from the last `size` block
+averages, instead of replaying everything from the start.
+
+Colors need no keyframes: revealed source colors stay valid whichever way
+the playhead moves, and heatmap colors depend only on the drone position.
+The finished index is cached with the file's summary (file_summary.py) and
+restored on the next open, so extend() has nothing left to do.
+"""
+import numpy as np
+from aggregates import StreamingHistogram
+from chunk_loader import grow_rows
+
+KEYFRAME_POINTS = 65536
+MOTOR_BLOCK_POINTS = 2048
+
+
+class Timeline:
+    def __init__(self, bins=50, value_range=(0.0, 5.0), channels=4, interval=KEYFRAME_POINTS, block=MOTOR_BLOCK_POINTS):
+        self.interval = interval
+        self.block = block
+        self.hist = StreamingHistogram(bins, value_range)
+        self.keyframes = np.zeros((1, bins), dtype=np.int64)
+        self.n_keyframes = 1
+        self.block_means = np.zeros((0, channels), dtype=np.float32)
+        self.n_blocks = 0
+
+    @property
+    def layout(self):
+        """What keyframes depend on besides the data; cached ones are only reused if it matches."""
+        return (self.interval, self.block, self.hist.bins, *self.hist.range)
+
+    def snapshot(self):
+        """(keyframes, block means) built so far."""
+        return self.keyframes[:self.n_keyframes].copy(), self.block_means[:self.n_blocks].copy()
+
+    def restore(self, keyframes, block_means, layout):
+        """Takes keyframes from an earlier load of the same file; False if they were built differently."""
+        if tuple(float(v) for v in layout) != tuple(float(v) for v in self.layout): return False
+        self.keyframes = np.array(keyframes, dtype=np.int64)
+        self.n_keyframes = len(self.keyframes)
+        self.hist.reset(self.keyframes[-1])
+        self.block_means = np.array(block_means, dtype=np.float32)
+        self.n_blocks = len(self.block_means)
+        return True
+
+    def extend(self, heights, motor_data):
+        """Indexes rows loaded since the last call; `heights` and `motor_data` cover every loaded row."""
+        count = len(heights)
+        while self.n_keyframes * self.interval <= count:
+            s = (self.n_keyframes - 1) * self.interval
+            self.hist.add(heights[s:s + self.interval])
+            self.keyframes = grow_rows(self.keyframes, self.n_keyframes + 1)
+            self.keyframes[self.n_keyframes] = self.hist.counts
+            self.n_keyframes += 1
+        blocks = count // self.block
+        if blocks > self.n_blocks:
+            s, e = self.n_blocks * self.block, blocks * self.block
+            new = motor_data[s:e].reshape(blocks - self.n_blocks, self.block, -1).mean(axis=1)
+            self.block_means = grow_rows(self.block_means, blocks)
+            self.block_means[self.n_blocks:blocks] = new
+            self.n_blocks = blocks
+
+    def seek(self, end, heights, motor_data, histogram, motor_ring):
+        """Sets `histogram` and `motor_ring` to their state with the first `end` points revealed."""
+        k = min(end // self.interval, self.n_keyframes - 1)
+        histogram.reset(self.keyframes[k])
+        histogram.add(heights[k * self.interval:end])
+        full = min(end // self.block, self.n_blocks)
+        motor_ring.load(self.block_means[max(full - motor_ring.size, 0):full])
+        tail = motor_data[full * self.block:end]
+        if len(tail): motor_ring.push(tail.mean(axis=0))
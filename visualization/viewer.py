@@ -1,22 +1,69 @@
-import pygame
-from pygame.locals import *
-from OpenGL.GL import *
-from OpenGL.GLU import *
-import numpy as np
+import time
+# The startup report counts from here, before the heavy imports below
+_import_start = time.perf_counter()
 import os
-import imgui
-from imgui.integrations.pygame import PygameRenderer
-import array 
+import sys
 
 WINDOW_SIZE = (1280, 720)
 DATA_FILE = "room_scan.rbtsof"
 START_X = -6.0
 END_X = 6.0      
+VOXEL_BATCH = 1_000_000
+# Pick tolerance as ray offset per metre of depth (about 0.6 degrees)
+PICK_TOLERANCE = 0.01
+
+if __name__ == "__main__" and "--render" in sys.argv:
+    # headless rendering needs neither pygame nor OpenGL, so it goes before they are imported
+    import software_render
+    software_render.main(sys.argv[1:], START_X, END_X)
+    sys.exit(0)
+
+import pygame
+from pygame.locals import *
+from OpenGL.GL import *
+from OpenGL.GLU import *
+import numpy as np
+import threading
+import rbtsof
+from chunk_loader import ChunkLoader, READ_AHEAD, grow_rows
+from point_buffers import PointBuffers
+from heatmap_colors import heatmap_rgb
+from quantize import decode_colors
+from aggregates import StreamingHistogram, MotorRing
+from timeline import Timeline
+from spatial_index import SpatialIndex, frustum_planes, eye_position, pick_ray, ray_hits, POINT_BUDGET
+from file_summary import FileSummary, save_summary
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lidar"))
+from profiling import Profiler, Milestones
 
 class PointCloudViewer:
-    def __init__(self):
+    def __init__(self, source=DATA_FILE, started=None):
+        self.startup = Milestones(started)
+        self.startup_reported = False
+        self.impl = None
         self.points = None
         self.colors = None
+        self.gpu = None
+        self.loader = None
+        self.summary_cached = False
+        self.loaded_count = 0
+        self.site = None
+        self.heatmap_shader = None
+        self.spatial_index = None
+        self.index_wake = None
+        self.uploaded_index = None
+        self.use_culling = True
+        self.point_budget_k = POINT_BUDGET // 1000
+        self.use_voxels = False
+        self.voxel_size_cm = 10
+        self.voxel_grid = None
+        self.voxel_gpu = None
+        self.voxelized_count = 0
+        self.view_matrices = None
+        self.picks = []
+        self.query_radius = 0.5
+        self.pick_neighbours = 0
+        self.closest = (-1, np.inf)
         self.original_colors = None
         self.timestamps = None
         self.motor_data = None
@@ -35,22 +82,29 @@ class PointCloudViewer:
         self.show_z_axis = True
         self.use_heatmap = True
         
+        self.height_hist = StreamingHistogram(bins=50, value_range=(0, 5))
         self.hist_counts = np.array([], dtype=np.float32)
-        self.motor_history = [array.array('f', [1500.0] * 100) for _ in range(4)]
+        self.motor_history = MotorRing(channels=4, size=100, fill=1500.0)
+        self.timeline = None
+        self.profiler = Profiler.from_argv(sys.argv)
         self.prev_visible_count = 0
+        self.colored_count = 0
         
         self.cam_pos = [0, -2, -12] 
         self.cam_rot = [0, 0]      
         self.mouse_down = False
         self.last_mouse_pos = (0, 0)
         
+        self.startup.mark("imports")
+        # the loader reads the first chunk while the window comes up; the shader and imgui wait for show_first_frame
+        if source is not None: self.load_data(source)
         self.init_window()
         self.init_opengl()
-        self.init_imgui()
-        self.load_data(DATA_FILE)
+        self.startup.mark("window")
 
     def init_window(self):
-        pygame.init()
+        # pygame.init() would also start audio and joysticks, which is slow on the Pi
+        pygame.display.init()
         pygame.display.set_caption("LiDAR Mapping v1.5 - Motor Telemetry")
         pygame.display.set_mode(WINDOW_SIZE, DOUBLEBUF | OPENGL | RESIZABLE)
 
@@ -59,10 +113,37 @@ class PointCloudViewer:
         glPointSize(self.point_size)
         self.resize_viewport(WINDOW_SIZE[0], WINDOW_SIZE[1])
 
+    def init_heatmap_shader(self):
+        try:
+            # OpenGL.GL.shaders is only needed from here, after the first frame
+            from heatmap import HeatmapShader
+            self.heatmap_shader = HeatmapShader()
+        except Exception as e:
+            print(f"Heatmap shader unavailable ({e}), colouring on the CPU.")
+
     def init_imgui(self):
+        global imgui
+        import imgui
+        from imgui.integrations.pygame import PygameRenderer
         imgui.create_context()
         self.impl = PygameRenderer()
 
+    def show_first_frame(self):
+        """Puts the window's first frame up, then does the slower shader and imgui setup."""
+        self.draw_scene()
+        pygame.display.flip()
+        self.startup.mark("first frame")
+        self.init_heatmap_shader()
+        self.init_imgui()
+        self.startup.mark("ui")
+
+    def report_startup(self):
+        """Prints the startup times once points are on screen, or once loading ended without any."""
+        if self.visible_count > 0 or self.site is not None: self.startup.mark("first points")
+        elif self.loader is not None: return
+        self.startup_reported = True
+        print(f"Startup: {self.startup.summary()}" + (" (cached summary)" if self.summary_cached else ""))
+
     def resize_viewport(self, width, height):
         if height == 0: height = 1
         glViewport(0, 0, width, height)
@@ -71,79 +152,262 @@ class PointCloudViewer:
         gluPerspective(60, (width / height), 0.1, 1000.0)
         glMatrixMode(GL_MODELVIEW)
 
-    def load_data(self, filename):
-        if not os.path.exists(filename):
-            print("File not found.")
-            return
-        data = np.loadtxt(filename, dtype=np.float32)
-        
-        self.points = data[:, 0:3]
-        self.original_colors = data[:, 3:6]
-        self.colors = self.original_colors.copy()
-        self.timestamps = data[:, 6]
-        
-        if data.shape[1] >= 11:
-            self.motor_data = data[:, 7:11]
+    def load_data(self, filename, read_ahead=READ_AHEAD):
+        """Starts streaming `filename` (or a tcp:// live source) in the background; playback begins with the first chunk."""
+        live = filename.startswith("tcp://")
+        if not live:
+            if not os.path.exists(filename):
+                print("File not found.")
+                return
+            from tile_store import is_site
+            if is_site(filename):
+                self.load_site(filename)
+                return
+        if self.loader is not None: self.loader.cancel()
+        if live:
+            from stream_loader import StreamLoader
+            self.loader = StreamLoader(filename).start()
         else:
-            print("Warning: Old file format. No motor data found.")
-            self.motor_data = np.full((len(data), 4), 1500.0)
+            if not rbtsof.is_rbtsof(filename):
+                print("Note: text .rbtsof, convert with 'python3 rbtsof.py to-bin' for faster loading.")
+            self.loader = ChunkLoader(filename, read_ahead).start()
+        self.points = self.original_colors = self.timestamps = self.motor_data = None
+        self.colors = np.zeros((0, 3), dtype=np.uint8)
+        self.loaded_count = 0
+        self.visible_count = self.colored_count = self.prev_visible_count = 0
+        self.height_hist.reset()
+        self.timeline = Timeline(self.height_hist.bins, self.height_hist.range)
+        summary = self.loader.summary
+        self.summary_cached = summary is not None and self.timeline.restore(summary.keyframes, summary.block_means, summary.layout)
+        self.picks = []; self.closest = (-1, np.inf)
+        # GPU buffers wait for the first chunk, so loading can start before the GL context exists
+        self.gpu = None
+        self.start_indexing(self.loader)
+
+    def load_site(self, directory):
+        """Opens a tiled multi-flight map; tiles are paged in as they come into view."""
+        from tile_store import TileStore
+        from tile_cache import TileCache
+        store = TileStore(directory)
+        self.site = TileCache(store)
+        print(f"Site {directory}: {len(store.tiles)} tiles, {store.total_points} points from {len(store.flights)} flights")
 
-        self.total_points = len(self.points)
-        self.max_time = np.max(self.timestamps)
+    def poll_loader(self):
+        """Picks up the chunks the loader has finished since the last frame."""
+        loader = self.loader
+        if loader is None: return
+        done = loader.done  # read before `loaded` so the final count is seen once done
+        count = loader.loaded
+        if count > self.loaded_count:
+            self.points = loader.points.head(count)
+            self.original_colors = loader.colors[:count]
+            self.timestamps = loader.timestamps[:count]
+            self.motor_data = loader.motor_data[:count]
+            # only the CPU heatmap needs colors apart from the source ones
+            self.colors = grow_rows(self.colors, count) if self.heatmap_shader is None else self.original_colors
+            if self.gpu is None: self.gpu = PointBuffers(loader.capacity, loader.encoding)
+            self.gpu.ensure_capacity(count, self.points)
+            self.timeline.extend(self.points.column(1), self.motor_data)
+            self.loaded_count = count
+            self.index_wake.set()
+        if not done: return
+        self.index_wake.set()
+        self.loader = None
+        if loader.error is not None:
+            print(f"Loading {loader.filename} failed: {loader.error}")
+        elif not loader.has_motors:
+            print("Warning: No motor telemetry in the stream." if loader.live else "Warning: Old file format. No motor data found.")
+        if loader.error is None and not self.summary_cached: self.cache_summary(loader)
+
+    def cache_summary(self, loader):
+        """Saves what this complete load derived (file_summary.py) for the next open of the same file."""
+        if loader.summary_key is None or loader.loaded == 0: return
+        save_summary(loader.filename, loader.summary_key, FileSummary(
+            loader.loaded, loader.has_motors, loader.bbox_min, loader.bbox_max, loader.t_max,
+            *self.timeline.snapshot(), self.timeline.layout))
+
+    def start_indexing(self, loader):
+        """Extends the spatial index off the UI thread as `loader` delivers chunks, live sources included.
+
+        Each pass indexes everything loaded since the last one, so passes batch up
+        when chunks arrive faster than they are indexed. Points not indexed yet
+        are drawn and queried directly.
+        """
+        if self.index_wake is not None: self.index_wake.set()
+        self.spatial_index = None; self.uploaded_index = None
+        wake = self.index_wake = threading.Event()
+        def follow():
+            index = SpatialIndex()
+            while self.index_wake is wake:
+                wake.clear()
+                done = loader.done  # read before `loaded`, as in poll_loader
+                count = loader.loaded
+                if count > index.count:
+                    index = index.extended(loader.points.head(count))
+                    index.reveal(self.visible_count)
+                    if self.index_wake is wake: self.spatial_index = index
+                elif done: return
+                else: wake.wait()
+        threading.Thread(target=follow, daemon=True).start()
 
     def get_drone_position(self):
         drone_x = START_X + (self.current_time * self.drone_speed)
         return [drone_x, 2.0, 0.0]
 
     def update_heatmap_colors(self):
+        """CPU fallback for GPUs without GLSL; the shader path never touches colors."""
         if self.visible_count == 0: return
-        drone_pos = self.get_drone_position()
-        visible_points = self.points[:self.visible_count]
-        diff = visible_points - np.array(drone_pos)
-        dists = np.linalg.norm(diff, axis=1)
-        norm_dists = np.clip((dists - 1.0) / 14.0, 0.0, 1.0)
-        colors = np.zeros((len(visible_points), 3), dtype=np.float32)
-        colors[:, 0] = norm_dists
-        colors[:, 1] = 1.0 - np.abs(norm_dists - 0.5) * 2.0
-        colors[:, 2] = 1.0 - norm_dists
-        self.colors[:self.visible_count] = colors
+        heatmap_rgb(self.points[:self.visible_count], self.get_drone_position(), out=self.colors[:self.visible_count])
+        self.gpu.mark_dirty(0, self.visible_count)
+        self.colored_count = 0
+
+    def reveal_original_colors(self):
+        """Copies source colors for newly revealed points only."""
+        if self.visible_count > self.colored_count:
+            if self.colors is not self.original_colors:
+                self.colors[self.colored_count:self.visible_count] = self.original_colors[self.colored_count:self.visible_count]
+            self.gpu.mark_dirty(self.colored_count, self.visible_count)
+            self.colored_count = self.visible_count
 
     def update_graphs(self):
-        """Updates Histogram and Motor Graphs."""
+        """Updates Histogram and Motor Graphs from the points revealed since last frame."""
         if self.visible_count == 0: return
 
-        y_values = self.points[:self.visible_count, 1] 
-        counts, _ = np.histogram(y_values, bins=50, range=(0, 5))
-        self.hist_counts = counts.astype(np.float32)
-
-        if self.visible_count > self.prev_visible_count:
-            new_motors = self.motor_data[self.prev_visible_count : self.visible_count]
-            avg_signals = np.mean(new_motors, axis=0)
+        prev, cur = self.prev_visible_count, self.visible_count
+        if cur > prev:
+            self.height_hist.add(self.points[prev:cur, 1])
+            avg_signals = np.mean(self.motor_data[prev:cur], axis=0)
         else:
-            avg_signals = [h[-1] for h in self.motor_history]
+            if cur < prev: self.height_hist.remove(self.points[cur:prev, 1])
+            avg_signals = self.motor_history.latest.copy()
+        self.hist_counts = self.height_hist.as_float()
 
-        self.prev_visible_count = self.visible_count
-        
-        for i in range(4):
-            self.motor_history[i].pop(0)
-            self.motor_history[i].append(float(avg_signals[i]))
+        self.prev_visible_count = cur
+        self.motor_history.push(avg_signals)
+
+    def reset_voxels(self):
+        from voxel_grid import VoxelGrid
+        self.voxel_grid = VoxelGrid(self.voxel_size_cm / 100.0, dims=3, channels=3)
+        if self.voxel_gpu is None: self.voxel_gpu = PointBuffers(1 << 16)
+        else: self.voxel_gpu.allocate(self.voxel_gpu.capacity)
+        self.voxelized_count = 0
+
+    def update_voxels(self):
+        """Merges newly revealed points into the voxel map, at most VOXEL_BATCH per frame."""
+        if self.points is None: return
+        if self.voxel_grid is None or self.visible_count < self.voxelized_count: self.reset_voxels()
+        start, end = self.voxelized_count, min(self.visible_count, self.voxelized_count + VOXEL_BATCH)
+        if end <= start: return
+        _, ids = self.voxel_grid.insert(self.points[start:end], decode_colors(self.original_colors[start:end]))
+        self.voxelized_count = end
+        self.voxel_gpu.ensure_capacity(len(self.voxel_grid), self.voxel_grid.centers)
+        if len(ids): self.voxel_gpu.mark_dirty(int(ids.min()), int(ids.max()) + 1)
+
+    @property
+    def live(self):
+        return self.loader is not None and self.loader.live
+
+    @property
+    def duration(self):
+        duration = (END_X - START_X) / self.drone_speed
+        if self.live and self.timestamps is not None and len(self.timestamps):
+            # a live source keeps growing past the replay length
+            duration = max(duration, float(self.timestamps[-1]) / self.drone_speed)
+        return duration
+
+    def locate(self):
+        """Sets visible_count from current_time over the points loaded so far."""
+        effective_timestamp = self.current_time * self.drone_speed
+        if self.loader is not None and effective_timestamp > self.timestamps[-1]:
+            # Buffering: hold the playhead at the last loaded point until the next chunk lands
+            effective_timestamp = float(self.timestamps[-1])
+            self.current_time = effective_timestamp / self.drone_speed
+        self.visible_count = np.searchsorted(self.timestamps, effective_timestamp)
+        if self.loader is not None: self.loader.consume(self.visible_count)
+
+    def update_colors(self):
+        if self.use_heatmap and self.heatmap_shader is None: self.update_heatmap_colors()
+        else: self.reveal_original_colors()
 
     def update_simulation(self, dt):
+        with self.profiler.stage("loader"): self.poll_loader()
         if not self.is_playing or self.points is None: return
         
         self.current_time += dt
-        total_distance = END_X - START_X
-        required_duration = total_distance / self.drone_speed
-        
-        if self.current_time > required_duration:
-            self.current_time = required_duration
+        if self.current_time > self.duration and not self.live:
+            self.current_time = self.duration
             self.is_playing = False
         
-        effective_timestamp = self.current_time * self.drone_speed
-        self.visible_count = np.searchsorted(self.timestamps, effective_timestamp)
-        
-        if self.use_heatmap: self.update_heatmap_colors()
-        self.update_graphs()
+        self.locate()
+        with self.profiler.stage("heatmap"): self.update_colors()
+        with self.profiler.stage("graphs"): self.update_graphs()
+        with self.profiler.stage("queries"): self.closest = self.nearest_point(self.get_drone_position())
+
+    def query_index(self):
+        """(spatial index revealed up to visible_count or None, first visible point it does not cover).
+
+        Queries use the index for the points it covers and scan the rest, at most
+        the chunks loaded since the last indexing pass.
+        """
+        index = self.spatial_index
+        if index is None: return None, 0
+        index.reveal(self.visible_count)
+        return index, min(index.count, self.visible_count)
+
+    def nearest_point(self, center):
+        """(index, distance) of the visible point closest to `center`, or (-1, inf)."""
+        center = np.asarray(center, dtype=np.float64)
+        index, tail = self.query_index()
+        best = index.nearest(self.points, center) if index is not None else (-1, np.inf)
+        if self.visible_count > tail:
+            d = np.linalg.norm(self.points[tail:self.visible_count] - center, axis=1)
+            k = int(np.argmin(d))
+            if d[k] < best[1]: best = (tail + k, float(d[k]))
+        return best
+
+    def points_within(self, center, radius):
+        """Indices of visible points within `radius` of `center`."""
+        center = np.asarray(center, dtype=np.float64)
+        index, tail = self.query_index()
+        d = np.linalg.norm(self.points[tail:self.visible_count] - center, axis=1)
+        found = tail + np.nonzero(d <= radius)[0]
+        if index is None: return found
+        return np.concatenate((index.within_radius(self.points, center, radius), found))
+
+    def pick_at(self, pos):
+        """Index of the visible point under the mouse at `pos`, or -1."""
+        if self.points is None or self.view_matrices is None or self.visible_count == 0: return -1
+        origin, direction = pick_ray(*self.view_matrices, pos)
+        index, tail = self.query_index()
+        best = index.pick(self.points, origin, direction, PICK_TOLERANCE) if index is not None else -1
+        k, t = ray_hits(self.points[tail:self.visible_count], origin, direction, PICK_TOLERANCE)
+        if k < 0: return best
+        if best >= 0:
+            _, best_t = ray_hits(self.points[best:best + 1], origin, direction, PICK_TOLERANCE)
+            if best_t <= t: return best
+        return tail + k
+
+    def pick(self, pos):
+        """Adds the point under the mouse as a measurement end; a third pick starts over."""
+        k = self.pick_at(pos)
+        if k < 0: return
+        if len(self.picks) == 2: self.picks = []
+        self.picks.append(np.array(self.points[k], dtype=np.float64))
+        self.update_neighbours()
+
+    def update_neighbours(self):
+        self.pick_neighbours = len(self.points_within(self.picks[-1], self.query_radius)) if self.picks else 0
+
+    def seek(self, t):
+        """Jumps to time `t` in either direction; analytics restart from the nearest keyframe."""
+        self.current_time = min(max(t, 0.0), self.duration)
+        if self.points is None: return
+        self.locate()
+        self.timeline.seek(self.visible_count, self.points.column(1), self.motor_data, self.height_hist, self.motor_history)
+        self.hist_counts = self.height_hist.as_float()
+        self.prev_visible_count = self.visible_count
+        self.update_colors()
+        self.closest = self.nearest_point(self.get_drone_position())
 
     def draw_ui(self):
         imgui.new_frame()
@@ -160,6 +424,7 @@ class PointCloudViewer:
                 imgui.separator()
                 if imgui.menu_item("Reset Camera", "", False, True)[0]:
                     self.cam_pos = [0, -2, -12]; self.cam_rot = [0, 0]
+                _, self.profiler.enabled = imgui.menu_item("Profiler", "", self.profiler.enabled, True)
                 imgui.end_menu()
             imgui.end_main_menu_bar()
 
@@ -167,9 +432,9 @@ class PointCloudViewer:
         if imgui.button("Pause" if self.is_playing else "Play"):
             self.is_playing = not self.is_playing
         if imgui.button("Restart"):
-            self.current_time = 0.0; self.is_playing = True; self.prev_visible_count = 0
-            self.hist_counts = np.array([], dtype=np.float32)
-            self.motor_history = [array.array('f', [1500.0] * 100) for _ in range(4)]
+            self.seek(0.0); self.is_playing = True
+        changed, t = imgui.slider_float("Timeline", self.current_time, 0.0, self.duration, "%.1f s")
+        if changed: self.seek(t)
             
         imgui.separator()
         if self.is_playing:
@@ -180,17 +445,56 @@ class PointCloudViewer:
 
         imgui.separator()
         clicked_heat, self.use_heatmap = imgui.checkbox("Heatmap Mode", self.use_heatmap)
-        if clicked_heat:
+        if clicked_heat and self.heatmap_shader is None:
             if self.use_heatmap: self.update_heatmap_colors()
-            else: self.colors[:self.visible_count] = self.original_colors[:self.visible_count]
+            elif self.gpu is not None:
+                self.colors[:self.visible_count] = self.original_colors[:self.visible_count]
+                self.colored_count = self.visible_count
+                self.gpu.mark_dirty(0, self.visible_count)
             
         changed, self.bg_color = imgui.color_edit3("Background", *self.bg_color)
         changed, self.point_size = imgui.slider_float("Point Size", self.point_size, 1.0, 10.0)
         changed, self.grid_size = imgui.slider_int("Grid Size", self.grid_size, 5, 50)
+        imgui.separator()
+        _, self.use_culling = imgui.checkbox("Culling + LOD", self.use_culling)
+        changed, self.point_budget_k = imgui.slider_int("Point Budget (k)", self.point_budget_k, 100, 10000)
+        _, self.use_voxels = imgui.checkbox("Voxel Map", self.use_voxels)
+        changed, self.voxel_size_cm = imgui.slider_int("Voxel Size (cm)", self.voxel_size_cm, 1, 50)
+        if changed and self.voxel_grid is not None: self.reset_voxels()
         imgui.end()
 
         imgui.begin("Real-time Analytics", True)
         
+        if self.live:
+            imgui.text(f"Live: {self.loaded_count} points from {self.loader.filename}")
+        elif self.loader is not None:
+            total, summary = self.loader.total, self.loader.summary
+            text = f"Loading: {self.loaded_count} / {total if total is not None else '?'} points"
+            if summary is not None and self.loaded_count:
+                text += f", {self.timestamps[self.loaded_count - 1]:.1f} / {summary.t_max:.1f} s"
+            imgui.text(text)
+        if self.site is not None:
+            imgui.text(f"Tiles: {len(self.site.visible)} on screen, {len(self.site.resident)} / {len(self.site.names)} resident")
+            imgui.text(f"Points drawn: {self.site.drawn_points} ({self.site.resident_points} on GPU)")
+        elif self.use_culling and self.spatial_index is not None:
+            imgui.text(f"Points drawn: {self.spatial_index.last_drawn} / {self.visible_count}")
+        else:
+            imgui.text(f"Points drawn: {self.visible_count}")
+        if self.use_voxels and self.voxel_grid is not None:
+            imgui.text(f"Voxels: {len(self.voxel_grid)} ({self.voxel_grid.memory_bytes() / 2**20:.1f} MB)")
+        imgui.separator()
+        imgui.text("Measure (right-click points)")
+        k, d = self.closest
+        imgui.text(f"Closest obstacle: {d:.2f} m" if k >= 0 else "Closest obstacle: -")
+        for i, p in enumerate(self.picks):
+            imgui.text(f"P{i + 1}: ({p[0]:.2f}, {p[1]:.2f}, {p[2]:.2f})")
+        if len(self.picks) == 2:
+            imgui.text(f"P1-P2: {np.linalg.norm(self.picks[1] - self.picks[0]):.3f} m")
+        changed, self.query_radius = imgui.slider_float("Radius (m)", self.query_radius, 0.05, 2.0)
+        if changed: self.update_neighbours()
+        if self.picks:
+            imgui.text(f"Points within radius: {self.pick_neighbours}")
+        imgui.separator()
         imgui.text("Height Distribution")
         if len(self.hist_counts) > 0:
             imgui.plot_histogram("Height", self.hist_counts, graph_size=(0, 60), scale_min=0.0)
@@ -198,15 +502,23 @@ class PointCloudViewer:
         imgui.separator()
         imgui.text("Motor Signals (PWM)")
         imgui.text_colored("Front Motors (Low Pitch)", 0.6, 0.8, 1.0)
-        imgui.plot_lines("M1", self.motor_history[0], graph_size=(0, 40), scale_min=1300, scale_max=1700)
-        imgui.plot_lines("M2", self.motor_history[1], graph_size=(0, 40), scale_min=1300, scale_max=1700)
+        imgui.plot_lines("M1", self.motor_history.values[0], values_offset=self.motor_history.head, graph_size=(0, 40), scale_min=1300, scale_max=1700)
+        imgui.plot_lines("M2", self.motor_history.values[1], values_offset=self.motor_history.head, graph_size=(0, 40), scale_min=1300, scale_max=1700)
         
         imgui.text_colored("Rear Motors (High Pitch)", 1.0, 0.6, 0.6)
-        imgui.plot_lines("M3", self.motor_history[2], graph_size=(0, 40), scale_min=1300, scale_max=1700)
-        imgui.plot_lines("M4", self.motor_history[3], graph_size=(0, 40), scale_min=1300, scale_max=1700)
+        imgui.plot_lines("M3", self.motor_history.values[2], values_offset=self.motor_history.head, graph_size=(0, 40), scale_min=1300, scale_max=1700)
+        imgui.plot_lines("M4", self.motor_history.values[3], values_offset=self.motor_history.head, graph_size=(0, 40), scale_min=1300, scale_max=1700)
+
+        imgui.separator()
+        imgui.text("Motor Window (min / mean / max)")
+        lo, mean, hi = self.motor_history.window_stats()
+        for i in range(4):
+            imgui.text(f"M{i + 1}: {lo[i]:.0f} / {mean[i]:.0f} / {hi[i]:.0f}")
         
         imgui.end()
 
+        if self.profiler.enabled: self.profiler.draw_imgui(imgui)
+
         imgui.render()
         self.impl.render(imgui.get_draw_data())
         return True
@@ -227,13 +539,19 @@ class PointCloudViewer:
         glClearColor(*self.bg_color, 1.0); glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity(); glPointSize(self.point_size)
         glTranslatef(*self.cam_pos); glRotatef(self.cam_rot[0], 1, 0, 0); glRotatef(self.cam_rot[1], 0, 1, 0)
+        self.view_matrices = (glGetFloatv(GL_MODELVIEW_MATRIX), glGetFloatv(GL_PROJECTION_MATRIX), glGetIntegerv(GL_VIEWPORT))
         if self.show_grid: self.draw_grid()
         self.draw_axes()
+        if self.site is not None: self.draw_site()
         if self.points is not None and self.visible_count > 0:
-            glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
-            glVertexPointer(3, GL_FLOAT, 0, self.points); glColorPointer(3, GL_FLOAT, 0, self.colors)
-            glDrawArrays(GL_POINTS, 0, self.visible_count)
-            glDisableClientState(GL_VERTEX_ARRAY); glDisableClientState(GL_COLOR_ARRAY)
+            self.gpu.append_points(self.points, self.visible_count)
+            self.gpu.flush_colors(self.colors)
+            heat = self.use_heatmap and self.heatmap_shader is not None
+            if heat: self.heatmap_shader.use(self.get_drone_position(), self.gpu.encoding)
+            if self.use_voxels and self.voxel_grid is not None: self.draw_voxels()
+            elif self.use_culling and self.spatial_index is not None: self.draw_culled()
+            else: self.gpu.draw(self.visible_count)
+            if heat: self.heatmap_shader.release()
         drone_pos = self.get_drone_position()
         if drone_pos[0] <= END_X:
             glPushMatrix(); glTranslatef(*drone_pos); glColor3f(1,0,0); glLineWidth(2); glBegin(GL_LINES); s=0.2
@@ -241,34 +559,92 @@ class PointCloudViewer:
             e=[(0,1),(1,2),(2,3),(3,0),(4,5),(5,6),(6,7),(7,4),(0,4),(1,5),(2,6),(3,7)]
             for ed in e: glVertex3f(*v[ed[0]]); glVertex3f(*v[ed[1]])
             glEnd(); glPopMatrix()
+        self.draw_measurements(drone_pos)
+
+    def draw_measurements(self, drone_pos):
+        """Picked points, the line between them and a line from the drone to the closest obstacle."""
+        glLineWidth(1); glBegin(GL_LINES)
+        if self.closest[0] >= 0 and self.points is not None:
+            glColor3f(1, 0.5, 0); glVertex3f(*drone_pos); glVertex3f(*self.points[self.closest[0]])
+        if len(self.picks) == 2:
+            glColor3f(1, 1, 0); glVertex3f(*self.picks[0]); glVertex3f(*self.picks[1])
+        glEnd()
+        if self.picks:
+            glPointSize(self.point_size * 4); glColor3f(1, 1, 0); glBegin(GL_POINTS)
+            for p in self.picks: glVertex3f(*p)
+            glEnd()
+
+    def draw_voxels(self):
+        grid = self.voxel_grid
+        self.voxel_gpu.append_points(grid.centers, len(grid))
+        self.voxel_gpu.flush_colors(grid.means)
+        self.voxel_gpu.draw(len(grid))
+
+    def draw_site(self):
+        modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+        self.site.update(frustum_planes(modelview, glGetFloatv(GL_PROJECTION_MATRIX)), eye_position(modelview))
+        heat = self.use_heatmap and self.heatmap_shader is not None
+        drone_pos = self.get_drone_position()
+        # every tile has its own fixed-point origin, so the heatmap is set up per tile
+        self.site.draw((lambda encoding: self.heatmap_shader.use(drone_pos, encoding)) if heat else None)
+        if heat: self.heatmap_shader.release()
+
+    def draw_culled(self):
+        """Draws only cells inside the view frustum, thinned with distance, within the point budget."""
+        index = self.spatial_index
+        if self.uploaded_index is not index:
+            self.gpu.upload_elements(index.order); self.uploaded_index = index
+        index.reveal(self.visible_count)
+        modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+        planes = frustum_planes(modelview, glGetFloatv(GL_PROJECTION_MATRIX))
+        firsts, counts = index.select(planes, eye_position(modelview), self.point_budget_k * 1000)
+        self.gpu.draw_ranges(firsts, counts)
+        # the newest chunk may not be indexed yet
+        self.gpu.draw(self.visible_count, first=index.count)
 
     def run(self):
+        self.show_first_frame()
         clock = pygame.time.Clock(); running = True
+        profiler = self.profiler
         while running:
-            for event in pygame.event.get():
-                self.impl.process_event(event)
-                if event.type == QUIT: running = False
-                elif event.type == VIDEORESIZE: self.resize_viewport(event.w, event.h)
-                if not imgui.get_io().want_capture_mouse:
-                    if event.type == MOUSEBUTTONDOWN:
-                        if event.button == 1: self.mouse_down = True; self.last_mouse_pos = event.pos
-                        elif event.button == 4: self.cam_pos[2] += 1.0
-                        elif event.button == 5: self.cam_pos[2] -= 1.0
-                    elif event.type == MOUSEBUTTONUP:
-                        if event.button == 1: self.mouse_down = False
-                    elif event.type == MOUSEMOTION and self.mouse_down:
-                        x, y = event.pos; dx, dy = x - self.last_mouse_pos[0], y - self.last_mouse_pos[1]
-                        self.cam_rot[0] += dy * 0.2; self.cam_rot[1] += dx * 0.2; self.last_mouse_pos = (x, y)
-            keys = pygame.key.get_pressed(); s = 0.1
-            if keys[K_w]: self.cam_pos[1] -= s
-            if keys[K_s]: self.cam_pos[1] += s
-            if keys[K_a]: self.cam_pos[0] += s
-            if keys[K_d]: self.cam_pos[0] -= s
-            dt = clock.tick(60) / 1000.0
-            self.update_simulation(dt); self.draw_scene(); running = self.draw_ui(); pygame.display.flip()
+            with profiler.stage("events"):
+                for event in pygame.event.get():
+                    self.impl.process_event(event)
+                    if event.type == QUIT: running = False
+                    elif event.type == VIDEORESIZE: self.resize_viewport(event.w, event.h)
+                    if not imgui.get_io().want_capture_mouse:
+                        if event.type == MOUSEBUTTONDOWN:
+                            if event.button == 1: self.mouse_down = True; self.last_mouse_pos = event.pos
+                            elif event.button == 3: self.pick(event.pos)
+                            elif event.button == 4: self.cam_pos[2] += 1.0
+                            elif event.button == 5: self.cam_pos[2] -= 1.0
+                        elif event.type == MOUSEBUTTONUP:
+                            if event.button == 1: self.mouse_down = False
+                        elif event.type == MOUSEMOTION and self.mouse_down:
+                            x, y = event.pos; dx, dy = x - self.last_mouse_pos[0], y - self.last_mouse_pos[1]
+                            self.cam_rot[0] += dy * 0.2; self.cam_rot[1] += dx * 0.2; self.last_mouse_pos = (x, y)
+                keys = pygame.key.get_pressed(); s = 0.1
+                if keys[K_w]: self.cam_pos[1] -= s
+                if keys[K_s]: self.cam_pos[1] += s
+                if keys[K_a]: self.cam_pos[0] += s
+                if keys[K_d]: self.cam_pos[0] -= s
+            with profiler.stage("idle"): dt = clock.tick(60) / 1000.0
+            with profiler.stage("update_simulation"): self.update_simulation(dt)
+            if self.use_voxels:
+                with profiler.stage("voxels"): self.update_voxels()
+            with profiler.stage("gl_submit"): self.draw_scene()
+            with profiler.stage("imgui"): running = self.draw_ui()
+            with profiler.stage("swap"): pygame.display.flip()
+            profiler.frame()
+            if not self.startup_reported: self.report_startup()
+        trace = profiler.save()
+        if trace: print(f"Chrome trace written to {trace}")
         pygame.quit()
 
 if __name__ == "__main__":
-    viewer = PointCloudViewer()
+    args = sys.argv[1:]
+    if "--trace" in args: del args[args.index("--trace"):args.index("--trace") + 2]
+    paths = [a for a in args if not a.startswith("--")]
+    viewer = PointCloudViewer(paths[0] if paths else DATA_FILE, started=_import_start)
     viewer.run()
 